@@ -0,0 +1,123 @@
+import logging
+import os
+import socket
+import struct
+import time
+
+logger = logging.getLogger(__name__)
+
+ADB_SERVER_HOST = '127.0.0.1'
+ADB_SERVER_PORT = 5037
+SYNC_DATA_MAX = 64 * 1024
+
+
+class AdbError(Exception):
+    """The adb server refused a request or the connection to it failed"""
+
+
+class AdbClient:
+    """
+    Minimal client for the adb server's smart-socket protocol.
+
+    Every request is a 4-digit hex length followed by the service name, and
+    is answered with OKAY or FAIL. Device services are reached by first
+    switching the connection to a device with host:transport:<serial>. The
+    adb server keeps the TCP connection to each TV open, so a request costs
+    one local socket instead of a new adb process.
+    """
+
+    def __init__(self, host=None, port=None, timeout=10):
+        self.host = host or ADB_SERVER_HOST
+        self.port = port or ADB_SERVER_PORT
+        self.timeout = timeout
+
+    def _connect(self, timeout=None):
+        try:
+            return socket.create_connection((self.host, self.port), timeout=timeout or self.timeout)
+        except OSError as e:
+            raise AdbError(f"Cannot reach adb server at {self.host}:{self.port}: {e}")
+
+    @staticmethod
+    def _recv_exactly(sock, size):
+        data = b''
+        while len(data) < size:
+            chunk = sock.recv(size - len(data))
+            if not chunk:
+                raise AdbError("Connection closed by adb server")
+            data += chunk
+        return data
+
+    def _read_string(self, sock):
+        length = int(self._recv_exactly(sock, 4), 16)
+        return self._recv_exactly(sock, length).decode(errors='replace')
+
+    def _request(self, sock, service):
+        payload = service.encode()
+        sock.sendall(b'%04x' % len(payload) + payload)
+        status = self._recv_exactly(sock, 4)
+        if status == b'OKAY':
+            return
+        if status == b'FAIL':
+            raise AdbError(f"{service}: {self._read_string(sock)}")
+        raise AdbError(f"{service}: unexpected reply {status!r}")
+
+    def _read_all(self, sock):
+        chunks = []
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                return b''.join(chunks)
+            chunks.append(chunk)
+
+    def host_command(self, service):
+        """Run a host:* service and return its length-prefixed reply"""
+        with self._connect() as sock:
+            self._request(sock, service)
+            return self._read_string(sock)
+
+    def connect_device(self, serial):
+        """Ask the adb server to connect to a TV over TCP (host:connect)"""
+        reply = self.host_command(f"host:connect:{serial}")
+        if 'connected to' not in reply:
+            raise AdbError(f"host:connect:{serial}: {reply}")
+        return reply
+
+    def get_state(self, serial):
+        return self.host_command(f"host-serial:{serial}:get-state")
+
+    def _transport(self, serial, timeout=None):
+        sock = self._connect(timeout)
+        try:
+            self._request(sock, f"host:transport:{serial}")
+        except Exception:
+            sock.close()
+            raise
+        return sock
+
+    def shell(self, serial, command, timeout=None):
+        """Run a command with the shell: service and return its output"""
+        with self._transport(serial, timeout) as sock:
+            self._request(sock, f"shell:{command}")
+            return self._read_all(sock).decode(errors='replace')
+
+    def push(self, serial, local_path, remote_path, mode=0o644, timeout=None):
+        """Copy a local file to the TV with the sync: service"""
+        with self._transport(serial, timeout) as sock, open(local_path, 'rb') as f:
+            self._request(sock, 'sync:')
+            target = f"{remote_path},{0o100000 | mode}".encode()
+            sock.sendall(b'SEND' + struct.pack('<I', len(target)) + target)
+            while True:
+                chunk = f.read(SYNC_DATA_MAX)
+                if not chunk:
+                    break
+                sock.sendall(b'DATA' + struct.pack('<I', len(chunk)) + chunk)
+            mtime = int(os.path.getmtime(local_path) or time.time())
+            sock.sendall(b'DONE' + struct.pack('<I', mtime))
+
+            status = self._recv_exactly(sock, 4)
+            length = struct.unpack('<I', self._recv_exactly(sock, 4))[0]
+            if status != b'OKAY':
+                message = self._recv_exactly(sock, length).decode(errors='replace')
+                raise AdbError(f"push {local_path} -> {remote_path} failed: {message}")
+            sock.sendall(b'QUIT' + struct.pack('<I', 0))
+        logger.debug(f"Pushed {local_path} to {serial}:{remote_path}")
@@ -0,0 +1,317 @@
+import itertools
+import logging
+import queue
+import subprocess
+import threading
+import time
+from adb_client import AdbClient, AdbError
+
+logger = logging.getLogger(__name__)
+
+ADB_PATH = 'adb'
+ADB_PORT = 5555
+CONNECT_TIMEOUT = 10
+
+_marker_ids = itertools.count(1)
+
+
+class AdbSessionError(Exception):
+    """The shell session to a TV is broken and has to be reopened"""
+
+    def __init__(self, message, retryable=False):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class AdbCommandError(Exception):
+    """The command ran on the TV but exited with a non-zero status"""
+
+    def __init__(self, message, returncode, output):
+        super().__init__(message)
+        self.returncode = returncode
+        self.output = output
+
+
+def adb_serial(ip):
+    """Return the adb serial (ip:port) for a TV address"""
+    return ip if ':' in ip else f"{ip}:{ADB_PORT}"
+
+
+class AdbShellSession:
+    """
+    One long-lived `adb shell` process for a single TV.
+
+    Commands are written to the shell's stdin followed by an echo of a unique
+    marker and the exit status, so the output of each command can be read
+    back without starting a new process.
+    """
+
+    def __init__(self, serial, adb_path=None):
+        self.serial = serial
+        self.adb_path = adb_path or ADB_PATH
+        self.proc = None
+        self.lines = queue.Queue()
+        self.last_used = 0.0
+
+    def open(self):
+        connect = subprocess.run([self.adb_path, 'connect', self.serial],
+                                 capture_output=True, text=True, timeout=CONNECT_TIMEOUT)
+        output = (connect.stdout + connect.stderr).strip()
+        if connect.returncode != 0 or 'unable' in output or 'failed' in output:
+            raise AdbSessionError(f"adb connect {self.serial} failed: {output}")
+
+        self.proc = subprocess.Popen([self.adb_path, '-s', self.serial, 'shell'],
+                                     stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                     stderr=subprocess.STDOUT, text=True, bufsize=1)
+        threading.Thread(target=self._read_output, daemon=True).start()
+        self.last_used = time.time()
+        logger.debug(f"Opened ADB shell session to {self.serial}")
+
+    def _read_output(self):
+        proc = self.proc
+        for line in proc.stdout:
+            self.lines.put(line)
+        self.lines.put(None)
+
+    def alive(self):
+        return self.proc is not None and self.proc.poll() is None
+
+    def run(self, command, timeout=30):
+        """Run a command in the shell and return its output"""
+        if not self.alive():
+            raise AdbSessionError(f"Shell session to {self.serial} is closed", retryable=True)
+
+        marker = f"__MOSYS_EOC_{next(_marker_ids)}__"
+        try:
+            self.proc.stdin.write(f"{command}; echo {marker}$?\n")
+            self.proc.stdin.flush()
+        except (BrokenPipeError, OSError) as e:
+            raise AdbSessionError(f"Lost shell session to {self.serial}: {e}", retryable=True)
+
+        output = []
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.close()
+                raise AdbSessionError(f"Command timed out on {self.serial}")
+            try:
+                line = self.lines.get(timeout=remaining)
+            except queue.Empty:
+                continue
+            if line is None:
+                raise AdbSessionError(f"Shell session to {self.serial} ended: {''.join(output).strip()}")
+            if marker in line:
+                head, _, status = line.partition(marker)
+                if head:
+                    output.append(head)
+                break
+            output.append(line)
+
+        self.last_used = time.time()
+        output = ''.join(output)
+        returncode = int(status.strip() or 0)
+        if returncode != 0:
+            raise AdbCommandError(f"Command exited with status {returncode}", returncode, output)
+        return output
+
+    def push(self, local_path, remote_path, timeout=300):
+        result = subprocess.run([self.adb_path, '-s', self.serial, 'push', local_path, remote_path],
+                                capture_output=True, text=True, timeout=timeout)
+        if result.returncode != 0:
+            raise AdbError(f"push {local_path} -> {remote_path} failed: {result.stderr.strip()}")
+
+    def close(self):
+        if self.proc is None:
+            return
+        try:
+            self.proc.stdin.close()
+        except OSError:
+            pass
+        if self.proc.poll() is None:
+            self.proc.kill()
+        self.proc = None
+        logger.debug(f"Closed ADB shell session to {self.serial}")
+
+
+class AdbServerSession:
+    """
+    Session that talks to the local adb server over its socket protocol.
+
+    The adb server holds the TCP connection to the TV, so each command is a
+    shell: stream on that connection and no adb process is started.
+    """
+
+    client = AdbClient()
+    server_started = False
+
+    def __init__(self, serial, client=None):
+        self.serial = serial
+        if client is not None:
+            self.client = client
+        self.connected = False
+        self.last_used = 0.0
+
+    def _start_server(self):
+        cls = type(self)
+        if cls.server_started:
+            return
+        cls.server_started = True
+        logger.info("Starting adb server")
+        subprocess.run([ADB_PATH, 'start-server'], capture_output=True, timeout=CONNECT_TIMEOUT)
+
+    def open(self):
+        try:
+            try:
+                self.client.connect_device(self.serial)
+            except AdbError as e:
+                if 'Cannot reach adb server' not in str(e):
+                    raise
+                self._start_server()
+                self.client.connect_device(self.serial)
+            state = self.client.get_state(self.serial)
+        except (AdbError, OSError, subprocess.SubprocessError) as e:
+            raise AdbSessionError(str(e))
+        if state != 'device':
+            raise AdbSessionError(f"{self.serial} is {state}")
+        self.connected = True
+        self.last_used = time.time()
+        logger.debug(f"Connected to {self.serial} through adb server")
+
+    def alive(self):
+        return self.connected
+
+    def run(self, command, timeout=30):
+        marker = f"__MOSYS_EOC_{next(_marker_ids)}__"
+        try:
+            output = self.client.shell(self.serial, f"{command}; echo {marker}$?", timeout=timeout)
+        except (AdbError, OSError) as e:
+            self.connected = False
+            # An AdbError means the request was refused before the command ran
+            raise AdbSessionError(f"Shell on {self.serial} failed: {e}", retryable=isinstance(e, AdbError))
+
+        head, found, status = output.rpartition(marker)
+        if not found:
+            self.connected = False
+            raise AdbSessionError(f"Shell on {self.serial} ended early: {output.strip()}")
+        self.last_used = time.time()
+        returncode = int(status.strip() or 0)
+        if returncode != 0:
+            raise AdbCommandError(f"Command exited with status {returncode}", returncode, head)
+        return head
+
+    def push(self, local_path, remote_path, timeout=300):
+        try:
+            self.client.push(self.serial, local_path, remote_path, timeout=timeout)
+        except OSError as e:
+            self.connected = False
+            raise AdbSessionError(f"Push to {self.serial} failed: {e}")
+
+    def close(self):
+        self.connected = False
+
+
+class AdbConnectionPool:
+    """
+    Keeps one shell session per TV and reuses it for every command.
+
+    Commands to the same TV are serialized on that TV's session, commands to
+    different TVs run in parallel. A session is only reopened after it fails.
+    """
+
+    def __init__(self, session_factory=AdbServerSession):
+        self.session_factory = session_factory
+        self.sessions = {}
+        self.locks = {}
+        self.broken = set()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.reconnects = 0
+        self.failures = 0
+
+    def _device_lock(self, serial):
+        with self.lock:
+            if serial not in self.locks:
+                self.locks[serial] = threading.Lock()
+            return self.locks[serial]
+
+    def _session(self, serial):
+        session = self.sessions.get(serial)
+        if session is not None and session.alive():
+            with self.lock:
+                self.hits += 1
+            return session
+
+        with self.lock:
+            self.misses += 1
+            if session is not None or serial in self.broken:
+                self.reconnects += 1
+            self.broken.discard(serial)
+        if session is not None:
+            session.close()
+        session = self.session_factory(serial)
+        try:
+            session.open()
+        except Exception:
+            self.sessions.pop(serial, None)
+            raise
+        self.sessions[serial] = session
+        return session
+
+    def run(self, serial, command, timeout=30):
+        """Run a shell command on a TV, reusing its pooled session"""
+        with self._device_lock(serial):
+            for attempt in range(2):
+                try:
+                    return self._session(serial).run(command, timeout=timeout)
+                except AdbSessionError as e:
+                    with self.lock:
+                        self.failures += 1
+                        self.broken.add(serial)
+                    session = self.sessions.pop(serial, None)
+                    if session is not None:
+                        session.close()
+                    if not e.retryable or attempt:
+                        raise
+                    logger.warning(f"Reconnecting ADB session to {serial}: {e}")
+
+    def push(self, serial, local_path, remote_path, timeout=300):
+        """Copy a file to a TV over its pooled session"""
+        with self._device_lock(serial):
+            session = self._session(serial)
+            try:
+                session.push(local_path, remote_path, timeout=timeout)
+            except AdbSessionError:
+                with self.lock:
+                    self.failures += 1
+                    self.broken.add(serial)
+                self.sessions.pop(serial, None)
+                raise
+
+    def discard(self, serial):
+        """Close the session of a TV that was removed or changed its IP"""
+        with self._device_lock(serial):
+            session = self.sessions.pop(serial, None)
+            if session is not None:
+                session.close()
+        with self.lock:
+            self.broken.discard(serial)
+            self.locks.pop(serial, None)
+
+    def close_all(self):
+        for serial in list(self.sessions):
+            self.discard(serial)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'sessions': sum(1 for s in self.sessions.values() if s.alive()),
+                'hits': self.hits,
+                'misses': self.misses,
+                'reconnects': self.reconnects,
+                'failures': self.failures,
+            }
+
+
+pool = AdbConnectionPool()
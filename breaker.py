@@ -0,0 +1,107 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitBreakers:
+    """
+    One circuit breaker per device, fed by poller results and command outcomes.
+
+    After `failure_threshold` consecutive failures a device's breaker opens
+    and commands to it are rejected at once instead of waiting for a
+    transport timeout. The poller keeps probing an open device in the
+    background and closes the breaker as soon as the device answers. Once
+    `reset_timeout` seconds have passed, a single trial command is let
+    through (half open); its outcome closes or reopens the breaker.
+    `on_change(key)` is called whenever a breaker changes state.
+    """
+
+    def __init__(self, failure_threshold=2, reset_timeout=30, on_change=None, name='breakers'):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.on_change = on_change
+        self.name = name
+        self.states = {}
+        self.lock = threading.Lock()
+        self.rejected = 0
+        self.trips = 0
+
+    def _state(self, key):
+        return self.states.setdefault(key, {'state': CLOSED, 'failures': 0, 'opened_at': None, 'retry_at': None})
+
+    def _open(self, breaker, state):
+        breaker.update(state=state, opened_at=time.monotonic(), retry_at=time.time() + self.reset_timeout)
+
+    def _changed(self, key):
+        if self.on_change is not None:
+            self.on_change(key)
+
+    def allow(self, key):
+        """Whether a command may be sent to the device now"""
+        with self.lock:
+            breaker = self._state(key)
+            if breaker['state'] == CLOSED:
+                return True
+            # A trial that never reported back does not keep the breaker half open
+            if time.monotonic() - breaker['opened_at'] < self.reset_timeout:
+                self.rejected += 1
+                return False
+            self._open(breaker, HALF_OPEN)
+        logger.info(f"{self.name}: {key} half open, letting a trial command through")
+        self._changed(key)
+        return True
+
+    def record_success(self, key):
+        with self.lock:
+            breaker = self._state(key)
+            changed = breaker['state'] != CLOSED
+            breaker.update(state=CLOSED, failures=0, opened_at=None, retry_at=None)
+        if changed:
+            logger.info(f"{self.name}: {key} closed")
+            self._changed(key)
+
+    def record_failure(self, key):
+        with self.lock:
+            breaker = self._state(key)
+            breaker['failures'] += 1
+            changed = breaker['state'] == HALF_OPEN or (breaker['state'] == CLOSED and
+                                                        breaker['failures'] >= self.failure_threshold)
+            if changed:
+                self._open(breaker, OPEN)
+                self.trips += 1
+        if changed:
+            logger.warning(f"{self.name}: {key} open after {breaker['failures']} failures")
+            self._changed(key)
+
+    def remove(self, key):
+        with self.lock:
+            self.states.pop(key, None)
+
+    def state(self, key):
+        with self.lock:
+            breaker = self.states.get(key)
+            return breaker['state'] if breaker else CLOSED
+
+    def describe(self, key):
+        """Breaker state of a device for status responses; only changes with the state"""
+        with self.lock:
+            breaker = self.states.get(key)
+            if breaker is None or breaker['state'] == CLOSED:
+                return {'state': CLOSED}
+            return {'state': breaker['state'], 'retry_at': round(breaker['retry_at'], 1)}
+
+    def stats(self):
+        with self.lock:
+            states = [breaker['state'] for breaker in self.states.values()]
+            return {
+                'open': states.count(OPEN),
+                'half_open': states.count(HALF_OPEN),
+                'trips': self.trips,
+                'rejected': self.rejected,
+            }
@@ -0,0 +1,271 @@
+import atexit
+import collections
+import logging
+import os
+import queue
+import shutil
+import subprocess
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Path of the cec-client binary; MOSYS_CEC_CLIENT can point at a fake script for testing
+CEC_CLIENT_PATH = os.environ.get('MOSYS_CEC_CLIENT', 'cec-client')
+CEC_CLIENT_ARGS = ('-d', '8')
+ACK_TIMEOUT = 5
+# How long a command whose sender timed out may still wait for its echo before it is dropped
+ABANDON_GRACE = 30
+
+
+def frame_key(frame):
+    """'10:04' and ' 10:04 ' (as echoed) compare equal"""
+    return frame.strip().lower().replace(' ', '')
+
+
+class PendingCommand:
+    """A frame waiting for cec-client to report it on the bus"""
+
+    def __init__(self, frame):
+        self.frame = frame
+        self.key = frame_key(frame)
+        self.done = threading.Event()
+        self.ok = False
+        # Set when the sender stopped waiting; the command stays pending so its late echo is not misattributed
+        self.abandoned = False
+        self.abandoned_at = None
+        self.queued_at = time.monotonic()
+
+    def complete(self, ok):
+        self.ok = ok
+        self.done.set()
+
+    def wait(self, timeout):
+        return self.done.wait(timeout) and self.ok
+
+
+class CecClient:
+    """
+    One long-lived cec-client process fed through stdin from a queue.
+
+    Starting cec-client opens the CEC adapter, which takes seconds, so the
+    process is kept running and every command is written to it as a
+    'tx <frame>' line. With traffic logging (-d 8) cec-client echoes each
+    transmitted frame as '<< frame' and each received one as '>> frame'; a
+    reader thread matches each echo to the oldest pending command with that
+    frame. cec-client transmits in order, so commands sent before the
+    matched one were not transmitted and fail. A command whose sender timed
+    out stays pending until its own echo arrives, so a late echo never
+    acknowledges a later command, but only for `abandon_grace` seconds:
+    a frame cec-client never echoes would otherwise stay pending forever.
+    Timed-out commands not yet written are dropped unsent. The process is
+    restarted on the next command if it exits.
+    """
+
+    def __init__(self, path=None, args=CEC_CLIENT_ARGS, abandon_grace=ABANDON_GRACE):
+        self.path = path or CEC_CLIENT_PATH
+        self.args = tuple(args)
+        self.abandon_grace = abandon_grace
+        self.proc = None
+        self.commands = queue.Queue()
+        self.pending = collections.deque()
+        self.lock = threading.Lock()
+        self.listeners = []
+        self.writer = None
+        self.sent = 0
+        self.acked = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.late = 0
+        self.unmatched = 0
+        self.expired = 0
+        self.restarts = 0
+        self.received = 0
+        atexit.register(self.stop)
+
+    def available(self):
+        return shutil.which(self.path) is not None
+
+    def alive(self):
+        return self.proc is not None and self.proc.poll() is None
+
+    def start(self):
+        stale = []
+        with self.lock:
+            if self.alive():
+                return
+            if self.proc is not None:
+                self.restarts += 1
+                stale, self.pending = list(self.pending), collections.deque()
+                self.failed += len(stale)
+            self.proc = subprocess.Popen([self.path, *self.args], stdin=subprocess.PIPE,
+                                         stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                         text=True, bufsize=1)
+            threading.Thread(target=self._read_output, args=(self.proc,), name='cec-reader', daemon=True).start()
+            if self.writer is None:
+                self.writer = threading.Thread(target=self._write_commands, name='cec-writer', daemon=True)
+                self.writer.start()
+        for command in stale:
+            command.complete(False)
+        logger.info(f"Started {self.path}")
+
+    def stop(self):
+        with self.lock:
+            proc, self.proc = self.proc, None
+        if proc is None or proc.poll() is not None:
+            return
+        try:
+            proc.stdin.write('q\n')
+            proc.stdin.flush()
+            proc.wait(timeout=2)
+        except (OSError, subprocess.TimeoutExpired):
+            proc.kill()
+
+    def add_listener(self, callback):
+        """Call `callback(frame)` for every frame received from the bus"""
+        self.listeners.append(callback)
+
+    def submit(self, frame):
+        """Queue a frame for transmission and return its PendingCommand"""
+        if not self.alive():
+            self.start()
+        command = PendingCommand(frame)
+        self.commands.put(command)
+        return command
+
+    def send(self, frame, timeout=ACK_TIMEOUT, repeat=1):
+        """Transmit a frame `repeat` times and wait until cec-client reports them sent"""
+        return self.send_frames([frame] * repeat, timeout)
+
+    def send_frames(self, frames, timeout=ACK_TIMEOUT):
+        """Transmit frames in order and wait until cec-client reports them all sent"""
+        commands = [self.submit(frame) for frame in frames]
+        deadline = time.monotonic() + timeout
+        ok = True
+        for command in commands:
+            if command.wait(max(0.0, deadline - time.monotonic())):
+                continue
+            ok = False
+            with self.lock:
+                if not command.done.is_set():
+                    self.timeouts += 1
+                    command.abandoned = True
+                    command.abandoned_at = time.monotonic()
+            if command.abandoned:
+                logger.error(f"No acknowledgement from cec-client for 'tx {command.frame}'")
+        return ok
+
+    def _expire(self):
+        """Drop abandoned commands whose echo is overdue; call with the lock held"""
+        cutoff = time.monotonic() - self.abandon_grace
+        if not any(command.abandoned and command.abandoned_at <= cutoff for command in self.pending):
+            return
+        kept = collections.deque()
+        for command in self.pending:
+            if command.abandoned and command.abandoned_at <= cutoff:
+                self.expired += 1
+                command.complete(False)
+            else:
+                kept.append(command)
+        self.pending = kept
+
+    def _write_commands(self):
+        while True:
+            command = self.commands.get()
+            with self.lock:
+                self._expire()
+                if command.abandoned:
+                    # The sender gave up while this waited in the queue; sending it now helps nobody
+                    command.complete(False)
+                    continue
+                proc = self.proc
+                if proc is None or proc.poll() is not None:
+                    self.failed += 1
+                    command.complete(False)
+                    continue
+                self.pending.append(command)
+            try:
+                proc.stdin.write(f"tx {command.frame}\n")
+                proc.stdin.flush()
+                self.sent += 1
+            except OSError as e:
+                logger.error(f"Error writing to cec-client: {str(e)}")
+                self._complete_oldest(False)
+
+    def _complete_oldest(self, ok):
+        with self.lock:
+            command = self.pending.popleft() if self.pending else None
+            if command is not None:
+                if ok:
+                    self.acked += 1
+                else:
+                    self.failed += 1
+                # Under the lock, so send() never marks a completed command abandoned
+                command.complete(ok)
+
+    def _acknowledge(self, frame):
+        """Complete the pending command cec-client reports as transmitted"""
+        key = frame_key(frame)
+        with self.lock:
+            self._expire()
+            index = next((i for i, command in enumerate(self.pending) if command.key == key), None)
+            if index is None:
+                # A frame cec-client sent on its own, or the echo of a command already failed
+                self.unmatched += 1
+                return
+            skipped = [self.pending.popleft() for _ in range(index)]
+            command = self.pending.popleft()
+            self.failed += sum(not earlier.abandoned for earlier in skipped)
+            if command.abandoned:
+                self.late += 1
+            else:
+                self.acked += 1
+            for earlier in skipped:
+                earlier.complete(False)
+            command.complete(True)
+
+    def _read_output(self, proc):
+        for line in proc.stdout:
+            line = line.strip()
+            if '<<' in line:
+                self._acknowledge(line.split('<<', 1)[1])
+            elif '>>' in line:
+                self.received += 1
+                frame = line.split('>>', 1)[1].strip()
+                for callback in self.listeners:
+                    try:
+                        callback(frame)
+                    except Exception as e:
+                        logger.error(f"Error in CEC listener: {str(e)}")
+            elif line.startswith('ERROR') and self.pending:
+                logger.error(f"cec-client: {line}")
+                self._complete_oldest(False)
+        logger.warning(f"cec-client exited with code {proc.wait()}")
+        stale = []
+        with self.lock:
+            if self.proc is proc or self.proc is None:
+                stale, self.pending = list(self.pending), collections.deque()
+                self.failed += len(stale)
+        for command in stale:
+            command.complete(False)
+
+    def stats(self):
+        with self.lock:
+            self._expire()
+            return {
+                'running': self.alive(),
+                'queued': self.commands.qsize(),
+                'pending': len(self.pending),
+                'sent': self.sent,
+                'acked': self.acked,
+                'failed': self.failed,
+                'timeouts': self.timeouts,
+                'late': self.late,
+                'unmatched': self.unmatched,
+                'expired': self.expired,
+                'restarts': self.restarts,
+                'received': self.received,
+            }
+
+
+client = CecClient()
@@ -0,0 +1,158 @@
+import collections
+import json
+import threading
+import time
+
+from snapshot import Snapshot
+
+MAX_WAIT = 30
+KEEPALIVE = 15
+# Tombstones of removed devices are kept this long (seconds); older cursors get a reset
+TOMBSTONE_RETENTION = 3600
+
+
+class ChangeFeed:
+    """
+    Versioned feed of per-device state for incremental clients.
+
+    Every published change gets the next version number and only the latest
+    state of each device is kept; a removed device keeps a tombstone (None)
+    so clients learn about the removal. A client passes the version it has
+    seen and gets the devices that changed since. Versions start at the
+    current time in milliseconds, so a cursor from before a restart is
+    recognised and answered with a full reset instead of a partial delta.
+    The full state is also available as a pre-encoded Snapshot, rebuilt
+    only when the devices in it changed. Readers may pass `match`, a dict of field
+    values, to see only the devices whose state has those fields;
+    tombstones always pass, since a filtered client cannot tell which
+    removed device was one of its own.
+
+    Fields listed in `unversioned` (such as a probe's round-trip time) do
+    not count as a change on their own: an update to them alone is stored
+    under the device's current version, so it shows in snapshots and in
+    the device's next delta but wakes no waiting client and keeps the
+    snapshot's ETag. Tombstones are dropped after `retention` seconds; `base`, the oldest version a cursor can resume
+    from, then moves past them, so older cursors get a reset.
+    """
+
+    def __init__(self, unversioned=(), retention=TOMBSTONE_RETENTION):
+        self.base = self.version = int(time.time() * 1000)
+        self.unversioned = frozenset(unversioned)
+        self.retention = retention
+        self.entries = {}
+        # (removed at, key, version) of each tombstone, oldest first
+        self.tombstones = collections.deque()
+        self.cond = threading.Condition()
+        self.current = {}
+        # Bumped on every stored update, including unversioned ones
+        self.updates = 0
+        # Update count each cached snapshot was last checked against
+        self.checked = {}
+        self.snapshots = 0
+
+    def _versioned(self, value):
+        if value is None or not self.unversioned:
+            return value
+        return {field: item for field, item in value.items() if field not in self.unversioned}
+
+    def publish(self, key, value):
+        """Record the state of a device, or its removal when value is None"""
+        with self.cond:
+            self._compact()
+            old = self.entries.get(key)
+            if self._versioned(old[1] if old else None) == self._versioned(value):
+                if old is not None and old[1] != value:
+                    self.entries[key] = (old[0], dict(value))
+                    self.updates += 1
+                return False
+            self.version += 1
+            self.updates += 1
+            self.entries[key] = (self.version, dict(value) if value is not None else None)
+            if value is None:
+                self.tombstones.append((time.time(), key, self.version))
+            self.cond.notify_all()
+            return True
+
+    def _compact(self):
+        """Drop tombstones older than the retention horizon"""
+        cutoff = time.time() - self.retention
+        while self.tombstones and self.tombstones[0][0] < cutoff:
+            _, key, version = self.tombstones.popleft()
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] == version:
+                del self.entries[key]
+            # A cursor from before this removal can no longer learn about it
+            self.base = max(self.base, version)
+
+    def remove(self, key):
+        return self.publish(key, None)
+
+    @staticmethod
+    def _matches(value, match):
+        return not match or all(value.get(field) == wanted for field, wanted in match.items())
+
+    def _live(self, match):
+        return {key: value for key, (_, value) in self.entries.items()
+                if value is not None and self._matches(value, match)}
+
+    def _changes(self, since, match=None):
+        if since is None or since < self.base or since > self.version:
+            return self.version, self._live(match), True
+        changes = {key: value for key, (version, value) in self.entries.items()
+                   if version > since and (value is None or self._matches(value, match))}
+        return self.version, changes, False
+
+    def snapshot(self, match=None):
+        """
+        The Snapshot of all live (matching) devices. Its version is that of
+        the newest matching device, so changes to devices outside `match`
+        neither rebuild it nor change its ETag.
+        """
+        cache_key = tuple(sorted((match or {}).items()))
+        with self.cond:
+            if self.checked.get(cache_key) != self.updates:
+                self.checked[cache_key] = self.updates
+                live = {key: entry for key, entry in self.entries.items()
+                        if entry[1] is not None and self._matches(entry[1], match)}
+                latest = max((version for version, _ in live.values()), default=self.base)
+                devices = {key: value for key, (_, value) in live.items()}
+                current = self.current.get(cache_key)
+                # Unversioned updates change the devices but not the version
+                if current is None or current.version != latest or current.devices != devices:
+                    self.current[cache_key] = Snapshot(latest, devices)
+                    self.snapshots += 1
+            return self.current[cache_key]
+
+    def changes(self, since=None, timeout=0, match=None):
+        """
+        Return (version, changes, reset), waiting up to `timeout` seconds
+        for something newer than `since`. With reset set, `changes` is the
+        full state and replaces whatever the client had.
+        """
+        with self.cond:
+            if since is not None and self.base <= since <= self.version and timeout > 0:
+                self.cond.wait_for(lambda: self.version > since, min(timeout, MAX_WAIT))
+            return self._changes(since, match)
+
+    def stream(self, since=None, keepalive=KEEPALIVE, match=None):
+        """Server-Sent Events: one 'changes' event per batch of changes"""
+        cursor = since
+        while True:
+            version, changes, reset = self.changes(cursor, keepalive, match)
+            if changes or reset:
+                data = json.dumps({'version': version, 'reset': reset, 'changes': changes})
+                yield f"id: {version}\nevent: changes\ndata: {data}\n\n"
+            else:
+                yield ": keepalive\n\n"
+            cursor = version
+
+    def stats(self):
+        with self.cond:
+            self._compact()
+            return {
+                'version': self.version,
+                'devices': sum(1 for _, value in self.entries.values() if value is not None),
+                'tombstones': sum(1 for _, value in self.entries.values() if value is None),
+                'snapshots': self.snapshots,
+                'base': self.base,
+            }
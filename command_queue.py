@@ -0,0 +1,162 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Lower runs first; power and timer actions jump ahead of key presses
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+MAX_COALESCE = 10
+
+
+class QueuedCommand:
+    """An action waiting in a device queue, and later its result"""
+
+    def __init__(self, action, priority):
+        self.action = action
+        self.priority = priority
+        self.queued_at = time.monotonic()
+        self.done = threading.Event()
+        self.cancelled = False
+        self.result = None
+
+    def complete(self, result):
+        self.result = result
+        self.done.set()
+
+    def wait(self, timeout=None):
+        """Return the result, or None if it did not run within `timeout`"""
+        if not self.done.wait(timeout):
+            # Still queued: drop it rather than run it after the caller gave up
+            self.cancelled = True
+            return None
+        return self.result
+
+
+class CommandQueue:
+    """
+    Serializes the commands of each device through its own priority queue.
+
+    `execute(key, action, count)` sends `action` to a device `count` times in
+    one go. Queued runs of the same coalescable action (volume and navigation
+    keys) are merged into a single call, so ten quick VOL+ clicks cost one
+    adb or CEC invocation. High priority commands are taken before anything
+    queued at normal priority. Devices are drained on a shared worker pool,
+    one batch at a time, so a busy device does not starve the others.
+    `on_change(key)` is called whenever the depth of a device queue changes.
+    """
+
+    def __init__(self, execute, coalesce=(), max_workers=16, on_change=None, name='commands'):
+        self.execute = execute
+        self.coalesce = set(coalesce)
+        self.on_change = on_change
+        self.max_workers = max_workers
+        self.name = name
+        self.queues = {}
+        self.active = set()
+        self.seq = itertools.count()
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self.submitted = 0
+        self.executed = 0
+        self.coalesced = 0
+        self.dropped = 0
+
+    def submit(self, key, action, priority=PRIORITY_NORMAL):
+        """Queue `action` for a device and return its QueuedCommand"""
+        command = QueuedCommand(action, priority)
+        with self.lock:
+            heapq.heappush(self.queues.setdefault(key, []), (priority, next(self.seq), command))
+            self.submitted += 1
+            if key not in self.active:
+                self.active.add(key)
+                self.executor.submit(self._drain, key)
+        self._changed(key)
+        return command
+
+    def _changed(self, key):
+        if self.on_change is not None:
+            self.on_change(key)
+
+    def run(self, key, action, priority=PRIORITY_NORMAL, timeout=None):
+        """Queue `action` and wait for its result"""
+        return self.submit(key, action, priority).wait(timeout)
+
+    def remove(self, key):
+        """Drop the queued commands of a device that was removed"""
+        with self.lock:
+            queue = self.queues.pop(key, [])
+            self.dropped += len(queue)
+        for _, _, command in queue:
+            command.complete(None)
+        if queue:
+            self._changed(key)
+
+    def depth(self, key):
+        """Commands queued for a device, including the batch being sent"""
+        with self.lock:
+            return len(self.queues.get(key, ())) + (1 if key in self.active else 0)
+
+    def _take_batch(self, key):
+        queue = self.queues.get(key)
+        while queue and queue[0][2].cancelled:
+            heapq.heappop(queue)
+            self.dropped += 1
+        if not queue:
+            self.queues.pop(key, None)
+            return []
+        priority, _, first = heapq.heappop(queue)
+        batch = [first]
+        if first.action in self.coalesce:
+            # The heap head is the next command in submission order at this priority
+            while (queue and len(batch) < MAX_COALESCE and queue[0][0] == priority
+                   and queue[0][2].action == first.action):
+                command = heapq.heappop(queue)[2]
+                if command.cancelled:
+                    self.dropped += 1
+                else:
+                    batch.append(command)
+        if not queue:
+            self.queues.pop(key, None)
+        return batch
+
+    def _drain(self, key):
+        with self.lock:
+            batch = self._take_batch(key)
+            if not batch:
+                self.active.discard(key)
+        if not batch:
+            self._changed(key)
+            return
+        action = batch[0].action
+        try:
+            result = self.execute(key, action, len(batch))
+        except Exception as e:
+            logger.error(f"{self.name}: error sending {action} to {key}: {str(e)}")
+            result = None
+        for command in batch:
+            command.complete(result)
+        with self.lock:
+            self.executed += 1
+            self.coalesced += len(batch) - 1
+            # Go to the back of the pool queue so other devices get a turn
+            if self.queues.get(key):
+                self.executor.submit(self._drain, key)
+            else:
+                self.active.discard(key)
+        self._changed(key)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'submitted': self.submitted,
+                'executed': self.executed,
+                'coalesced': self.coalesced,
+                'dropped': self.dropped,
+                'depths': {key: len(self.queues.get(key, ())) + (1 if key in self.active else 0)
+                           for key in set(self.queues) | self.active},
+            }
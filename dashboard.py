@@ -0,0 +1,133 @@
+import time
+
+from PyQt5.QtCore import QRectF, Qt
+from PyQt5.QtGui import QColor, QFont, QPainter, QPen
+from PyQt5.QtWidgets import QSizePolicy, QWidget
+
+from device_model import format_remaining
+
+TILE_WIDTH = 180
+TILE_HEIGHT = 96
+TILE_GAP = 8
+# Less than this much rental time left is shown in orange
+WARNING_SECONDS = 300
+
+STATUS_COLORS = {'Online': QColor('#2e7d32'), 'Offline': QColor('#c62828')}
+UNKNOWN_COLOR = QColor('#757575')
+WARNING_COLOR = QColor('#ef6c00')
+TILE_BACKGROUND = QColor('#fafafa')
+TEXT_COLOR = QColor('#212121')
+IDLE_COLOR = QColor('#9e9e9e')
+
+
+class Dashboard(QWidget):
+    """
+    One painted tile per TV with its remaining rental time, status and RTT.
+
+    Tiles are drawn in a single paintEvent instead of one widget each, and
+    only the tiles inside the exposed rectangle are drawn. The widget has no
+    timers of its own: it repaints when the device model changes, which the
+    change feed and the GUI's 1 Hz tick both go through.
+    """
+
+    def __init__(self, model, parent=None):
+        super().__init__(parent)
+        self.model = model
+        self.order = []
+        self.names = {}
+        self.columns = 1
+        self.name_font = QFont()
+        self.name_font.setBold(True)
+        self.time_font = QFont()
+        self.time_font.setPointSize(self.time_font.pointSize() + 8)
+        self.time_font.setBold(True)
+        self.detail_font = QFont()
+        self.detail_font.setPointSize(max(self.detail_font.pointSize() - 1, 7))
+        self.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Fixed)
+        self.setAttribute(Qt.WA_OpaquePaintEvent)
+
+        model.modelReset.connect(self.reorder)
+        model.rowsInserted.connect(self.reorder)
+        model.rowsRemoved.connect(self.reorder)
+        model.dataChanged.connect(self.changed)
+        self.reorder()
+
+    def reorder(self, *args):
+        """Tiles sorted by TV name; only recomputed when rows come, go or are renamed"""
+        devices = self.model.devices
+        self.names = {ip: device.get('name', '') for ip, device in devices.items()}
+        self.order = sorted(devices, key=lambda ip: (str(self.names[ip]).lower(), ip))
+        self.relayout()
+
+    def changed(self, top_left, bottom_right, roles=()):
+        ips = self.model.ips[top_left.row():bottom_right.row() + 1]
+        if top_left.column() == 0 and any(self.model.devices[ip].get('name', '') != self.names.get(ip)
+                                          for ip in ips):
+            self.reorder()
+        elif self.isVisible():
+            self.update()
+
+    def relayout(self):
+        self.columns = max(1, (self.width() - TILE_GAP) // (TILE_WIDTH + TILE_GAP))
+        rows = -(-len(self.order) // self.columns)
+        self.setMinimumHeight(TILE_GAP + rows * (TILE_HEIGHT + TILE_GAP))
+        self.update()
+
+    def resizeEvent(self, event):
+        if max(1, (event.size().width() - TILE_GAP) // (TILE_WIDTH + TILE_GAP)) != self.columns:
+            self.relayout()
+        super().resizeEvent(event)
+
+    def tile_rect(self, index):
+        row, column = divmod(index, self.columns)
+        return QRectF(TILE_GAP + column * (TILE_WIDTH + TILE_GAP), TILE_GAP + row * (TILE_HEIGHT + TILE_GAP),
+                      TILE_WIDTH, TILE_HEIGHT)
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(event.rect(), self.palette().window())
+        painter.setRenderHint(QPainter.Antialiasing)
+
+        # Only the tile rows that intersect the exposed area
+        exposed = event.rect()
+        first_row = max(0, (exposed.top() - TILE_GAP) // (TILE_HEIGHT + TILE_GAP))
+        last_row = (exposed.bottom() - TILE_GAP) // (TILE_HEIGHT + TILE_GAP)
+        start = first_row * self.columns
+        end = min(len(self.order), (last_row + 1) * self.columns)
+        now = time.time()
+        for index in range(start, end):
+            ip = self.order[index]
+            device = self.model.devices.get(ip)
+            if device is not None:
+                self.paint_tile(painter, self.tile_rect(index), ip, device, now)
+        painter.end()
+
+    def paint_tile(self, painter, rect, ip, device, now):
+        status = device.get('status', 'Unknown')
+        color = STATUS_COLORS.get(status, UNKNOWN_COLOR)
+        painter.setPen(QPen(color, 2))
+        painter.setBrush(TILE_BACKGROUND)
+        painter.drawRoundedRect(rect.adjusted(1, 1, -1, -1), 6, 6)
+
+        inner = rect.adjusted(10, 6, -10, -6)
+        painter.setPen(TEXT_COLOR)
+        painter.setFont(self.name_font)
+        painter.drawText(inner, Qt.AlignLeft | Qt.AlignTop,
+                         painter.fontMetrics().elidedText(str(device.get('name', ip)), Qt.ElideRight,
+                                                          int(inner.width())))
+
+        due = device.get('timer_due')
+        painter.setFont(self.time_font)
+        if due is None:
+            painter.setPen(IDLE_COLOR)
+            painter.drawText(inner, Qt.AlignCenter, "Idle")
+        else:
+            remaining = max(0.0, due - now)
+            painter.setPen(WARNING_COLOR if remaining < WARNING_SECONDS else TEXT_COLOR)
+            painter.drawText(inner, Qt.AlignCenter, format_remaining(remaining))
+
+        painter.setFont(self.detail_font)
+        painter.setPen(color)
+        painter.drawText(inner, Qt.AlignLeft | Qt.AlignBottom, status)
+        painter.setPen(IDLE_COLOR)
+        painter.drawText(inner, Qt.AlignRight | Qt.AlignBottom, str(device.get('response_time', 'N/A')))
@@ -0,0 +1,254 @@
+import time
+
+from PyQt5.QtCore import QAbstractTableModel, QModelIndex, QSortFilterProxyModel, Qt
+from PyQt5.QtGui import QColor
+
+COLUMNS = ('name', 'ip', 'transport', 'group', 'status', 'response_time', 'remaining')
+HEADERS = {
+    'name': 'Name',
+    'ip': 'IP',
+    'transport': 'Type',
+    'group': 'Group',
+    'status': 'Status',
+    'response_time': 'RTT',
+    'remaining': 'Remaining',
+}
+REMAINING = COLUMNS.index('remaining')
+
+IP_ROLE = Qt.UserRole
+SORT_ROLE = Qt.UserRole + 1
+
+STATUS_COLORS = {'Online': QColor('green'), 'Offline': QColor('red')}
+# Sorts rows without a value after every row with one
+NO_VALUE = float('inf')
+
+
+def parse_rtt(response_time):
+    """'12.34 ms' -> 12.34, anything else -> None"""
+    try:
+        return float(str(response_time).split()[0])
+    except (ValueError, IndexError):
+        return None
+
+def format_remaining(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+class DeviceTableModel(QAbstractTableModel):
+    """
+    Devices of every transport, one row per IP, kept current from the
+    change feed. The feed carries the due time of each device's earliest
+    timer, so the remaining time counts down locally between updates.
+
+    apply() touches only the rows a feed update names: changed rows emit
+    dataChanged, new rows are inserted as one block and removed rows are
+    removed one by one. Views keep their selection and scroll position
+    and never rebuild, so a refresh costs O(changes), not O(devices).
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.ips = []
+        self.rows = {}
+        self.devices = {}
+        # Devices with a pending timer, the only rows tick() touches
+        self.timed = set()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.ips)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(COLUMNS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return HEADERS[COLUMNS[section]]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        ip = self.ips[index.row()]
+        column = COLUMNS[index.column()]
+        if role == IP_ROLE:
+            return ip
+        if column == 'remaining':
+            remaining = self.remaining(ip)
+            if role == Qt.DisplayRole:
+                return format_remaining(remaining) if remaining is not None else ''
+            if role == SORT_ROLE:
+                return remaining if remaining is not None else NO_VALUE
+            return None
+        value = ip if column == 'ip' else self.devices[ip].get(column, '')
+        if role == Qt.DisplayRole:
+            return value
+        if role == SORT_ROLE:
+            if column == 'response_time':
+                rtt = parse_rtt(value)
+                return rtt if rtt is not None else NO_VALUE
+            return str(value).lower()
+        if role == Qt.ForegroundRole and column == 'status':
+            return STATUS_COLORS.get(value, QColor('gray'))
+        return None
+
+    def device(self, ip):
+        return self.devices.get(ip)
+
+    def groups(self):
+        return sorted({device.get('group') for device in self.devices.values()} - {'', None})
+
+    def remaining(self, ip):
+        due = self.devices[ip].get('timer_due')
+        return max(0.0, due - time.time()) if due is not None else None
+
+    def apply(self, changes, reset=False):
+        """Apply a /changes reply: ip -> device, or None for a removed device"""
+        if reset:
+            self.beginResetModel()
+            self.devices = {ip: device for ip, device in changes.items() if device is not None}
+            self.timed = {ip for ip, device in self.devices.items() if device.get('timer_due') is not None}
+            self.ips = list(self.devices)
+            self._reindex()
+            self.endResetModel()
+            return
+
+        added = []
+        for ip, device in changes.items():
+            if device is None:
+                self._remove(ip)
+                continue
+            if device.get('timer_due') is not None:
+                self.timed.add(ip)
+            else:
+                self.timed.discard(ip)
+            if ip in self.devices:
+                self.devices[ip] = device
+                row = self.rows[ip]
+                self.dataChanged.emit(self.index(row, 0), self.index(row, len(COLUMNS) - 1))
+            else:
+                self.devices[ip] = device
+                added.append(ip)
+        if added:
+            first = len(self.ips)
+            self.beginInsertRows(QModelIndex(), first, first + len(added) - 1)
+            self.ips.extend(added)
+            for row, ip in enumerate(added, first):
+                self.rows[ip] = row
+            self.endInsertRows()
+
+    def _remove(self, ip):
+        row = self.rows.get(ip)
+        if row is None:
+            return
+        self.beginRemoveRows(QModelIndex(), row, row)
+        del self.ips[row]
+        del self.devices[ip]
+        self.timed.discard(ip)
+        del self.rows[ip]
+        self._reindex(row)
+        self.endRemoveRows()
+
+    def _reindex(self, start=0):
+        if start == 0:
+            self.rows = {}
+        for row in range(start, len(self.ips)):
+            self.rows[self.ips[row]] = row
+
+    def tick(self):
+        """Refresh the remaining-time column of the rows with a timer, as one update"""
+        rows = [self.rows[ip] for ip in self.timed]
+        if rows:
+            self.dataChanged.emit(self.index(min(rows), REMAINING), self.index(max(rows), REMAINING))
+
+
+class DeviceFilterModel(QSortFilterProxyModel):
+    """
+    Sorts the device table by any column and filters it by transport,
+    status, group and text. A checkable filter adds a check box to the
+    name column; checks belong to the filter, not to the shared model.
+    """
+
+    def __init__(self, source, parent=None, checkable=False):
+        super().__init__(parent)
+        self.transport = None
+        self.status = None
+        self.group = None
+        self.text = ''
+        self.checkable = checkable
+        self.checked = set()
+        self.setSourceModel(source)
+        self.setSortRole(SORT_ROLE)
+        self.setDynamicSortFilter(True)
+
+    def set_transport(self, transport):
+        self.transport = transport
+        self.invalidateFilter()
+
+    def set_status(self, status):
+        self.status = status or None
+        self.invalidateFilter()
+
+    def set_group(self, group):
+        self.group = group or None
+        self.invalidateFilter()
+
+    def set_text(self, text):
+        self.text = text.strip().lower()
+        self.invalidateFilter()
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        model = self.sourceModel()
+        ip = model.ips[source_row]
+        device = model.devices[ip]
+        if self.transport is not None and device.get('transport') != self.transport:
+            return False
+        if self.status is not None and device.get('status') != self.status:
+            return False
+        if self.group is not None and device.get('group') != self.group:
+            return False
+        return not self.text or self.text in ip or self.text in str(device.get('name', '')).lower()
+
+    def ip(self, row):
+        return self.data(self.index(row, 0), IP_ROLE)
+
+    def flags(self, index):
+        flags = super().flags(index)
+        if self.checkable and index.column() == 0:
+            flags |= Qt.ItemIsUserCheckable
+        return flags
+
+    def data(self, index, role=Qt.DisplayRole):
+        if self.checkable and role == Qt.CheckStateRole and index.column() == 0:
+            return Qt.Checked if index.data(IP_ROLE) in self.checked else Qt.Unchecked
+        return super().data(index, role)
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if self.checkable and role == Qt.CheckStateRole and index.column() == 0:
+            ip = index.data(IP_ROLE)
+            if value == Qt.Checked:
+                self.checked.add(ip)
+            else:
+                self.checked.discard(ip)
+            self.dataChanged.emit(index, index, [Qt.CheckStateRole])
+            return True
+        return super().setData(index, value, role)
+
+    def check_shown(self, checked=True):
+        """Check or uncheck every row the filter currently shows"""
+        ips = {self.ip(row) for row in range(self.rowCount())}
+        if checked:
+            self.checked |= ips
+        else:
+            self.checked -= ips
+        if self.rowCount():
+            self.dataChanged.emit(self.index(0, 0), self.index(self.rowCount() - 1, 0), [Qt.CheckStateRole])
+
+    def uncheck_all(self):
+        self.checked.clear()
+        if self.rowCount():
+            self.dataChanged.emit(self.index(0, 0), self.index(self.rowCount() - 1, 0), [Qt.CheckStateRole])
+
+    def checked_ips(self):
+        """Checked devices that are still shown, in display order"""
+        return [ip for ip in (self.ip(row) for row in range(self.rowCount())) if ip in self.checked]
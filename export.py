@@ -0,0 +1,108 @@
+import base64
+import csv
+import io
+import json
+import time
+
+EXPORT_CHUNK = 500
+MAX_EXPORT_CHUNK = 5000
+
+
+class Dataset:
+    """
+    A table exported in keyset order.
+
+    Rows are read `chunk` at a time with `WHERE key > last key ORDER BY key
+    LIMIT chunk`, each chunk a short read of its own, so an export of any
+    size uses constant memory and never holds a read transaction open while
+    the client is slow. Every row carries the cursor to resume after it.
+    """
+
+    def __init__(self, table, columns, key, time_column):
+        self.table = table
+        self.columns = columns
+        self.key = key
+        self.time_column = time_column
+
+    def query(self, since, until, ip, after, chunk):
+        conditions, params = [], []
+        if since is not None:
+            conditions.append(f'{self.time_column} >= ?')
+            params.append(since)
+        if until is not None:
+            conditions.append(f'{self.time_column} < ?')
+            params.append(until)
+        if ip is not None:
+            conditions.append('ip = ?')
+            params.append(ip)
+        if after is not None:
+            conditions.append(f"({', '.join(self.key)}) > ({', '.join('?' * len(self.key))})")
+            params.extend(after)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ''
+        order = ', '.join(self.key)
+        return (f"SELECT {', '.join(self.columns)} FROM {self.table}{where} ORDER BY {order} LIMIT ?",
+                params + [chunk])
+
+    def rows(self, store, since=None, until=None, ip=None, after=None, chunk=EXPORT_CHUNK):
+        """Yield lists of row dicts, each with its resume cursor, until the range is exhausted"""
+        while True:
+            # Look the connection up per chunk: the response may be iterated on another thread
+            rows = store.db.execute(*self.query(since, until, ip, after, chunk)).fetchall()
+            if not rows:
+                return
+            batch = []
+            for row in rows:
+                after = [row[column] for column in self.key]
+                batch.append(dict(row, cursor=encode_cursor(after)))
+            yield batch
+            if len(rows) < chunk:
+                return
+
+
+DATASETS = {
+    'sessions': Dataset('sessions', ('id', 'ip', 'kind', 'action', 'seconds', 'started_at', 'due_at',
+                                     'ended_at', 'end_reason'), ('started_at', 'id'), 'started_at'),
+    'status': Dataset('status_history', ('seq', 'at', 'ip', 'status', 'previous'), ('seq',), 'at'),
+    'events': Dataset('rental_events', ('seq', 'at', 'ip', 'session_id', 'event', 'seconds', 'occupied_from',
+                                        'occupied_until', 'amount'), ('seq',), 'at'),
+}
+
+
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    """The key encoded in a cursor; raises ValueError if it is not one of ours"""
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        raise ValueError(f"Invalid cursor {cursor!r}")
+    if not isinstance(key, list):
+        raise ValueError(f"Invalid cursor {cursor!r}")
+    return key
+
+def parse_time(value):
+    """Epoch seconds, or a local date (YYYY-MM-DD) meaning its midnight"""
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return time.mktime(time.strptime(value, '%Y-%m-%d'))
+
+def jsonl_chunks(batches):
+    for batch in batches:
+        yield ''.join(json.dumps(row, separators=(',', ':')) + '\n' for row in batch)
+
+def csv_chunks(batches, columns, header=True):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=list(columns) + ['cursor'], lineterminator='\n')
+    if header:
+        writer.writeheader()
+    for batch in batches:
+        writer.writerows(batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.getvalue():
+        yield buffer.getvalue()
@@ -1,30 +1,64 @@
-import json
+import logging
 import subprocess
+import time
 from PyQt5.QtWidgets import (QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
                              QPushButton, QLineEdit, QLabel, QTextEdit, 
                              QMessageBox, QComboBox, QGridLayout, QInputDialog, 
                              QTabWidget, QFileDialog, QCheckBox, QGroupBox,
-                             QRadioButton, QSpinBox, QScrollArea)
+                             QRadioButton, QSpinBox, QScrollArea, QTableView,
+                             QAbstractItemView, QHeaderView, QProgressBar,
+                             QTableWidget, QTableWidgetItem)
 from PyQt5.QtCore import QTimer, Qt
-from PyQt5.QtGui import QFont, QIcon
+from PyQt5.QtGui import QColor, QFont, QIcon
 import requests
 import os
 import urllib.parse
 import shlex
 import base64
 import socket
+import sqlite3
+
+# Settings and custom text live in the same SQLite store as the devices
+from store import store
+from gui_workers import ApiClient
+from device_model import DeviceTableModel, DeviceFilterModel, IP_ROLE
+from dashboard import Dashboard
 
 # Konstanta
-CUSTOM_TEXT_FILE = 'custom_text.json'
-SETTINGS_FILE = 'mosys_settings.json'
+DEFAULT_CUSTOM_TEXT = "Waktu rental mu sudah habis, silahkan ke kasir jika ingin menambah waktu!"
+SERVER_URL = 'http://localhost:1616'
+# Network scans still run on the discovery servers of each transport
+SCAN_URLS = {'adb': 'http://localhost:1617', 'cec': 'http://localhost:1618'}
+# Request timeouts in seconds; every call runs off the UI thread
+COMMAND_TIMEOUT = 35
+BATCH_TIMEOUT = 60
+UPLOAD_TIMEOUT = 300
+
+logger = logging.getLogger(__name__)
 
 class MosysBillingGUI(QMainWindow):
-    def __init__(self):
+    def __init__(self, wait_for_server=False):
+        """With wait_for_server, nothing is fetched until server_ready() is called"""
         super().__init__()
         self.custom_text = self.load_custom_text()
         self.connection_type = "adb"  # Default connection type
+        # Devices of every transport, kept current from the server's /changes feed
+        self.devices = DeviceTableModel(self)
+        self.feed_version = None
+        # The Remote and Batch tabs each sort and filter the same rows
+        self.tv_proxy = DeviceFilterModel(self.devices, self)
+        self.batch_proxy = DeviceFilterModel(self.devices, self, checkable=True)
+        self.batch_rows = {}
+        self.batch_done = 0
+        self.batch_failed = 0
+        # HTTP calls run in the background and report back to the UI thread
+        self.api = ApiClient(SERVER_URL, self)
         self.settings = self.load_settings()
         self.initUI()
+        if wait_for_server:
+            self.server_status.setText("Server: Starting...")
+        else:
+            self.server_ready()
 
     def initUI(self):
         self.setWindowTitle('Mosys Billing')
@@ -61,17 +95,52 @@ class MosysBillingGUI(QMainWindow):
         
         # Server status indicator
         status_layout = QHBoxLayout()
-        self.adb_status = QLabel("ADB Server: Checking...")
-        self.cec_status = QLabel("CEC Server: Checking...")
-        status_layout.addWidget(self.adb_status)
-        status_layout.addWidget(self.cec_status)
+        self.server_status = QLabel("Server: Checking...")
+        status_layout.addWidget(self.server_status)
         main_layout.addLayout(status_layout)
         
-        # Buat tab widget
-        tabs = QTabWidget()
-        main_layout.addWidget(tabs)
+        # Tabs are built the first time they are shown, so the window appears without waiting for them
+        self.tabs = QTabWidget()
+        main_layout.addWidget(self.tabs)
+        self.tab_builders = []
+        self.built_tabs = set()
+        for name, title, builder in (('home', "Home", self.build_home_tab),
+                                     ('dashboard', "Dashboard", self.build_dashboard_tab),
+                                     ('remote', "Remote", self.build_remote_tab),
+                                     ('batch', "Batch Control", self.build_batch_tab),
+                                     ('api', "API", self.build_api_tab),
+                                     ('about', "About", self.build_about_tab)):
+            page = QWidget()
+            QVBoxLayout(page).setContentsMargins(0, 0, 0, 0)
+            self.tabs.addTab(page, title)
+            self.tab_builders.append((name, builder))
+        self.tabs.currentChanged.connect(self.build_tab)
+        self.build_tab(self.tabs.currentIndex())
+
+        # Device changes are pushed by the server; this only reconnects the feed if it dropped.
+        # Started by server_ready()
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.update_tv_list)
+
+        # The one repaint timer: counts remaining rental time down in the tables and dashboard
+        self.tick_timer = QTimer(self)
+        self.tick_timer.timeout.connect(self.devices.tick)
+        self.tick_timer.start(1000)
+
+        self.update_connection_ui()
 
-        # Tab Home
+    def build_tab(self, index):
+        """Build the tab at `index` if this is the first time it is shown"""
+        name, builder = self.tab_builders[index]
+        if name in self.built_tabs:
+            return
+        started = time.perf_counter()
+        self.built_tabs.add(name)
+        self.tabs.widget(index).layout().addWidget(builder())
+        logger.info(f"Built {name} tab in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    def build_home_tab(self):
+        """Usage guide"""
         home_tab = QWidget()
         home_layout = QVBoxLayout()
         
@@ -97,9 +166,19 @@ class MosysBillingGUI(QMainWindow):
         """)
         home_layout.addWidget(guide_text)
         home_tab.setLayout(home_layout)
-        tabs.addTab(home_tab, "Home")
+        return home_tab
 
-        # Tab Remote (Dengan Scroll Area)
+    def build_dashboard_tab(self):
+        """A live tile per TV with its remaining rental time"""
+        dashboard_scroll = QScrollArea()
+        dashboard_scroll.setWidgetResizable(True)
+        dashboard_scroll.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+        self.dashboard = Dashboard(self.devices)
+        dashboard_scroll.setWidget(self.dashboard)
+        return dashboard_scroll
+
+    def build_remote_tab(self):
+        """Scanner, TV list, remote control, timer and Add/Edit TV (with scroll area)"""
         remote_tab = QWidget()
         remote_scroll = QScrollArea()
         remote_scroll.setWidgetResizable(True)
@@ -140,25 +219,33 @@ class MosysBillingGUI(QMainWindow):
         scan_group.setLayout(scan_layout)
         remote_layout.addWidget(scan_group)
         
-        # TV Selector
+        # TV filter
         selector_layout = QHBoxLayout()
-        selector_label = QLabel("Select TV:")
-        self.tv_selector = QComboBox()
+        selector_label = QLabel("Filter:")
+        self.tv_filter = QLineEdit()
+        self.tv_filter.setPlaceholderText("Name or IP")
+        self.tv_filter.textChanged.connect(self.tv_proxy.set_text)
+        self.status_filter = QComboBox()
+        self.status_filter.addItem("All statuses", None)
+        for status in ('Online', 'Offline', 'Checking', 'Error'):
+            self.status_filter.addItem(status, status)
+        self.status_filter.currentIndexChanged.connect(
+            lambda: self.tv_proxy.set_status(self.status_filter.currentData()))
         refresh_button = QPushButton("Refresh")
-        refresh_button.clicked.connect(self.update_tv_list)
+        refresh_button.clicked.connect(self.reload_tv_list)
         
         selector_layout.addWidget(selector_label)
-        selector_layout.addWidget(self.tv_selector)
+        selector_layout.addWidget(self.tv_filter)
+        selector_layout.addWidget(self.status_filter)
         selector_layout.addWidget(refresh_button)
         remote_layout.addLayout(selector_layout)
 
-        # TV List
+        # TV List; the selected row is the TV the controls below act on
         list_label = QLabel("TV Status:")
         remote_layout.addWidget(list_label)
-        self.tv_list = QTextEdit()
-        self.tv_list.setReadOnly(True)
-        self.tv_list.setMaximumHeight(100)
-        remote_layout.addWidget(self.tv_list)
+        self.tv_table = self.device_table(self.tv_proxy, QAbstractItemView.SingleSelection)
+        self.tv_table.setMinimumHeight(200)
+        remote_layout.addWidget(self.tv_table)
 
         # Remote Control Layout
         remote_control_group = QGroupBox("Remote Control")
@@ -313,10 +400,11 @@ class MosysBillingGUI(QMainWindow):
         # Tambahkan spacer untuk pengaturan scroll
         remote_layout.addStretch()
         
-        # Tambahkan scroll area ke tabs
-        tabs.addTab(remote_scroll, "Remote")
-        
-        # Batch Control Tab (dengan Scroll Area)
+        self.update_remote_controls()
+        return remote_scroll
+
+    def build_batch_tab(self):
+        """Batch control (with scroll area)"""
         batch_tab = QWidget()
         batch_scroll = QScrollArea()
         batch_scroll.setWidgetResizable(True)
@@ -327,9 +415,35 @@ class MosysBillingGUI(QMainWindow):
         batch_description = QLabel("Use batch control to send the same command to multiple TVs at once.")
         batch_layout.addWidget(batch_description)
         
+        # Narrow the list by status or group, then check what is shown
+        batch_filter_layout = QHBoxLayout()
+        self.batch_status_filter = QComboBox()
+        self.batch_status_filter.addItem("All statuses", None)
+        for status in ('Online', 'Offline', 'Checking', 'Error'):
+            self.batch_status_filter.addItem(status, status)
+        self.batch_status_filter.currentIndexChanged.connect(
+            lambda: self.batch_proxy.set_status(self.batch_status_filter.currentData()))
+        self.batch_group_filter = QComboBox()
+        self.batch_group_filter.addItem("All groups", None)
+        self.batch_group_filter.currentIndexChanged.connect(
+            lambda: self.batch_proxy.set_group(self.batch_group_filter.currentData()))
+        check_shown_button = QPushButton("Check Shown")
+        check_shown_button.clicked.connect(lambda: self.batch_proxy.check_shown(True))
+        uncheck_button = QPushButton("Uncheck All")
+        uncheck_button.clicked.connect(self.batch_proxy.uncheck_all)
+        set_group_button = QPushButton("Set Group...")
+        set_group_button.clicked.connect(self.set_batch_group)
+        batch_filter_layout.addWidget(QLabel("Status:"))
+        batch_filter_layout.addWidget(self.batch_status_filter)
+        batch_filter_layout.addWidget(QLabel("Group:"))
+        batch_filter_layout.addWidget(self.batch_group_filter)
+        batch_filter_layout.addWidget(check_shown_button)
+        batch_filter_layout.addWidget(uncheck_button)
+        batch_filter_layout.addWidget(set_group_button)
+        batch_layout.addLayout(batch_filter_layout)
+
         # TV selection list with checkboxes
-        self.batch_tv_list = QTextEdit()
-        self.batch_tv_list.setReadOnly(True)
+        self.batch_tv_list = self.device_table(self.batch_proxy, QAbstractItemView.NoSelection)
         self.batch_tv_list.setMinimumHeight(200)
         batch_layout.addWidget(self.batch_tv_list)
         
@@ -342,17 +456,33 @@ class MosysBillingGUI(QMainWindow):
         batch_layout.addLayout(batch_command_layout)
         
         # Send batch command button
-        send_batch_button = QPushButton("Send Command to All TVs")
-        send_batch_button.clicked.connect(self.send_batch_command)
-        batch_layout.addWidget(send_batch_button)
+        self.send_batch_button = QPushButton("Send Command to Checked TVs")
+        self.send_batch_button.clicked.connect(self.send_batch_command)
+        batch_layout.addWidget(self.send_batch_button)
+
+        # Live per-TV results of the last batch
+        self.batch_progress = QProgressBar()
+        self.batch_progress.setValue(0)
+        batch_layout.addWidget(self.batch_progress)
+        self.batch_summary = QLabel("")
+        batch_layout.addWidget(self.batch_summary)
+        self.batch_results = QTableWidget(0, 4)
+        self.batch_results.setHorizontalHeaderLabels(["TV", "IP", "Result", "Latency"])
+        self.batch_results.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.batch_results.verticalHeader().setVisible(False)
+        self.batch_results.horizontalHeader().setStretchLastSection(True)
+        self.batch_results.setMinimumHeight(150)
+        batch_layout.addWidget(self.batch_results)
         
         # Tambahkan spacer untuk pengaturan scroll
         batch_layout.addStretch()
         
-        # Tambahkan scroll area ke tabs
-        tabs.addTab(batch_scroll, "Batch Control")
+        self.update_batch_commands()
+        self.update_group_filter()
+        return batch_scroll
 
-        # API Tab
+    def build_api_tab(self):
+        """API information (with scroll area)"""
         api_tab = QWidget()
         api_scroll = QScrollArea()
         api_scroll.setWidgetResizable(True)
@@ -365,28 +495,35 @@ class MosysBillingGUI(QMainWindow):
         <h2>API Information</h2>
         <p>The Mosys Billing application provides the following API endpoints for both connection types:</p>
         
-        <h3>ADB API (Port 1616)</h3>
+        <h3>Device API (Port 1616)</h3>
         <ul>
-            <li><code>POST /add_tv</code>: Add a new TV</li>
-            <li><code>POST /remove_tv</code>: Remove a TV</li>
-            <li><code>POST /edit_tv</code>: Edit TV information</li>
-            <li><code>GET /tv_status</code>: Get status of all TVs</li>
-            <li><code>POST /control_tv</code>: Control a TV (on, off, volume)</li>
-            <li><code>POST /stream_media/{ip}</code>: Stream media to a TV</li>
+            <li><code>GET /devices</code>: Get status of all TVs (<code>?transport=adb|cec</code>)</li>
+            <li><code>POST /devices</code>: Add a new TV with its transport (adb or cec)</li>
+            <li><code>PUT /devices/{ip}</code>: Edit TV information</li>
+            <li><code>DELETE /devices/{ip}</code>: Remove a TV</li>
+            <li><code>POST /devices/{ip}/command</code>: Send an action to a TV</li>
+            <li><code>POST /devices/{ip}/countdown</code>: Show a countdown on an ADB TV (returns a job id)</li>
+            <li><code>POST /devices/{ip}/stream</code>: Stream media to an ADB TV (returns a job id)</li>
+            <li><code>POST /batch</code>: Send an action to multiple TVs at once</li>
             <li><code>POST /set_timer</code>: Set a timer for TV control</li>
+            <li><code>GET /jobs/{id}</code>: Get the progress and result of a background job</li>
+            <li><code>GET /changes</code>, <code>GET /events</code>: Incremental device changes</li>
         </ul>
+        <p>The routes of the former ADB server (<code>/add_tv</code>, <code>/control_tv</code>, ...) and
+        HDMI-CEC server (<code>/add_device</code>, <code>/send_command</code>, ...) are still served.</p>
         
-        <h3>HDMI-CEC API (Port 1618)</h3>
+        <h3>ADB Discovery API (Port 1617)</h3>
+        <ul>
+            <li><code>POST /scan_network</code>: Scan a subnet for TVs with ADB over network enabled</li>
+            <li><code>GET /scan_results</code>: Get discovered ADB TVs with the time they were last seen</li>
+            <li><code>POST /import_tvs</code>: Add discovered TVs to the ADB TV list</li>
+        </ul>
+        
+        <h3>HDMI-CEC Discovery API (Port 1618)</h3>
         <ul>
-            <li><code>POST /add_device</code>: Add a new TV</li>
-            <li><code>POST /remove_device</code>: Remove a TV</li>
-            <li><code>POST /edit_device</code>: Edit TV information</li>
-            <li><code>GET /device_status</code>: Get status of all TVs</li>
-            <li><code>POST /send_command</code>: Send a command to a TV</li>
-            <li><code>POST /batch_command</code>: Send a command to multiple TVs</li>
             <li><code>POST /scan_network</code>: Scan network for HDMI-CEC devices</li>
+            <li><code>GET /scan_results</code>: Get the results of the last scan</li>
             <li><code>GET /available_commands</code>: Get list of available commands</li>
-            <li><code>POST /set_timer</code>: Set a timer for TV control</li>
         </ul>
         
         <p>For more details on how to use these endpoints, please refer to the API documentation.</p>
@@ -396,10 +533,10 @@ class MosysBillingGUI(QMainWindow):
         # Tambahkan spacer untuk pengaturan scroll
         api_layout.addStretch()
         
-        # Tambahkan scroll area ke tabs
-        tabs.addTab(api_scroll, "API")
+        return api_scroll
 
-        # About Tab
+    def build_about_tab(self):
+        """About"""
         about_tab = QWidget()
         about_layout = QVBoxLayout()
         about_info = QTextEdit()
@@ -413,21 +550,7 @@ class MosysBillingGUI(QMainWindow):
         """)
         about_layout.addWidget(about_info)
         about_tab.setLayout(about_layout)
-        tabs.addTab(about_tab, "About")
-
-        # Setup timers
-        self.timer = QTimer(self)
-        self.timer.timeout.connect(self.update_tv_list)
-        self.timer.start(5000)
-        
-        self.server_check_timer = QTimer(self)
-        self.server_check_timer.timeout.connect(self.check_server_status)
-        self.server_check_timer.start(10000)  # Check server status every 10 seconds
-
-        # Initial updates
-        self.update_tv_list()
-        self.check_server_status()
-        self.update_connection_ui()
+        return about_tab
 
     # Metode-metode fungsionalitas yang sama dengan versi sebelumnya
     def toggle_connection(self):
@@ -438,14 +561,21 @@ class MosysBillingGUI(QMainWindow):
         
         # Save settings
         self.settings['connection_type'] = self.connection_type
-        self.save_settings()
+        self.save_settings('connection_type')
         
         # Update UI for connection type
         self.update_connection_ui()
-        self.update_tv_list()
     
     def update_connection_ui(self):
         """Update UI elements based on the connection type"""
+        self.tv_proxy.set_transport(self.connection_type)
+        self.batch_proxy.set_transport(self.connection_type)
+        if 'remote' in self.built_tabs:
+            self.update_remote_controls()
+        if 'batch' in self.built_tabs:
+            self.update_batch_commands()
+
+    def update_remote_controls(self):
         if self.connection_type == "adb":
             # ADB specific controls
             self.stream_button.setVisible(True)
@@ -456,10 +586,6 @@ class MosysBillingGUI(QMainWindow):
             self.timer_action.clear()
             self.timer_action.addItems(['off', 'sleep', 'volume_up', 'volume_down'])
             
-            # Update batch commands for ADB
-            self.batch_command.clear()
-            self.batch_command.addItems(['off', 'sleep', 'volume_up', 'volume_down', 'home'])
-            
         else:  # HDMI-CEC
             # CEC specific controls
             self.stream_button.setVisible(False)
@@ -472,33 +598,112 @@ class MosysBillingGUI(QMainWindow):
                 'power_off', 'mute', 'volume_up', 'volume_down', 
                 'menu', 'back', 'home', 'play', 'pause', 'stop'
             ])
-            
-            # Update batch commands for CEC
-            self.batch_command.clear()
+
+    def update_batch_commands(self):
+        self.batch_command.clear()
+        if self.connection_type == "adb":
+            self.batch_command.addItems(['off', 'sleep', 'volume_up', 'volume_down', 'home'])
+        else:  # HDMI-CEC
             self.batch_command.addItems([
                 'power_on', 'power_off', 'volume_up', 'volume_down', 'mute',
                 'input_hdmi1', 'input_hdmi2', 'input_hdmi3', 'menu', 'home'
             ])
 
-    def check_server_status(self):
-        """Check if the servers are running"""
-        try:
-            # Check ADB server
-            response = requests.get('http://localhost:1616/tv_status', timeout=1)
-            self.adb_status.setText("ADB Server: Online")
-            self.adb_status.setStyleSheet("color: green;")
-        except:
-            self.adb_status.setText("ADB Server: Offline")
-            self.adb_status.setStyleSheet("color: red;")
-        
-        try:
-            # Check CEC server
-            response = requests.get('http://localhost:1618/device_status', timeout=1)
-            self.cec_status.setText("CEC Server: Online")
-            self.cec_status.setStyleSheet("color: green;")
-        except:
-            self.cec_status.setText("CEC Server: Offline")
-            self.cec_status.setStyleSheet("color: red;")
+    def connection_error(self, error):
+        QMessageBox.warning(self, "Connection Error", f"Could not connect to server: {str(error)}")
+
+    def on_reply(self, success, failure, ok_codes=(200,), then=None, title="Success"):
+        """A callback showing `success`, or `failure` with the server's error message"""
+        def handle(response):
+            if response.status_code in ok_codes:
+                QMessageBox.information(self, title, success)
+                if then:
+                    then()
+            else:
+                QMessageBox.warning(self, "Error", f"{failure}: {error_message(response)}")
+        return handle
+
+    def device_table(self, proxy, selection_mode):
+        """A sortable table view of the devices behind `proxy`"""
+        view = QTableView()
+        view.setModel(proxy)
+        view.setSortingEnabled(True)
+        view.sortByColumn(0, Qt.AscendingOrder)
+        view.setSelectionBehavior(QAbstractItemView.SelectRows)
+        view.setSelectionMode(selection_mode)
+        view.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        view.verticalHeader().setVisible(False)
+        # Fixed row heights keep scrolling cheap with thousands of rows
+        view.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        view.horizontalHeader().setStretchLastSection(True)
+        return view
+
+    def selected_ip(self):
+        """IP of the TV selected in the Remote tab, or None"""
+        index = self.tv_table.selectionModel().currentIndex()
+        if not index.isValid() or not self.tv_table.selectionModel().isSelected(index):
+            return None
+        return index.data(IP_ROLE)
+
+    def server_ready(self):
+        """Start following the server, once it is listening"""
+        if not self.timer.isActive():
+            self.timer.start(5000)
+            self.update_tv_list()
+
+    def update_tv_list(self):
+        """Follow the server's /events feed; reconnects from the last version seen if it dropped"""
+        if self.api.running('events'):
+            return
+        params = {}
+        if self.feed_version is not None:
+            params['since'] = self.feed_version
+        self.api.stream_events('/events', lambda event: self.apply_changes(event['data']),
+                               self.feed_closed, self.changes_failed, key='events', params=params)
+
+    def reload_tv_list(self):
+        """Reconnect the feed from scratch, reloading every device"""
+        self.api.cancel('events')
+        self.feed_version = None
+        self.update_tv_list()
+
+    def feed_closed(self, _):
+        self.server_status.setText("Server: Offline")
+        self.server_status.setStyleSheet("color: red;")
+
+    def apply_changes(self, data):
+        """Apply a batch of device changes to the device model, row by row"""
+        self.server_status.setText("Server: Online")
+        self.server_status.setStyleSheet("color: green;")
+        self.devices.apply(data['changes'], reset=data['reset'])
+        self.feed_version = data['version']
+        if data['changes'] or data['reset']:
+            self.update_group_filter()
+
+    def update_group_filter(self):
+        """Offer the groups the devices currently have"""
+        if 'batch' not in self.built_tabs:
+            return
+        groups = self.devices.groups()
+        current = [self.batch_group_filter.itemData(i) for i in range(1, self.batch_group_filter.count())]
+        if groups == current:
+            return
+        selected = self.batch_group_filter.currentData()
+        self.batch_group_filter.blockSignals(True)
+        while self.batch_group_filter.count() > 1:
+            self.batch_group_filter.removeItem(1)
+        for group in groups:
+            self.batch_group_filter.addItem(group, group)
+        index = self.batch_group_filter.findData(selected)
+        self.batch_group_filter.setCurrentIndex(max(index, 0))
+        self.batch_group_filter.blockSignals(False)
+        self.batch_proxy.set_group(self.batch_group_filter.currentData())
+
+    def changes_failed(self, error):
+        # Keep showing the last known devices; the next fetch starts over
+        self.feed_version = None
+        self.server_status.setText(f"Server: Offline ({str(error)})")
+        self.server_status.setStyleSheet("color: red;")
 
     def scan_network(self):
         """Scan the network for TVs"""
@@ -510,28 +715,11 @@ class MosysBillingGUI(QMainWindow):
             QMessageBox.warning(self, "Error", "Scan range too large")
             return
         
-        try:
-            if self.connection_type == "adb":
-                url = f'http://localhost:1617/scan_network'  # Using the LAN optimized ADB server
-            else:
-                url = f'http://localhost:1618/scan_network'
-                
-            response = requests.post(url, json={
-                'subnet': subnet,
-                'start': start,
-                'end': end
-            }, timeout=2)
-            
-            if response.status_code == 200:
-                QMessageBox.information(self, "Scan Started", 
-                                        f"Network scan started for range {subnet}.{start}-{end}. " +
-                                        "Check scan results tab in a few minutes.")
-            else:
-                QMessageBox.warning(self, "Error", 
-                                    f"Failed to start scan: {response.json().get('error', 'Unknown error')}")
-        except requests.RequestException as e:
-            QMessageBox.warning(self, "Connection Error", 
-                                f"Could not connect to server: {str(e)}")
+        self.api.post(f'{SCAN_URLS[self.connection_type]}/scan_network',
+                      self.on_reply(f"Network scan started for range {subnet}.{start}-{end}. " +
+                                    "Check scan results tab in a few minutes.",
+                                    "Failed to start scan", title="Scan Started"),
+                      self.connection_error, json={'subnet': subnet, 'start': start, 'end': end})
 
     def add_tv(self):
         name = self.name_input.text()
@@ -540,153 +728,58 @@ class MosysBillingGUI(QMainWindow):
         if not name or not ip:
             QMessageBox.warning(self, "Error", "Please enter both name and IP")
             return
-            
-        try:
-            if self.connection_type == "adb":
-                url = 'http://localhost:1616/add_tv'
-                data = {'name': name, 'ip': ip}
-            else:
-                url = 'http://localhost:1618/add_device'
-                data = {'name': name, 'ip': ip}
-                
-            response = requests.post(url, json=data)
-            
-            if response.status_code == 200:
-                QMessageBox.information(self, "Success", "TV added successfully")
-                self.name_input.clear()
-                self.ip_input.clear()
-                self.update_tv_list()
-            else:
-                QMessageBox.warning(self, "Error", 
-                                    f"Failed to add TV: {response.json().get('error', 'Unknown error')}")
-        except requests.RequestException as e:
-            QMessageBox.warning(self, "Connection Error", 
-                                f"Could not connect to server: {str(e)}")
 
-    def update_tv_list(self):
-        try:
-            if self.connection_type == "adb":
-                url = 'http://localhost:1616/tv_status'
-            else:
-                url = 'http://localhost:1618/device_status'
-                
-            response = requests.get(url)
-            
-            if response.status_code == 200:
-                devices = response.json()
-                
-                # Update TV selector combobox
-                self.tv_selector.clear()
-                
-                # Update TV list text
-                tv_list_text = ""
-                batch_list_text = ""
-                
-                for ip, device_info in devices.items():
-                    name = device_info.get('name', 'Unknown')
-                    status = device_info.get('status', 'Unknown')
-                    response_time = device_info.get('response_time', 'N/A')
-                    
-                    # Add to dropdown
-                    self.tv_selector.addItem(f"{name} ({ip})", ip)
-                    
-                    # Add to TV list display
-                    tv_list_text += f"Name: {name}, IP: {ip}, Status: {status}, Response Time: {response_time}\n"
-                    
-                    # Add to batch list with checkbox
-                    batch_list_text += f"□ {name} ({ip}) - Status: {status}\n"
-                
-                self.tv_list.setText(tv_list_text)
-                self.batch_tv_list.setText(batch_list_text)
-            else:
-                self.tv_list.setText("Failed to fetch TV list")
-                self.batch_tv_list.setText("Failed to fetch TV list")
-        except requests.RequestException as e:
-            self.tv_list.setText(f"Connection error: {str(e)}")
-            self.batch_tv_list.setText(f"Connection error: {str(e)}")
+        def added():
+            self.name_input.clear()
+            self.ip_input.clear()
+            self.update_tv_list()
+
+        data = {'name': name, 'ip': ip, 'transport': self.connection_type}
+        self.api.post('/devices', self.on_reply("TV added successfully", "Failed to add TV", then=added),
+                      self.connection_error, json=data)
 
     def control_tv(self, action):
-        selected_ip = self.tv_selector.currentData()
+        selected_ip = self.selected_ip()
         if not selected_ip:
             QMessageBox.warning(self, "Error", "Please select a TV")
             return
             
-        try:
-            if self.connection_type == "adb":
-                url = 'http://localhost:1616/control_tv'
-                data = {'ip': selected_ip, 'action': action}
-            else:
-                url = 'http://localhost:1618/send_command'
-                data = {'ip': selected_ip, 'command': action}
-                
-            response = requests.post(url, json=data)
-            
-            if response.status_code == 200:
-                action_display = action.replace('_', ' ').title()
-                QMessageBox.information(self, "Success", f"{action_display} command sent successfully")
-            else:
-                error_message = response.json().get('error', 'Unknown error')
-                QMessageBox.warning(self, "Error", f"Failed to send {action} command: {error_message}")
-        except requests.RequestException as e:
-            QMessageBox.warning(self, "Connection Error", f"Could not connect to server: {str(e)}")
+        action_display = action.replace('_', ' ').title()
+        self.api.post(f'/devices/{selected_ip}/command',
+                      self.on_reply(f"{action_display} command sent successfully", f"Failed to send {action} command"),
+                      self.connection_error, json={'action': action}, timeout=COMMAND_TIMEOUT)
 
     def edit_tv(self):
-        selected_ip = self.tv_selector.currentData()
+        selected_ip = self.selected_ip()
         if not selected_ip:
             QMessageBox.warning(self, "Error", "Please select a TV to edit")
             return
             
-        try:
-            if self.connection_type == "adb":
-                status_url = 'http://localhost:1616/tv_status'
-            else:
-                status_url = 'http://localhost:1618/device_status'
-                
-            status_response = requests.get(status_url)
+        device_info = self.devices.device(selected_ip)
+        if not device_info:
+            QMessageBox.warning(self, "Error", "Failed to get TV information")
+            return
             
-            if status_response.status_code != 200:
-                QMessageBox.warning(self, "Error", "Failed to get TV information")
-                return
-                
-            device_info = status_response.json().get(selected_ip)
-            if not device_info:
-                QMessageBox.warning(self, "Error", "Failed to get TV information")
-                return
-                
-            new_name, ok1 = QInputDialog.getText(self, "Edit TV", "Enter new name:", 
-                                               QLineEdit.Normal, device_info['name'])
-            if not ok1 or not new_name:
-                return
-                
-            new_ip, ok2 = QInputDialog.getText(self, "Edit TV", "Enter new IP:", 
-                                             QLineEdit.Normal, selected_ip)
-            if not ok2 or not new_ip:
-                return
-                
-            if new_name == device_info['name'] and new_ip == selected_ip:
-                QMessageBox.information(self, "No Changes", "No changes were made to the TV information.")
-                return
-                
-            if self.connection_type == "adb":
-                url = 'http://localhost:1616/edit_tv'
-                data = {'old_ip': selected_ip, 'new_name': new_name, 'new_ip': new_ip}
-            else:
-                url = 'http://localhost:1618/edit_device'
-                data = {'old_ip': selected_ip, 'new_name': new_name, 'new_ip': new_ip}
-                
-            response = requests.post(url, json=data)
+        new_name, ok1 = QInputDialog.getText(self, "Edit TV", "Enter new name:", 
+                                           QLineEdit.Normal, device_info['name'])
+        if not ok1 or not new_name:
+            return
             
-            if response.status_code == 200:
-                QMessageBox.information(self, "Success", "TV edited successfully")
-                self.update_tv_list()
-            else:
-                QMessageBox.warning(self, "Error", 
-                                  f"Failed to edit TV: {response.json().get('error', 'Unknown error')}")
-        except requests.RequestException as e:
-            QMessageBox.warning(self, "Connection Error", f"Could not connect to server: {str(e)}")
+        new_ip, ok2 = QInputDialog.getText(self, "Edit TV", "Enter new IP:", 
+                                         QLineEdit.Normal, selected_ip)
+        if not ok2 or not new_ip:
+            return
+            
+        if new_name == device_info['name'] and new_ip == selected_ip:
+            QMessageBox.information(self, "No Changes", "No changes were made to the TV information.")
+            return
+            
+        self.api.put(f'/devices/{selected_ip}',
+                     self.on_reply("TV edited successfully", "Failed to edit TV", then=self.update_tv_list),
+                     self.connection_error, json={'name': new_name, 'ip': new_ip})
     
     def delete_tv(self):
-        selected_ip = self.tv_selector.currentData()
+        selected_ip = self.selected_ip()
         if not selected_ip:
             QMessageBox.warning(self, "Error", "Please select a TV to delete")
             return
@@ -698,24 +791,9 @@ class MosysBillingGUI(QMainWindow):
         if reply != QMessageBox.Yes:
             return
             
-        try:
-            if self.connection_type == "adb":
-                url = 'http://localhost:1616/remove_tv'
-                data = {'ip': selected_ip}
-            else:
-                url = 'http://localhost:1618/remove_device'
-                data = {'ip': selected_ip}
-                
-            response = requests.post(url, json=data)
-            
-            if response.status_code == 200:
-                QMessageBox.information(self, "Success", "TV deleted successfully")
-                self.update_tv_list()
-            else:
-                QMessageBox.warning(self, "Error", 
-                                  f"Failed to delete TV: {response.json().get('error', 'Unknown error')}")
-        except requests.RequestException as e:
-            QMessageBox.warning(self, "Connection Error", f"Could not connect to server: {str(e)}")
+        self.api.delete(f'/devices/{selected_ip}',
+                        self.on_reply("TV deleted successfully", "Failed to delete TV", then=self.update_tv_list),
+                        self.connection_error)
     
     def stream_media(self):
         # Only available in ADB mode
@@ -723,7 +801,7 @@ class MosysBillingGUI(QMainWindow):
             QMessageBox.warning(self, "Not Available", "Media streaming is only available in ADB mode")
             return
             
-        selected_ip = self.tv_selector.currentData()
+        selected_ip = self.selected_ip()
         if not selected_ip:
             QMessageBox.warning(self, "Error", "Please select a TV")
             return
@@ -733,37 +811,27 @@ class MosysBillingGUI(QMainWindow):
         if not file_path:
             return
             
-        try:
+        url = self.api.url(f'/devices/{selected_ip}/stream')
+
+        def upload():
+            # Read and sent on the worker thread, so large files do not freeze the window
             with open(file_path, 'rb') as file:
                 files = {'file': (os.path.basename(file_path), file, 'application/octet-stream')}
-                stream_response = requests.post(f'http://localhost:1616/stream_media/{selected_ip}', 
-                                              files=files)
-                
-                if stream_response.status_code == 200:
-                    QMessageBox.information(self, "Success", "Media file transferred and streaming started")
-                else:
-                    QMessageBox.warning(self, "Error", 
-                                      f"Failed to start media streaming: {stream_response.json().get('error', 'Unknown error')}")
-        except requests.RequestException as e:
-            QMessageBox.warning(self, "Connection Error", f"Failed to connect to server: {str(e)}")
-        except Exception as e:
-            QMessageBox.warning(self, "Error", f"An unexpected error occurred: {str(e)}")
+                return self.api.session.post(url, files=files, timeout=UPLOAD_TIMEOUT)
+
+        def upload_failed(error):
+            if isinstance(error, requests.RequestException):
+                QMessageBox.warning(self, "Connection Error", f"Failed to connect to server: {str(error)}")
+            else:
+                QMessageBox.warning(self, "Error", f"An unexpected error occurred: {str(error)}")
+
+        self.api.run(upload, self.on_reply("Media file uploaded, streaming will start shortly",
+                                           "Failed to start media streaming", ok_codes=(200, 202)),
+                     upload_failed)
     
     def send_batch_command(self):
-        """Send command to all checked TVs in batch mode"""
-        # Parse checked TVs from batch list text
-        checked_ips = []
-        batch_text = self.batch_tv_list.toPlainText()
-        
-        # This is a simplified parsing - in a real app you'd use checkboxes
-        for line in batch_text.split('\n'):
-            if line.startswith('☑'):  # Checked box
-                # Extract IP from format "☑ Name (192.168.1.x) - Status: Online"
-                start_idx = line.find('(') + 1
-                end_idx = line.find(')')
-                if start_idx > 0 and end_idx > start_idx:
-                    ip = line[start_idx:end_idx]
-                    checked_ips.append(ip)
+        """Send a command to all checked TVs at once and show each result as it arrives"""
+        checked_ips = self.batch_proxy.checked_ips()
         
         if not checked_ips:
             QMessageBox.warning(self, "No TVs Selected", 
@@ -771,61 +839,87 @@ class MosysBillingGUI(QMainWindow):
             return
             
         command = self.batch_command.currentText()
-        
-        try:
-            if self.connection_type == "adb":
-                # ADB doesn't have native batch command, so we loop through TVs
-                for ip in checked_ips:
-                    url = 'http://localhost:1616/control_tv'
-                    data = {'ip': ip, 'action': command}
-                    requests.post(url, json=data)
-            else:
-                # HDMI-CEC has native batch command
-                url = 'http://localhost:1618/batch_command'
-                data = {'ips': checked_ips, 'command': command}
-                response = requests.post(url, json=data)
-                
-                if response.status_code != 200:
-                    QMessageBox.warning(self, "Error", 
-                                      f"Failed to send batch command: {response.json().get('error', 'Unknown error')}")
-                    return
-            
-            QMessageBox.information(self, "Success", 
-                                  f"Command '{command}' sent to {len(checked_ips)} TVs")
-        except requests.RequestException as e:
-            QMessageBox.warning(self, "Connection Error", f"Could not connect to server: {str(e)}")
-    
+
+        self.batch_rows = {ip: row for row, ip in enumerate(checked_ips)}
+        self.batch_done = 0
+        self.batch_failed = 0
+        self.batch_results.setRowCount(len(checked_ips))
+        for row, ip in enumerate(checked_ips):
+            device_info = self.devices.device(ip) or {}
+            for column, text in enumerate((device_info.get('name', ''), ip, "Sending...", "")):
+                self.batch_results.setItem(row, column, QTableWidgetItem(text))
+        self.batch_progress.setRange(0, len(checked_ips))
+        self.batch_progress.setValue(0)
+        self.batch_summary.setText(f"Sending '{command}' to {len(checked_ips)} TVs...")
+        self.send_batch_button.setEnabled(False)
+
+        # The server sends to every TV in parallel and streams one line per TV as it completes
+        self.api.stream_json('POST', '/batch', self.batch_result, self.batch_finished, self.batch_error,
+                             key='batch', timeout=BATCH_TIMEOUT,
+                             json={'ips': checked_ips, 'action': command, 'stream': True})
+
+    def batch_result(self, result):
+        if result.get('done'):
+            self.batch_summary.setText(f"{self.batch_done} TVs done, {self.batch_failed} failed "
+                                       f"in {result['total_ms']:.0f} ms")
+            return
+        row = self.batch_rows.get(result['ip'])
+        if row is None:
+            return
+        ok = result['status'] == 'success'
+        self.batch_done += 1
+        self.batch_failed += not ok
+        status_item = QTableWidgetItem("OK" if ok else result.get('message', 'Failed'))
+        status_item.setForeground(QColor('green') if ok else QColor('red'))
+        self.batch_results.setItem(row, 2, status_item)
+        self.batch_results.setItem(row, 3, QTableWidgetItem(f"{result.get('latency_ms', 0):.0f} ms"))
+        self.batch_progress.setValue(self.batch_done)
+
+    def batch_finished(self, _):
+        self.send_batch_button.setEnabled(True)
+
+    def batch_error(self, error):
+        self.send_batch_button.setEnabled(True)
+        response = getattr(error, 'response', None)
+        if response is not None:
+            QMessageBox.warning(self, "Error", f"Failed to send batch command: {error_message(response)}")
+        else:
+            self.connection_error(error)
+
+    def set_batch_group(self):
+        """Put the checked TVs in a group, or take them out of theirs"""
+        checked_ips = self.batch_proxy.checked_ips()
+        if not checked_ips:
+            QMessageBox.warning(self, "No TVs Selected", 
+                              "Please select at least one TV by checking the box")
+            return
+        group, ok = QInputDialog.getText(self, "Set Group",
+                                         f"Group for {len(checked_ips)} TVs (empty to clear):",
+                                         QLineEdit.Normal, self.batch_group_filter.currentData() or "")
+        if not ok:
+            return
+        for ip in checked_ips:
+            self.api.put(f'/devices/{ip}', lambda _: self.update_tv_list(), self.connection_error,
+                         json={'group': group.strip()})
+
     def load_custom_text(self):
-        """Load custom text from file"""
-        default_text = "Waktu rental mu sudah habis, silahkan ke kasir jika ingin menambah waktu!"
-        
-        if not os.path.exists(CUSTOM_TEXT_FILE):
-            return default_text
-        
+        """Load custom text from the store"""
         try:
-            with open(CUSTOM_TEXT_FILE, 'r') as f:
-                content = f.read().strip()
-                if not content:  # File is empty
-                    return default_text
-                data = json.loads(content)
-                return data.get('custom_text', default_text)
-        except json.JSONDecodeError:
-            return default_text
-        except Exception as e:
+            return store.get_setting('custom_text') or DEFAULT_CUSTOM_TEXT
+        except sqlite3.Error as e:
             print(f"Error loading custom text: {str(e)}")
-            return default_text
+            return DEFAULT_CUSTOM_TEXT
 
     def save_custom_text(self):
-        """Save custom text to file"""
+        """Save custom text to the store"""
         custom_text = self.custom_text_input.text()
         
         try:
-            with open(CUSTOM_TEXT_FILE, 'w') as f:
-                json.dump({'custom_text': custom_text}, f)
+            store.set_setting('custom_text', custom_text)
             
             self.custom_text = custom_text
             QMessageBox.information(self, "Success", "Custom text saved successfully")
-        except Exception as e:
+        except sqlite3.Error as e:
             QMessageBox.warning(self, "Error", f"Failed to save custom text: {str(e)}")
     
     def load_settings(self):
@@ -837,27 +931,22 @@ class MosysBillingGUI(QMainWindow):
             'end_range': 254
         }
         
-        if not os.path.exists(SETTINGS_FILE):
-            return default_settings
-        
         try:
-            with open(SETTINGS_FILE, 'r') as f:
-                settings = json.load(f)
-                return settings
-        except:
+            return dict(default_settings, **store.settings())
+        except sqlite3.Error:
             return default_settings
     
-    def save_settings(self):
-        """Save application settings"""
+    def save_settings(self, *keys):
+        """Save the given application settings, or all of them"""
         try:
-            with open(SETTINGS_FILE, 'w') as f:
-                json.dump(self.settings, f)
-        except Exception as e:
+            for key in keys or self.settings:
+                store.set_setting(key, self.settings[key])
+        except sqlite3.Error as e:
             print(f"Error saving settings: {str(e)}")
     
     def set_timer(self):
         """Set a timer for a TV"""
-        selected_ip = self.tv_selector.currentData()
+        selected_ip = self.selected_ip()
         duration_text = self.timer_duration.text()
         
         if not selected_ip:
@@ -870,66 +959,50 @@ class MosysBillingGUI(QMainWindow):
             
         try:
             duration = int(duration_text)
-            if duration <= 0:
-                QMessageBox.warning(self, "Error", "Duration must be a positive number")
-                return
-                
-            action = self.timer_action.currentText()
-            show_on_tv = self.show_on_tv_checkbox.isChecked()
-            custom_text = self.custom_text_input.text()
-            
-            if show_on_tv and self.connection_type == "adb":
-                # Show countdown on TV (only works with ADB)
-                try:
-                    encoded_text = base64.b64encode(custom_text.encode()).decode()
-                    url = 'http://localhost:1616/start_tv_timer'
-                    data = {
-                        'ip': selected_ip,
-                        'seconds': duration,
-                        'custom_text': custom_text
-                    }
-                    
-                    response = requests.post(url, json=data)
-                    
-                    if response.status_code == 200:
-                        QMessageBox.information(self, "Success", 
-                                              f"Timer set for {duration} seconds and countdown shown on TV")
-                    else:
-                        QMessageBox.warning(self, "Error", 
-                                          f"Failed to set timer on TV: {response.json().get('error', 'Unknown error')}")
-                except Exception as e:
-                    QMessageBox.warning(self, "Error", f"Failed to set timer: {str(e)}")
-            else:
-                # Backend-only timer
-                if self.connection_type == "adb":
-                    url = 'http://localhost:1616/set_timer'
-                    data = {
-                        'ip': selected_ip,
-                        'seconds': duration,
-                        'action': action
-                    }
-                else:
-                    url = 'http://localhost:1618/set_timer'
-                    data = {
-                        'ip': selected_ip,
-                        'seconds': duration,
-                        'command': action
-                    }
-                
-                response = requests.post(url, json=data)
-                
-                if response.status_code == 200:
-                    QMessageBox.information(self, "Success", 
-                                          f"Timer set for {duration} seconds to {action}")
-                else:
-                    QMessageBox.warning(self, "Error", 
-                                      f"Failed to set timer: {response.json().get('error', 'Unknown error')}")
         except ValueError:
             QMessageBox.warning(self, "Error", "Please enter a valid number for timer duration")
-        except requests.RequestException as e:
-            QMessageBox.warning(self, "Connection Error", f"Could not connect to server: {str(e)}")
-        except Exception as e:
-            QMessageBox.warning(self, "Error", f"An unexpected error occurred: {str(e)}")
+            return
+        if duration <= 0:
+            QMessageBox.warning(self, "Error", "Duration must be a positive number")
+            return
+            
+        action = self.timer_action.currentText()
+        show_on_tv = self.show_on_tv_checkbox.isChecked()
+        custom_text = self.custom_text_input.text()
+        
+        if show_on_tv and self.connection_type == "adb":
+            # Show countdown on TV (only works with ADB)
+            data = {
+                'seconds': duration,
+                'custom_text': custom_text
+            }
+            self.api.post(f'/devices/{selected_ip}/countdown',
+                          self.on_reply(f"Timer set for {duration} seconds and countdown shown on TV",
+                                        "Failed to set timer on TV", ok_codes=(200, 202)),
+                          self.connection_error, json=data)
+        else:
+            # Backend-only timer
+            data = {
+                'ip': selected_ip,
+                'seconds': duration,
+                'action': action
+            }
+            self.api.post('/set_timer', self.on_reply(f"Timer set for {duration} seconds to {action}",
+                                                      "Failed to set timer"),
+                          self.connection_error, json=data)
+
+
+    def closeEvent(self, event):
+        self.timer.stop()
+        self.api.shutdown()
+        super().closeEvent(event)
+
+
+def error_message(response):
+    try:
+        return response.json().get('error', 'Unknown error')
+    except ValueError:
+        return f"HTTP {response.status_code}"
 
 
 if __name__ == '__main__':
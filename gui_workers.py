@@ -0,0 +1,239 @@
+import json
+import logging
+import socket
+
+import requests
+from requests.adapters import HTTPAdapter
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = 5
+MAX_WORKERS = 4
+# Longer than the server's 15 s SSE keepalive, so a silent stream means a dead server
+EVENTS_READ_TIMEOUT = 40
+
+
+class TaskSignals(QObject):
+    # (task, result), (task, exception) and (task, partial result)
+    succeeded = pyqtSignal(object, object)
+    failed = pyqtSignal(object, object)
+    progress = pyqtSignal(object, object)
+
+
+class Task(QRunnable):
+    """
+    Run `fn` on the thread pool and report its result or exception through
+    signals. With on_progress, `fn` is called with the task itself, to
+    report partial results and to register the stream to close on cancel.
+    """
+
+    def __init__(self, fn, on_result=None, on_error=None, key=None, on_progress=None):
+        super().__init__()
+        # Lifetime is managed by ApiClient, so the pool never deletes a task it still refers to
+        self.setAutoDelete(False)
+        self.fn = fn
+        self.on_result = on_result
+        self.on_error = on_error
+        self.on_progress = on_progress
+        self.key = key
+        self.signals = TaskSignals()
+        self.cancelled = False
+        self.stream = None
+
+    def run(self):
+        if self.cancelled:
+            # Still report, so ApiClient forgets the task; the result is ignored
+            self.signals.succeeded.emit(self, None)
+            return
+        try:
+            result = self.fn(self) if self.on_progress else self.fn()
+        except Exception as e:
+            self.signals.failed.emit(self, e)
+        else:
+            self.signals.succeeded.emit(self, result)
+
+    def report(self, value):
+        if not self.cancelled:
+            self.signals.progress.emit(self, value)
+
+    def cancel(self):
+        self.cancelled = True
+        if self.stream is not None:
+            close_stream(self.stream)
+
+
+class ApiClient(QObject):
+    """
+    Background HTTP calls for the GUI.
+
+    Calls run on a small QThreadPool over one keep-alive requests.Session,
+    always with a timeout, so a slow server or a long adb command never
+    blocks the UI thread. Callbacks run on the UI thread. A call made with
+    a `key` supersedes the previous call with the same key: if that one has
+    not started it is dropped, otherwise its result is ignored.
+    """
+
+    def __init__(self, base_url, parent=None, max_workers=MAX_WORKERS):
+        super().__init__(parent)
+        self.base_url = base_url
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.pool = QThreadPool(self)
+        # One extra thread for a long-lived event stream, so it never starves short calls
+        self.pool.setMaxThreadCount(max_workers + 1)
+        self.tasks = set()
+        self.latest = {}
+
+    def url(self, path):
+        return path if path.startswith(('http://', 'https://')) else f'{self.base_url}{path}'
+
+    def run(self, fn, on_result=None, on_error=None, key=None, on_progress=None):
+        """Run `fn` in the background and pass its result or exception to the callbacks"""
+        if key is not None:
+            self.cancel(key)
+        task = Task(fn, on_result, on_error or log_error, key, on_progress)
+        # Slots of this object run on the UI thread, whichever thread emits
+        task.signals.succeeded.connect(self._succeeded)
+        task.signals.failed.connect(self._failed)
+        task.signals.progress.connect(self._progress)
+        self.tasks.add(task)
+        if key is not None:
+            self.latest[key] = task
+        self.pool.start(task)
+        return task
+
+    def request(self, method, path, on_result=None, on_error=None, key=None, timeout=DEFAULT_TIMEOUT, **kwargs):
+        """An HTTP request whose requests.Response is passed to on_result"""
+        url = self.url(path)
+        return self.run(lambda: self.session.request(method, url, timeout=timeout, **kwargs),
+                        on_result, on_error, key)
+
+    def get_json(self, path, on_result=None, on_error=None, key=None, timeout=DEFAULT_TIMEOUT, **kwargs):
+        """A GET whose decoded JSON body is passed to on_result; HTTP errors go to on_error"""
+        url = self.url(path)
+
+        def fetch():
+            response = self.session.get(url, timeout=timeout, **kwargs)
+            response.raise_for_status()
+            return response.json()
+        return self.run(fetch, on_result, on_error, key)
+
+    def stream_json(self, method, path, on_item, on_result=None, on_error=None, key=None,
+                    timeout=DEFAULT_TIMEOUT, **kwargs):
+        """
+        A request answered with NDJSON: each line is decoded and passed to
+        on_item as soon as it arrives, then on_result(None) at the end.
+        """
+        url = self.url(path)
+
+        def fetch(task):
+            with self.session.request(method, url, stream=True, timeout=timeout, **kwargs) as response:
+                task.stream = response
+                response.raise_for_status()
+                for line in response.iter_lines():
+                    if line:
+                        task.report(json.loads(line))
+        return self.run(fetch, on_result, on_error, key, on_item)
+
+    def stream_events(self, path, on_event, on_result=None, on_error=None, key=None, **kwargs):
+        """
+        Follow a Server-Sent Events stream. Each event is passed to on_event
+        as {'id', 'event', 'data'} with its data decoded from JSON; comments
+        (keepalives) are skipped. on_result(None) is called when the server
+        closes the stream.
+        """
+        url = self.url(path)
+
+        def follow(task):
+            timeout = (DEFAULT_TIMEOUT, EVENTS_READ_TIMEOUT)
+            with self.session.get(url, stream=True, timeout=timeout, **kwargs) as response:
+                task.stream = response
+                response.raise_for_status()
+                event = {}
+                for line in response.iter_lines(decode_unicode=True):
+                    if line:
+                        field, _, value = line.partition(':')
+                        if field:
+                            event[field] = value[1:] if value.startswith(' ') else value
+                    elif 'data' in event:
+                        task.report({'id': event.get('id'), 'event': event.get('event', 'message'),
+                                     'data': json.loads(event['data'])})
+                        event = {}
+        return self.run(follow, on_result, on_error, key, on_event)
+
+    def running(self, key):
+        """Whether a call made with `key` is still queued or running"""
+        return key in self.latest
+
+    def get(self, path, on_result=None, on_error=None, **kwargs):
+        return self.request('GET', path, on_result, on_error, **kwargs)
+
+    def post(self, path, on_result=None, on_error=None, **kwargs):
+        return self.request('POST', path, on_result, on_error, **kwargs)
+
+    def put(self, path, on_result=None, on_error=None, **kwargs):
+        return self.request('PUT', path, on_result, on_error, **kwargs)
+
+    def delete(self, path, on_result=None, on_error=None, **kwargs):
+        return self.request('DELETE', path, on_result, on_error, **kwargs)
+
+    def cancel(self, key):
+        task = self.latest.pop(key, None)
+        if task is not None:
+            self._drop(task)
+
+    def _drop(self, task):
+        task.cancel()
+        if self.pool.tryTake(task):
+            self.tasks.discard(task)
+
+    def _succeeded(self, task, result):
+        self._finish(task, task.on_result, result)
+
+    def _failed(self, task, error):
+        self._finish(task, task.on_error, error)
+
+    def _progress(self, task, value):
+        if not task.cancelled:
+            task.on_progress(value)
+
+    def _finish(self, task, callback, value):
+        self.tasks.discard(task)
+        if task.key is not None and self.latest.get(task.key) is task:
+            del self.latest[task.key]
+        # Cancellation happens on the UI thread too, so this check is exact
+        if not task.cancelled and callback is not None:
+            callback(value)
+
+    def shutdown(self, timeout_ms=2000):
+        """Drop queued calls and wait briefly for the running ones"""
+        for task in list(self.tasks):
+            self._drop(task)
+        self.latest.clear()
+        self.pool.waitForDone(timeout_ms)
+        self.session.close()
+
+    def stats(self):
+        return {'active': self.pool.activeThreadCount(), 'pending': len(self.tasks)}
+
+
+def close_stream(response):
+    """
+    Wake a worker blocked reading a streamed response by shutting its socket
+    down; the worker then closes the response itself. response.close() is
+    not used here, as it waits for the blocked read.
+    """
+    # urllib3 response -> http.client response -> socket file -> socket
+    fp = getattr(getattr(response.raw, '_fp', None), 'fp', None)
+    sock = getattr(getattr(fp, 'raw', None), '_sock', None)
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+def log_error(error):
+    logger.warning(f"Background request failed: {str(error)}")
@@ -0,0 +1,162 @@
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Concurrent jobs per kind; kinds not listed get DEFAULT_LIMIT
+JOB_LIMITS = {
+    'stream': 2,
+    'tv_timer': 8,
+    'batch': 4,
+    'scan': 2,
+}
+DEFAULT_LIMIT = 4
+
+
+class JobError(Exception):
+    """Raised by a job function to fail its job with a message"""
+
+
+class Job:
+    """A long-running operation with its progress, result and timing"""
+
+    def __init__(self, kind, params=None, total=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.params = params or {}
+        self.state = 'queued'
+        self.result = None
+        self.error = None
+        self.done = 0
+        self.total = total
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.future = None
+        self.cancel_event = threading.Event()
+        self.lock = threading.Lock()
+
+    def advance(self, count=1):
+        with self.lock:
+            self.done += count
+
+    def running(self):
+        return self.state in ('queued', 'running')
+
+    def cancel(self):
+        self.cancel_event.set()
+        if self.future is not None and self.future.cancel():
+            self.state = 'cancelled'
+            self.finished_at = time.time()
+
+    def to_dict(self, include_results=True):
+        with self.lock:
+            data = {
+                'id': self.id,
+                'kind': self.kind,
+                'state': self.state,
+                'params': self.params,
+                'done': self.done,
+                'total': self.total,
+                'created_at': self.created_at,
+                'started_at': self.started_at,
+                'finished_at': self.finished_at,
+                'queue_ms': round(((self.started_at or self.finished_at or time.time()) - self.created_at) * 1000, 1),
+                'run_ms': round(((self.finished_at or time.time()) - self.started_at) * 1000, 1)
+                          if self.started_at else None,
+            }
+            if self.error:
+                data['error'] = self.error
+            if include_results and self.result is not None:
+                data['result'] = self.result
+        return data
+
+
+class JobManager:
+    """
+    Runs long operations in the background and keeps track of them by id.
+
+    Every kind of job has its own bounded executor, so a burst of uploads
+    cannot take the workers that batches or scans need. Jobs that run on
+    their own threads (network scans) can be registered with `track` to
+    show up next to the others. Only the most recent `keep` finished jobs
+    are remembered.
+    """
+
+    def __init__(self, limits=JOB_LIMITS, keep=200):
+        self.limits = dict(limits)
+        self.keep = keep
+        self.jobs = {}
+        self.executors = {}
+        self.lock = threading.Lock()
+
+    def executor(self, kind):
+        """The bounded executor that runs jobs of `kind`"""
+        with self.lock:
+            executor = self.executors.get(kind)
+            if executor is None:
+                executor = ThreadPoolExecutor(max_workers=self.limits.get(kind, DEFAULT_LIMIT),
+                                              thread_name_prefix=f"job-{kind}")
+                self.executors[kind] = executor
+            return executor
+
+    def track(self, job):
+        """Make a job visible under /jobs"""
+        with self.lock:
+            self.jobs[job.id] = job
+            finished = [j for j in self.jobs.values() if not j.running()]
+            for old in finished[:max(0, len(self.jobs) - self.keep)]:
+                del self.jobs[old.id]
+        return job
+
+    def submit(self, kind, fn, params=None, total=None):
+        """Run `fn(job)` in the background; its return value becomes the job result"""
+        job = self.track(Job(kind, params, total))
+        job.future = self.executor(kind).submit(self._run, job, fn)
+        logger.info(f"Queued {kind} job {job.id}")
+        return job
+
+    def _run(self, job, fn):
+        job.state = 'running'
+        job.started_at = time.time()
+        try:
+            job.result = fn(job)
+            job.state = 'cancelled' if job.cancel_event.is_set() else 'completed'
+        except Exception as e:
+            job.state = 'failed'
+            job.error = str(e)
+            logger.error(f"{job.kind} job {job.id} failed: {str(e)}")
+        job.finished_at = time.time()
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def list(self, kind=None, state=None):
+        """Known jobs, newest first"""
+        with self.lock:
+            jobs = [job for job in self.jobs.values()
+                    if (kind is None or job.kind == kind) and (state is None or job.state == state)]
+        return sorted(jobs, key=lambda job: job.created_at, reverse=True)
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is not None and job.running():
+            job.cancel()
+            logger.info(f"Cancelling job {job_id}")
+        return job
+
+    def stats(self):
+        with self.lock:
+            jobs = list(self.jobs.values())
+        counts = {}
+        for job in jobs:
+            kind = counts.setdefault(job.kind, {})
+            kind[job.state] = kind.get(job.state, 0) + 1
+        return counts
+
+
+jobs = JobManager()
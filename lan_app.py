@@ -0,0 +1,218 @@
+import asyncio
+import json
+import logging
+import struct
+import threading
+import time
+from flask import Flask, request, jsonify
+
+import scanner
+import server
+from persistence import atomic_write_json
+
+# Configure logging
+logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# Setup Flask app
+app = Flask(__name__)
+app.config['JSON_SORT_KEYS'] = False
+
+ADB_PORT = 5555
+SCAN_RESULTS_FILE = 'adb_scan_results.json'
+HANDSHAKE_TIMEOUT = 1.0
+
+# ADB wire protocol (the protocol adbd itself speaks on port 5555)
+A_CNXN = 0x4e584e43
+A_AUTH = 0x48545541
+A_STLS = 0x534c5453
+A_VERSION = 0x01000001
+MAX_PAYLOAD = 256 * 1024
+
+# Discovered hosts by IP, with the time they were last seen
+scan_cache = {}
+scan_info = {}
+cache_lock = threading.Lock()
+
+def adb_packet(command, arg0, arg1, payload):
+    """Build an ADB message: 24-byte little-endian header followed by the payload"""
+    checksum = sum(payload) & 0xffffffff
+    header = struct.pack('<6I', command, arg0, arg1, len(payload), checksum, command ^ 0xffffffff)
+    return header + payload
+
+def parse_banner(banner):
+    """Turn 'device::ro.product.model=X;...' into a dict of properties"""
+    _, _, props = banner.partition('::')
+    return dict(item.split('=', 1) for item in props.split(';') if '=' in item)
+
+async def adb_handshake(result, timeout):
+    """
+    Confirm that an open port is adbd by sending a CNXN message.
+
+    adbd answers with CNXN (debugging already authorized), AUTH (the TV will
+    ask to allow this computer) or STLS (TLS pairing). Anything else is not
+    an ADB device.
+    """
+    ip, port = result['ip'], result['port']
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(ip, port), timeout)
+    except (OSError, asyncio.TimeoutError):
+        return None
+    try:
+        writer.write(adb_packet(A_CNXN, A_VERSION, MAX_PAYLOAD, b'host::\x00'))
+        await writer.drain()
+        header = await asyncio.wait_for(reader.readexactly(24), max(timeout, HANDSHAKE_TIMEOUT))
+        command, _, _, length, _, magic = struct.unpack('<6I', header)
+        if magic != command ^ 0xffffffff or command not in (A_CNXN, A_AUTH, A_STLS):
+            return None
+
+        result = dict(result, adb=True, authorized=command == A_CNXN)
+        if command == A_CNXN and 0 < length <= MAX_PAYLOAD:
+            payload = await asyncio.wait_for(reader.readexactly(length), max(timeout, HANDSHAKE_TIMEOUT))
+            props = parse_banner(payload.rstrip(b'\x00').decode(errors='replace'))
+            result['model'] = props.get('ro.product.model')
+        return result
+    except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+        return None
+    finally:
+        writer.close()
+
+def save_scan_results():
+    with cache_lock:
+        data = {"timestamp": scan_info.get('finished_at'), "scan": dict(scan_info),
+                "devices": list(scan_cache.values())}
+    try:
+        atomic_write_json(SCAN_RESULTS_FILE, data, indent=2)
+    except Exception as e:
+        logger.error(f"Error saving scan results: {str(e)}")
+
+def load_scan_results():
+    try:
+        with open(SCAN_RESULTS_FILE, 'r') as f:
+            data = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return
+    with cache_lock:
+        scan_info.update(data.get('scan', {}))
+        for device in data.get('devices', []):
+            scan_cache[device['ip']] = device
+
+def cache_result(ip, result):
+    """Merge a confirmed ADB device into the cache as soon as it is found"""
+    if result is None:
+        return
+    now = time.time()
+    with cache_lock:
+        first_seen = scan_cache.get(ip, {}).get('first_seen', now)
+        scan_cache[ip] = dict(result, first_seen=first_seen, last_seen=now)
+
+def finish_scan(job):
+    params = job.params
+    with cache_lock:
+        scan_info.clear()
+        scan_info.update({'job_id': job.id, 'range': f"{params['subnet']}.{params['start']}-{params['end']}",
+                          'state': job.state, 'started_at': job.started_at, 'finished_at': job.finished_at,
+                          'duration': round(job.finished_at - job.started_at, 2), 'found': len(job.found)})
+    save_scan_results()
+    logger.info(f"ADB discovery {job.state}. Found {len(job.found)} ADB devices.")
+
+# -------------------- API Endpoints ---------------------
+
+@app.route('/scan_network', methods=['POST'])
+def scan_network():
+    """Scan a subnet for Android TVs with ADB over network enabled"""
+    data = request.json
+    subnet = data.get('subnet', '192.168.1')
+    start = data.get('start', 1)
+    end = data.get('end', 254)
+    timeout = data.get('timeout', scanner.DEFAULT_TIMEOUT)
+    concurrency = data.get('concurrency', scanner.DEFAULT_CONCURRENCY)
+
+    if not scanner.valid_host_range(start, end):
+        return jsonify({"error": "Invalid scan range, start and end must be 1-254 with start <= end"}), 400
+
+    if not isinstance(timeout, (int, float)) or timeout <= 0:
+        return jsonify({"error": "Invalid timeout value"}), 400
+
+    if not isinstance(concurrency, int) or concurrency <= 0:
+        return jsonify({"error": "Invalid concurrency value"}), 400
+
+    logger.info(f"Starting ADB discovery on {subnet}.{start}-{end}")
+    job, started = scanner.scan_jobs.start(
+        'adb', scanner.subnet_hosts(subnet, start, end),
+        params={'subnet': subnet, 'start': start, 'end': end, 'ports': [ADB_PORT]},
+        key=(subnet, start, end), on_result=cache_result, on_complete=finish_scan,
+        ports=(ADB_PORT,), timeout=timeout, concurrency=concurrency, confirm=adb_handshake)
+
+    if not started:
+        message = f"ADB network scan already running for range {subnet}.{start}-{end}"
+    else:
+        message = f"ADB network scan started for range {subnet}.{start}-{end}"
+    return jsonify({
+        "message": message,
+        "job_id": job.id,
+        "job": job.to_dict(include_results=False)
+    }), 200
+
+@app.route('/scan_jobs/<job_id>', methods=['GET'])
+def get_scan_job(job_id):
+    """Get progress and the devices found so far of a scan"""
+    job = scanner.scan_jobs.get(job_id)
+    if job is None or job.kind != 'adb':
+        return jsonify({"error": "Scan job not found"}), 404
+    return jsonify(job.to_dict()), 200
+
+@app.route('/scan_jobs/<job_id>/cancel', methods=['POST'])
+def cancel_scan_job(job_id):
+    """Cancel a running scan"""
+    job = scanner.scan_jobs.cancel(job_id)
+    if job is None or job.kind != 'adb':
+        return jsonify({"error": "Scan job not found"}), 404
+    return jsonify({"message": "Scan cancelled", "job": job.to_dict(include_results=False)}), 200
+
+@app.route('/scan_results', methods=['GET'])
+def get_scan_results():
+    """
+    Get the cached ADB devices, optionally only those seen in the last
+    max_age seconds. While a scan runs, devices appear as they are confirmed.
+    """
+    max_age = request.args.get('max_age', type=float)
+    now = time.time()
+    with cache_lock:
+        devices = [device for device in scan_cache.values()
+                   if max_age is None or now - device['last_seen'] <= max_age]
+        info = dict(scan_info)
+    job = scanner.scan_jobs.latest('adb')
+    if job is not None and job.running():
+        info = job.to_dict(include_results=False)
+    if not info:
+        return jsonify({"error": "No scan results available"}), 404
+    return jsonify({"timestamp": info.get('finished_at'), "scan": info, "devices": devices}), 200
+
+@app.route('/import_tvs', methods=['POST'])
+def import_tvs():
+    """Add discovered ADB devices to the shared device registry"""
+    data = request.json or {}
+    ips = data.get('ips')
+    names = data.get('names', {})
+
+    with cache_lock:
+        candidates = [device for device in scan_cache.values() if ips is None or device['ip'] in ips]
+
+    imported, skipped = [], []
+    for device in candidates:
+        ip = device['ip']
+        name = names.get(ip) or device.get('model') or f"Android TV {ip}"
+        if server.add_device(ip, name, 'adb') is None:
+            skipped.append(ip)
+            continue
+        imported.append(ip)
+
+    logger.info(f"Imported {len(imported)} discovered TVs")
+    return jsonify({"imported": imported, "skipped": skipped}), 200
+
+load_scan_results()
+
+# Start the application
+if __name__ == '__main__':
+    app.run(host='0.0.0.0', port=1617)
@@ -0,0 +1,239 @@
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+START = 'start'
+EXTEND = 'extend'
+EXPIRE = 'expire'
+CANCEL = 'cancel'
+
+# Only timers that end a rental are billed: a countdown, or an action timer that turns the TV off.
+# Other action timers (volume_up in 10 s, ...) are remote control, not rentals.
+RENTAL_ACTIONS = ('off', 'sleep', 'power_off')
+
+# Rollup periods: one row per (period, bucket, ip); 'tv' has a single bucket
+DAY = 'day'
+HOUR = 'hour'
+TV = 'tv'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rental_events (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    at REAL NOT NULL,
+    ip TEXT NOT NULL,
+    session_id TEXT NOT NULL,
+    event TEXT NOT NULL,
+    seconds REAL NOT NULL,
+    occupied_from REAL,
+    occupied_until REAL,
+    amount REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS rental_events_at ON rental_events (at);
+CREATE INDEX IF NOT EXISTS rental_events_ip_at ON rental_events (ip, at);
+CREATE INDEX IF NOT EXISTS rental_events_session ON rental_events (session_id);
+
+CREATE TRIGGER IF NOT EXISTS rental_events_no_update BEFORE UPDATE ON rental_events
+BEGIN SELECT RAISE(ABORT, 'rental_events is append-only'); END;
+CREATE TRIGGER IF NOT EXISTS rental_events_no_delete BEFORE DELETE ON rental_events
+BEGIN SELECT RAISE(ABORT, 'rental_events is append-only'); END;
+
+CREATE TABLE IF NOT EXISTS rental_rollups (
+    period TEXT NOT NULL,
+    bucket TEXT NOT NULL,
+    ip TEXT NOT NULL,
+    sessions INTEGER NOT NULL DEFAULT 0,
+    extensions INTEGER NOT NULL DEFAULT 0,
+    cancellations INTEGER NOT NULL DEFAULT 0,
+    booked_seconds REAL NOT NULL DEFAULT 0,
+    occupied_seconds REAL NOT NULL DEFAULT 0,
+    revenue REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (period, bucket, ip)
+);
+"""
+
+COUNTERS = ('sessions', 'extensions', 'cancellations', 'booked_seconds', 'occupied_seconds', 'revenue')
+
+ROLLUP_UPSERT = (
+    'INSERT INTO rental_rollups (period, bucket, ip, sessions, extensions, cancellations, '
+    'booked_seconds, occupied_seconds, revenue) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) '
+    'ON CONFLICT (period, bucket, ip) DO UPDATE SET '
+    + ', '.join(f'{name} = {name} + excluded.{name}' for name in COUNTERS)
+)
+
+
+def day_bucket(at):
+    return time.strftime('%Y-%m-%d', time.localtime(at))
+
+def hour_bucket(at):
+    return time.strftime('%Y-%m-%d %H', time.localtime(at))
+
+def hour_pieces(start, end):
+    """Split [start, end) at local hour boundaries into (start, seconds) pieces"""
+    pieces = []
+    while start < end:
+        local = time.localtime(start)
+        next_hour = start - (start % 60) - local.tm_min * 60 + 3600
+        piece_end = min(end, next_hour)
+        pieces.append((start, piece_end - start))
+        start = piece_end
+    return pieces
+
+def is_rental(timer):
+    return timer.get('kind', 'action') == 'countdown' or timer.get('action') in RENTAL_ACTIONS
+
+def price_per_hour(db):
+    row = db.execute("SELECT value FROM settings WHERE key = 'price_per_hour'").fetchone()
+    try:
+        return float(row[0]) if row else 0.0
+    except ValueError:
+        return 0.0
+
+def record(db, event, timer, seconds=0, at=None):
+    """
+    Append a rental event for `timer` and fold it into the rollups, inside
+    the caller's transaction.
+
+    start and extend sell `seconds` more time at the current price per hour
+    and occupy the TV for it. cancel frees the time that was left without
+    refunding it. expire only marks the end of the session. Timers that
+    are not rentals are not recorded.
+    """
+    if not is_rental(timer):
+        return
+    at = at or time.time()
+    if event in (START, EXTEND):
+        occupied = (timer['due_at'] - seconds, timer['due_at'])
+    elif event == CANCEL and timer['due_at'] > at:
+        occupied = (at, timer['due_at'])
+        seconds = -(timer['due_at'] - at)
+    else:
+        occupied = (None, None)
+    amount = seconds / 3600 * price_per_hour(db) if event in (START, EXTEND) else 0.0
+    db.execute('INSERT INTO rental_events (at, ip, session_id, event, seconds, occupied_from, occupied_until, '
+               'amount) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+               (at, timer['ip'], timer['id'], event, seconds, occupied[0], occupied[1], amount))
+    apply(db, {'at': at, 'ip': timer['ip'], 'event': event, 'seconds': seconds,
+               'occupied_from': occupied[0], 'occupied_until': occupied[1], 'amount': amount})
+
+def apply(db, event):
+    """Add one ledger event to the per-TV, per-day and per-hour rollups"""
+    ip, at = event['ip'], event['at']
+    counts = {
+        'sessions': int(event['event'] == START),
+        'extensions': int(event['event'] == EXTEND),
+        'cancellations': int(event['event'] == CANCEL),
+        'booked_seconds': event['seconds'] if event['event'] in (START, EXTEND) else 0.0,
+        'occupied_seconds': 0.0,
+        'revenue': event['amount'],
+    }
+    deltas = {}
+    for period, bucket in ((TV, ''), (DAY, day_bucket(at)), (HOUR, hour_bucket(at))):
+        deltas[(period, bucket)] = dict(counts)
+
+    # Occupancy goes to the hours and days the TV is actually booked for
+    if event['occupied_from'] is not None:
+        sign = -1 if event['event'] == CANCEL else 1
+        for start, seconds in hour_pieces(event['occupied_from'], event['occupied_until']):
+            for period, bucket in ((TV, ''), (DAY, day_bucket(start)), (HOUR, hour_bucket(start))):
+                delta = deltas.setdefault((period, bucket), dict.fromkeys(COUNTERS, 0))
+                delta['occupied_seconds'] += sign * seconds
+
+    db.executemany(ROLLUP_UPSERT, [(period, bucket, ip, *(delta[name] for name in COUNTERS))
+                                   for (period, bucket), delta in deltas.items()])
+
+def rebuild(db):
+    """
+    Recompute every rollup from the ledger. Events of sessions that were
+    not rentals, appended before those were filtered out, are skipped.
+    """
+    db.execute('DELETE FROM rental_rollups')
+    placeholders = ', '.join('?' * len(RENTAL_ACTIONS))
+    rows = db.execute('SELECT e.* FROM rental_events e LEFT JOIN sessions s ON s.id = e.session_id '
+                      f"WHERE s.id IS NULL OR s.kind = 'countdown' OR s.action IN ({placeholders}) "
+                      'ORDER BY e.seq', RENTAL_ACTIONS).fetchall()
+    for row in rows:
+        apply(db, dict(row))
+
+def backfill(db):
+    """Ledger events for the sessions recorded before the ledger existed"""
+    sessions = db.execute('SELECT * FROM sessions ORDER BY started_at').fetchall()
+    for session in sessions:
+        timer = {'id': session['id'], 'ip': session['ip'], 'due_at': session['due_at'],
+                 'kind': session['kind'], 'action': session['action']}
+        record(db, START, timer, session['seconds'], at=session['started_at'])
+        if session['end_reason'] == 'expired':
+            record(db, EXPIRE, timer, at=session['ended_at'])
+        elif session['end_reason'] == 'cancelled':
+            record(db, CANCEL, timer, at=session['ended_at'])
+    rentals = sum(is_rental(dict(session)) for session in sessions)
+    if rentals:
+        logger.info(f"Added {rentals} earlier sessions to the rental ledger")
+
+
+class Reports:
+    """Revenue and occupancy reports, read from the rollups only"""
+
+    def __init__(self, store):
+        self.store = store
+
+    def _rollups(self, period, since, until, ip, group_by):
+        query = (f'SELECT {group_by}, ' + ', '.join(f'SUM({name}) AS {name}' for name in COUNTERS)
+                 + ' FROM rental_rollups WHERE period = ?')
+        params = [period]
+        if since is not None:
+            query += ' AND bucket >= ?'
+            params.append(since)
+        if until is not None:
+            query += ' AND bucket <= ?'
+            params.append(until)
+        if ip is not None:
+            query += ' AND ip = ?'
+            params.append(ip)
+        query += f' GROUP BY {group_by} ORDER BY {group_by}'
+        return [dict(row) for row in self.store.db.execute(query, params)]
+
+    def _with_occupancy(self, rows, seconds_per_bucket, tvs):
+        capacity = seconds_per_bucket * max(tvs, 1)
+        for row in rows:
+            row['revenue'] = round(row['revenue'], 2)
+            row['occupancy'] = round(row['occupied_seconds'] / capacity, 4)
+        return rows
+
+    def _tv_count(self, ip):
+        if ip is not None:
+            return 1
+        return self.store.db.execute('SELECT COUNT(*) FROM devices').fetchone()[0]
+
+    def daily(self, since=None, until=None, ip=None):
+        """One row per day between since and until (YYYY-MM-DD, inclusive)"""
+        rows = self._rollups(DAY, since, until, ip, 'bucket')
+        return self._with_occupancy(rows, 86400, self._tv_count(ip))
+
+    def hourly(self, day, ip=None):
+        """One row per hour of a day (YYYY-MM-DD)"""
+        rows = self._rollups(HOUR, f'{day} 00', f'{day} 23', ip, 'bucket')
+        return self._with_occupancy(rows, 3600, self._tv_count(ip))
+
+    def tvs(self, since=None, until=None):
+        """One row per TV, over all time or between two days"""
+        if since is None and until is None:
+            rows = self._rollups(TV, None, None, None, 'ip')
+        else:
+            rows = self._rollups(DAY, since, until, None, 'ip')
+        for row in rows:
+            row['revenue'] = round(row['revenue'], 2)
+        return rows
+
+    def events(self, ip=None, since=None, limit=100):
+        """Raw ledger events, newest first"""
+        query, params = 'SELECT * FROM rental_events WHERE 1 = 1', []
+        if ip is not None:
+            query += ' AND ip = ?'
+            params.append(ip)
+        if since is not None:
+            query += ' AND at >= ?'
+            params.append(since)
+        query += ' ORDER BY seq DESC LIMIT ?'
+        params.append(limit)
+        return [dict(row) for row in self.store.db.execute(query, params)]
@@ -1,28 +1,70 @@
+import time
+# Startup phases are logged relative to this
+STARTED = time.perf_counter()
+
 import sys
-from PyQt5.QtWidgets import QApplication
-from PyQt5.QtCore import QThread
-from gui import MosysBillingGUI
 import logging
-
-# Import server ADB
-from flask_app import app as adb_app, load_tv_data as load_adb_data
-
-# Import server HDMI-CEC 
-from hdmi_cec_app import app as cec_app, load_devices as load_cec_data
+from PyQt5.QtWidgets import QApplication
+from PyQt5.QtCore import QThread, pyqtSignal
+from werkzeug.serving import make_server
 
 # Konfigurasi logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger("MosysBilling")
 
-class ADBFlaskThread(QThread):
+SERVER_PORT = 1616
+# Port 1618 serves the same app so old HDMI-CEC clients keep working
+CEC_SERVER_PORT = 1618
+
+def phase(name):
+    logger.info(f"Startup: {name} after {time.perf_counter() - STARTED:.3f}s")
+
+class BackendThread(QThread):
+    """Imports the server, loads the devices and starts the poller and timers off the UI thread"""
+    loaded = pyqtSignal(object)
+
     def run(self):
-        logger.info("Starting ADB Server on port 1616")
-        adb_app.run(host='0.0.0.0', port=1616, debug=False, use_reloader=False)
+        import server
+        # Compatibility routes of the former ADB and HDMI-CEC servers
+        from flask_app import adb_routes
+        from hdmi_cec_app import cec_routes
+
+        # One app for every device: the unified API plus the old ADB and CEC routes
+        app = server.create_app(adb_routes, cec_routes)
+        phase("server modules imported")
+
+        # One registry, poller and timer engine for ADB and HDMI-CEC devices
+        try:
+            logger.info("Loading device data")
+            server.start()
+        except Exception as e:
+            logger.error(f"Error loading device data: {str(e)}")
+        phase("device data loaded")
+        self.loaded.emit(app)
+
+class FlaskThread(QThread):
+    """Serves `app` on `port`; `ready` is emitted once the port is listening"""
+    ready = pyqtSignal(int)
+
+    def __init__(self, app, port):
+        super().__init__()
+        self.app = app
+        self.port = port
+        self.server = None
 
-class CECFlaskThread(QThread):
     def run(self):
-        logger.info("Starting HDMI-CEC Server on port 1618")
-        cec_app.run(host='0.0.0.0', port=1618, debug=False, use_reloader=False)
+        logger.info(f"Starting server on port {self.port}")
+        try:
+            self.server = make_server('0.0.0.0', self.port, self.app, threaded=True)
+        except OSError as e:
+            logger.error(f"Could not start server on port {self.port}: {str(e)}")
+            return
+        self.ready.emit(self.port)
+        self.server.serve_forever()
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
 
 class LANOptimizedADBFlaskThread(QThread):
     def run(self):
@@ -36,45 +78,44 @@ class LANOptimizedADBFlaskThread(QThread):
 
 if __name__ == '__main__':
     logger.info("Initializing Mosys Billing System")
-    
-    # Load data untuk kedua server
-    try:
-        logger.info("Loading ADB TV data")
-        load_adb_data()
-    except Exception as e:
-        logger.error(f"Error loading ADB TV data: {str(e)}")
-    
-    try:
-        logger.info("Loading HDMI-CEC device data")
-        load_cec_data()
-    except Exception as e:
-        logger.error(f"Error loading HDMI-CEC device data: {str(e)}")
-    
-    # Start Flask servers in separate threads
-    logger.info("Starting server threads")
-    
-    # ADB server thread
-    adb_thread = ADBFlaskThread()
-    adb_thread.daemon = True  # Ensure thread closes when main program exits
-    adb_thread.start()
-    
-    # HDMI-CEC server thread
-    cec_thread = CECFlaskThread()
-    cec_thread.daemon = True
-    cec_thread.start()
-    
-    # Optional: LAN Optimized ADB server thread
-    lan_thread = LANOptimizedADBFlaskThread()
-    lan_thread.daemon = True
-    lan_thread.start()
-    
-    # Start PyQt application
-    logger.info("Starting GUI application")
+
+    # Show the window first; the servers start behind it
     qt_app = QApplication(sys.argv)
-    gui = MosysBillingGUI()
+    from gui import MosysBillingGUI
+    phase("GUI modules imported")
+    gui = MosysBillingGUI(wait_for_server=True)
     gui.show()
-    
+    qt_app.processEvents()
+    phase("window shown")
+
+    server_threads = []
+    lan_thread = LANOptimizedADBFlaskThread()
+
+    def server_ready(port):
+        phase(f"server on port {port} ready")
+        if port == SERVER_PORT:
+            gui.server_ready()
+
+    def backend_loaded(app):
+        # Start Flask servers in separate threads
+        logger.info("Starting server threads")
+        for port in (SERVER_PORT, CEC_SERVER_PORT):
+            thread = FlaskThread(app, port)
+            thread.ready.connect(server_ready)
+            thread.start()
+            server_threads.append(thread)
+
+        # Optional: LAN Optimized ADB server thread
+        lan_thread.start()
+
+    backend = BackendThread()
+    backend.loaded.connect(backend_loaded)
+    backend.start()
+
     # Tunggu hingga GUI dimatikan
     exit_code = qt_app.exec_()
     logger.info("GUI application closed. Shutting down servers.")
-    sys.exit(exit_code)
\ No newline at end of file
+    for thread in server_threads:
+        thread.stop()
+        thread.wait(2000)
+    sys.exit(exit_code)
@@ -0,0 +1,24 @@
+import json
+import os
+import tempfile
+
+# Fields refreshed by the status poller; they are not saved with a device
+VOLATILE_FIELDS = ('status', 'response_time', 'power_status')
+
+
+def atomic_write_json(path, data, **dump_kwargs):
+    """Write JSON to a temporary file next to `path` and rename it over `path`"""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f, **dump_kwargs)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except Exception:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
@@ -0,0 +1,141 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class StatusPoller:
+    """
+    Polls the status of many devices from a single scheduler thread.
+
+    Due probes are kept in a heap ordered by due time and handed to a bounded
+    worker pool. Each device has a generation number, so removing a device
+    or changing its IP drops its pending probe instead of leaving a thread
+    behind that keeps polling a stale entry.
+    """
+
+    def __init__(self, probe, update, interval, max_workers=16, name='poller'):
+        self.probe = probe
+        self.update = update
+        self.interval = interval
+        self.max_workers = max_workers
+        self.name = name
+        self.heap = []
+        self.generations = {}
+        self.in_flight = set()
+        self.seq = itertools.count()
+        self.cond = threading.Condition()
+        self.slots = threading.BoundedSemaphore(max_workers)
+        self.executor = None
+        self.thread = None
+        self.running = False
+        self.probes = 0
+        self.errors = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.total_lag = 0.0
+
+    def add(self, key, delay=0):
+        """Start polling a device, or restart it if it is already polled"""
+        with self.cond:
+            generation = self.generations.get(key, 0) + 1
+            self.generations[key] = generation
+            heapq.heappush(self.heap, (time.monotonic() + delay, next(self.seq), key, generation))
+            self.cond.notify()
+
+    def remove(self, key):
+        """Stop polling a device; a probe already running is discarded"""
+        with self.cond:
+            self.generations.pop(key, None)
+
+    def start(self):
+        with self.cond:
+            if self.running:
+                return
+            self.running = True
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=self.name)
+        self.thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self.thread.start()
+        logger.info(f"Started {self.name} with {self.max_workers} workers, interval {self.interval}s")
+
+    def stop(self):
+        with self.cond:
+            if not self.running:
+                return
+            self.running = False
+            self.cond.notify_all()
+        self.thread.join()
+        self.executor.shutdown(wait=True)
+        logger.info(f"Stopped {self.name}")
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while self.running and not self._due():
+                    timeout = self.heap[0][0] - time.monotonic() if self.heap else None
+                    self.cond.wait(timeout)
+                if not self.running:
+                    return
+                due, _, key, generation = heapq.heappop(self.heap)
+                if self.generations.get(key) != generation:
+                    continue
+                self.in_flight.add(key)
+
+            self.slots.acquire()
+            if not self.running:
+                self.slots.release()
+                return
+            self.executor.submit(self._probe, key, generation, due)
+
+    def _due(self):
+        return bool(self.heap) and self.heap[0][0] <= time.monotonic()
+
+    def _probe(self, key, generation, due):
+        started = time.monotonic()
+        lag = started - due
+        failed = False
+        try:
+            result = self.probe(key)
+            with self.cond:
+                current = self.generations.get(key) == generation
+            if current:
+                self.update(key, result)
+        except Exception as e:
+            failed = True
+            logger.error(f"{self.name}: error probing {key}: {str(e)}")
+        finally:
+            self.slots.release()
+            with self.cond:
+                self.probes += 1
+                self.errors += failed
+                self.last_lag = lag
+                self.max_lag = max(self.max_lag, lag)
+                self.total_lag += lag
+                self.in_flight.discard(key)
+                if self.running and self.generations.get(key) == generation:
+                    next_due = max(due + self.interval, time.monotonic())
+                    heapq.heappush(self.heap, (next_due, next(self.seq), key, generation))
+                    self.cond.notify()
+
+    def stats(self):
+        with self.cond:
+            now = time.monotonic()
+            overdue = [now - entry[0] for entry in self.heap
+                       if self.generations.get(entry[2]) == entry[3] and entry[0] <= now]
+            return {
+                'running': self.running,
+                'devices': len(self.generations),
+                'workers': self.max_workers,
+                'in_flight': len(self.in_flight),
+                'probes': self.probes,
+                'errors': self.errors,
+                'overdue': len(overdue),
+                'behind_ms': round(max(overdue, default=0.0) * 1000, 1),
+                'last_lag_ms': round(self.last_lag * 1000, 1),
+                'max_lag_ms': round(self.max_lag * 1000, 1),
+                'avg_lag_ms': round(self.total_lag / self.probes * 1000, 1) if self.probes else 0.0,
+            }
@@ -0,0 +1,145 @@
+import logging
+import threading
+import time
+
+from change_feed import ChangeFeed
+
+logger = logging.getLogger(__name__)
+
+STATUS_DEFAULTS = {'status': 'Checking', 'response_time': 'N/A'}
+# Changes on every probe; published only along with a change that matters to clients
+UNVERSIONED_FIELDS = ('response_time',)
+
+
+class DeviceRegistry:
+    """
+    The devices of every transport, keyed by IP.
+
+    Each device records the transport ('adb' or 'cec') that controls it.
+    Every change is written to the store as a single row and published to
+    the change feed, together with whatever `extra(ip)` adds (queue depth,
+    breaker state). The status is stored when it changes, not on every probe,
+    and a new round-trip time alone updates the feed without a new version.
+    """
+
+    def __init__(self, store, extra=None):
+        self.store = store
+        self.extra = extra
+        self.devices = {}
+        self.lock = threading.RLock()
+        self.feed = ChangeFeed(unversioned=UNVERSIONED_FIELDS)
+
+    def load(self):
+        """Read the devices from the store"""
+        devices = self.store.devices()
+        for info in devices.values():
+            info.update(STATUS_DEFAULTS)
+        with self.lock:
+            self.devices = devices
+        for ip in devices:
+            self.publish(ip)
+        logger.info(f"Loaded {len(devices)} devices from {self.store.path}")
+        return list(devices)
+
+    def copy(self):
+        with self.lock:
+            return {ip: dict(info) for ip, info in self.devices.items()}
+
+    def __contains__(self, ip):
+        return ip in self.devices
+
+    def __len__(self):
+        return len(self.devices)
+
+    def get(self, ip):
+        with self.lock:
+            device = self.devices.get(ip)
+            return dict(device) if device is not None else None
+
+    def transport(self, ip):
+        device = self.devices.get(ip)
+        return device['transport'] if device is not None else None
+
+    def ips(self, transport=None):
+        with self.lock:
+            return [ip for ip, info in self.devices.items() if transport is None or info['transport'] == transport]
+
+    def add(self, ip, name, transport, **fields):
+        """Register a device; returns it, or None if the IP is taken"""
+        with self.lock:
+            if ip in self.devices:
+                return None
+            device = self.devices[ip] = {**fields, 'name': name, 'transport': transport, **STATUS_DEFAULTS}
+            device.setdefault('added_on', time.strftime('%Y-%m-%d %H:%M:%S'))
+            self.store.save_device(ip, device)
+        self.publish(ip)
+        logger.info(f"Added new {transport} device: {name} ({ip})")
+        return dict(device)
+
+    def remove(self, ip):
+        """Forget a device; returns it, or None if it is unknown"""
+        with self.lock:
+            device = self.devices.pop(ip, None)
+            if device is not None:
+                self.store.delete_device(ip)
+        if device is None:
+            return None
+        self.feed.remove(ip)
+        logger.info(f"Removed device: {device['name']} ({ip})")
+        return device
+
+    def edit(self, old_ip, name=None, new_ip=None, **fields):
+        """
+        Rename, move or reconfigure a device; returns it, or None if it is
+        unknown. Raises KeyError if `new_ip` belongs to another device.
+        """
+        new_ip = new_ip or old_ip
+        with self.lock:
+            if old_ip not in self.devices:
+                return None
+            if new_ip != old_ip and new_ip in self.devices:
+                raise KeyError(new_ip)
+            device = self.devices.pop(old_ip)
+            if name:
+                device['name'] = name
+            device.update(fields)
+            self.devices[new_ip] = device
+            self.store.move_device(old_ip, new_ip, device)
+        if new_ip != old_ip:
+            self.feed.remove(old_ip)
+        self.publish(new_ip)
+        logger.info(f"Edited device: {device['name']} ({new_ip})")
+        return dict(device)
+
+    def update_status(self, ip, status):
+        """Apply a probe result to a device that is still registered"""
+        with self.lock:
+            device = self.devices.get(ip)
+            if device is None:
+                return False
+            changed = device.get('status') != status['status']
+            device.update(status)
+            if changed:
+                self.store.update_status(ip, status['status'])
+        self.publish(ip)
+        return True
+
+    def publish(self, ip):
+        """Push the current state of a device, or its removal, to the change feed"""
+        with self.lock:
+            device = self.devices.get(ip)
+            device = dict(device) if device is not None else None
+        if device is None:
+            self.feed.remove(ip)
+        else:
+            self.feed.publish(ip, dict(device, **self.extra(ip)) if self.extra else device)
+
+    def snapshot(self, transport=None):
+        return self.feed.snapshot({'transport': transport} if transport else None)
+
+    def stats(self):
+        with self.lock:
+            counts = {}
+            for info in self.devices.values():
+                counts[info['transport']] = counts.get(info['transport'], 0) + 1
+        return {'devices': counts}
@@ -0,0 +1,233 @@
+import asyncio
+import logging
+import threading
+import time
+import uuid
+
+from jobs import jobs
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORTS = (9740, 80)
+DEFAULT_TIMEOUT = 0.5
+DEFAULT_CONCURRENCY = 256
+
+
+def valid_host_range(start, end):
+    """Whether start..end are host numbers of a /24, in order"""
+    return (all(isinstance(value, int) and not isinstance(value, bool) for value in (start, end))
+            and 1 <= start <= end <= 254)
+
+def subnet_hosts(subnet, start, end):
+    """List the addresses subnet.start .. subnet.end"""
+    return [f"{subnet}.{i}" for i in range(start, end + 1)]
+
+
+async def probe_port(ip, port, timeout):
+    """Open a TCP connection and return the connect time in ms, or None"""
+    started = time.perf_counter()
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(ip, port), timeout)
+    except (OSError, asyncio.TimeoutError):
+        return None
+    rtt_ms = (time.perf_counter() - started) * 1000
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except OSError:
+        pass
+    return rtt_ms
+
+
+async def probe_host(ip, ports, timeout):
+    """
+    Probe all ports of a host at once.
+
+    Returns the first port in `ports` order that accepted a connection,
+    with its RTT, or None when the host did not answer on any of them.
+    """
+    rtts = await asyncio.gather(*(probe_port(ip, port, timeout) for port in ports))
+    for port, rtt_ms in zip(ports, rtts):
+        if rtt_ms is not None:
+            return {"ip": ip, "port": port, "rtt_ms": round(rtt_ms, 2)}
+    return None
+
+
+async def _scan(hosts, ports, timeout, concurrency, on_result, confirm, cancel):
+    semaphore = asyncio.Semaphore(concurrency)
+    found = []
+
+    async def scan_one(ip):
+        async with semaphore:
+            if cancel is not None and cancel.is_set():
+                return
+            try:
+                result = await probe_host(ip, ports, timeout)
+                if result is not None and confirm is not None:
+                    result = await confirm(result, timeout)
+            except Exception as e:
+                logger.debug(f"Error scanning {ip}: {str(e)}")
+                result = None
+        if result is not None:
+            found.append(result)
+        if on_result is not None:
+            on_result(ip, result)
+
+    await asyncio.gather(*(scan_one(ip) for ip in hosts))
+    return found
+
+
+def scan_hosts(hosts, ports=DEFAULT_PORTS, timeout=DEFAULT_TIMEOUT,
+               concurrency=DEFAULT_CONCURRENCY, on_result=None, confirm=None, cancel=None):
+    """
+    Scan many hosts with non-blocking connects and return the ones that answered.
+
+    Up to `concurrency` hosts are probed at the same time, so a /24 takes
+    roughly `timeout` times 256 / concurrency seconds. `on_result(ip, result)`
+    is called for every host as soon as it has been probed. An optional
+    coroutine `confirm(result, timeout)` can check an open port further; it
+    returns the (possibly extended) result, or None to drop the host. Setting
+    the `cancel` event stops the scan once the probes in flight finish. Runs
+    its own event loop, so call it from a worker thread.
+    """
+    started = time.perf_counter()
+    found = asyncio.run(_scan(list(hosts), tuple(ports), timeout, concurrency,
+                              on_result, confirm, cancel))
+    found.sort(key=lambda result: tuple(int(part) for part in result['ip'].split('.')))
+    logger.info(f"Scanned {len(hosts)} hosts in {time.perf_counter() - started:.2f}s, {len(found)} answered")
+    return found
+
+
+class ScanJob:
+    """A running or finished scan, with its progress and the hosts found so far"""
+
+    def __init__(self, kind, key, hosts, params):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.key = key
+        self.hosts = hosts
+        self.params = params
+        self.state = 'queued'
+        self.error = None
+        self.probed = 0
+        self.found = []
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.cancel_event = threading.Event()
+        self.lock = threading.Lock()
+
+    def record(self, ip, result):
+        with self.lock:
+            self.probed += 1
+            if result is not None:
+                self.found.append(result)
+
+    def running(self):
+        return self.state in ('queued', 'running')
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def to_dict(self, include_results=True):
+        with self.lock:
+            data = {
+                'id': self.id,
+                'kind': self.kind,
+                'state': self.state,
+                'params': self.params,
+                'done': self.probed,
+                'total': len(self.hosts),
+                'probed': self.probed,
+                'found_count': len(self.found),
+                'created_at': self.created_at,
+                'started_at': self.started_at,
+                'finished_at': self.finished_at,
+                'queue_ms': round(((self.started_at or self.finished_at or time.time()) - self.created_at) * 1000, 1),
+                'run_ms': round(((self.finished_at or time.time()) - self.started_at) * 1000, 1)
+                          if self.started_at else None,
+                'duration': round((self.finished_at or time.time()) - self.started_at, 2)
+                            if self.started_at else None,
+            }
+            if self.error:
+                data['error'] = self.error
+            if include_results:
+                data['devices'] = list(self.found)
+        return data
+
+
+class ScanJobManager:
+    """
+    Runs scans as jobs that can be followed, cancelled and shared.
+
+    Starting a scan whose key (kind, range and ports) matches a scan that is
+    still running returns the running job instead of starting a second one.
+    Only the most recent `keep` jobs are remembered.
+    """
+
+    def __init__(self, keep=20):
+        self.keep = keep
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    def start(self, kind, hosts, params, key=None, on_result=None, on_complete=None, **scan_kwargs):
+        """Start a scan job, or join a running one; returns (job, started)"""
+        key = (kind,) + tuple(key or ())
+        with self.lock:
+            for job in self.jobs.values():
+                if job.key == key and job.running():
+                    return job, False
+            job = ScanJob(kind, key, hosts, params)
+            self.jobs[job.id] = job
+            while len(self.jobs) > self.keep:
+                oldest = next((j for j in self.jobs.values() if not j.running()), None)
+                if oldest is None:
+                    break
+                del self.jobs[oldest.id]
+
+        def record(ip, result):
+            job.record(ip, result)
+            if on_result is not None:
+                on_result(ip, result)
+
+        def run():
+            job.state = 'running'
+            job.started_at = time.time()
+            try:
+                scan_hosts(hosts, on_result=record, cancel=job.cancel_event, **scan_kwargs)
+                job.state = 'cancelled' if job.cancel_event.is_set() else 'completed'
+            except Exception as e:
+                job.state = 'failed'
+                job.error = str(e)
+                logger.error(f"Scan job {job.id} failed: {str(e)}")
+            job.finished_at = time.time()
+            if on_complete is not None:
+                try:
+                    on_complete(job)
+                except Exception as e:
+                    logger.error(f"Error completing scan job {job.id}: {str(e)}")
+
+        # Scans share the bounded 'scan' executor and are listed under /jobs
+        jobs.track(job)
+        jobs.executor('scan').submit(run)
+        logger.info(f"Started scan job {job.id} ({kind}) for {len(hosts)} hosts")
+        return job, True
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def latest(self, kind):
+        with self.lock:
+            jobs = [job for job in self.jobs.values() if job.kind == kind]
+        return max(jobs, key=lambda job: job.created_at, default=None)
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is not None and job.running():
+            job.cancel()
+            logger.info(f"Cancelling scan job {job_id}")
+        return job
+
+
+scan_jobs = ScanJobManager()
@@ -0,0 +1,631 @@
+import json
+import logging
+import os
+import shlex
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+
+from flask import Blueprint, Flask, Response, request, jsonify
+
+from adb_client import AdbError
+from adb_pool import AdbSessionError
+from breaker import CircuitBreakers
+from export import DATASETS, EXPORT_CHUNK, MAX_EXPORT_CHUNK, csv_chunks, decode_cursor, jsonl_chunks, parse_time
+from command_queue import CommandQueue, PRIORITY_HIGH, PRIORITY_NORMAL
+from jobs import jobs, JobError
+from ledger import Reports
+from poller import StatusPoller
+from registry import DeviceRegistry
+from snapshot import snapshot_response
+from store import store
+from timer_engine import TimerEngine
+from transports import AdbTransport, CecTransport, countdown_command
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL = 5
+BATCH_CONCURRENCY = 32
+BATCH_TIMEOUT = 10
+DEFAULT_CUSTOM_TEXT = "Waktu rental mu sudah habis, silahkan ke kasir jika ingin menambah waktu!"
+
+
+def device_extra(ip):
+    # timer_due is the epoch due time of the device's earliest pending timer, for live countdowns
+    return {'queue_depth': command_queue.depth(ip), 'breaker': breakers.describe(ip),
+            'timer_due': timer_engine.due(ip)}
+
+# All devices, of every transport, in one registry and one change feed
+registry = DeviceRegistry(store, extra=device_extra)
+feed = registry.feed
+
+# Fast-fail commands to devices that stopped answering
+breakers = CircuitBreakers(on_change=registry.publish, name='breakers')
+
+def record_result(ip, ok):
+    if ok:
+        breakers.record_success(ip)
+    else:
+        breakers.record_failure(ip)
+
+# Command failures only say something about the TV for ADB; a CEC failure
+# comes from the local cec-client, so CEC breakers are fed by the poller alone
+adb = AdbTransport(on_result=record_result)
+cec = CecTransport()
+TRANSPORTS = {adb.name: adb, cec.name: cec}
+
+def transport_of(ip):
+    return TRANSPORTS.get(registry.transport(ip))
+
+def probe_device(ip):
+    transport = transport_of(ip)
+    if transport is None:
+        return {'status': 'Error', 'response_time': 'N/A'}
+    return transport.probe(ip)
+
+def update_device_status(ip, status):
+    if not registry.update_status(ip, status):
+        return
+    if status['status'] == 'Online':
+        breakers.record_success(ip)
+    elif status['status'] == 'Offline':
+        breakers.record_failure(ip)
+
+# Single scheduler-driven poller for every device
+poller = StatusPoller(probe_device, update_device_status, interval=POLL_INTERVAL, name='poller')
+
+def fire_timer(timer):
+    """Send the action of an expired timer"""
+    ip = timer['ip']
+    if ip not in registry:
+        logger.warning(f"Timer {timer['id']} fired for unknown device {ip}")
+        return
+    if timer['kind'] == 'countdown':
+        logger.info(f"Rental time on TV {ip} has run out")
+        return
+    if command_queue.run(ip, timer['action'], priority=PRIORITY_HIGH):
+        logger.info(f"Timer executed '{timer['action']}' command on {ip}")
+    else:
+        logger.error(f"Timer failed to execute '{timer['action']}' command on {ip}")
+
+# Single timer engine for every device, backed by the store
+timer_engine = TimerEngine(fire_timer, store, name='timers', on_change=registry.publish)
+reports = Reports(store)
+
+def send_action(ip, action, count):
+    transport = transport_of(ip)
+    return transport is not None and transport.send(ip, action, count)
+
+def action_priority(ip, action):
+    transport = transport_of(ip)
+    return PRIORITY_HIGH if transport is not None and action in transport.priority else PRIORITY_NORMAL
+
+# One queue per device so commands to a device never run concurrently. Each
+# transport coalesces its own keys; a key that is coalescable on one and sent
+# to the other is still correct, since both send `count` repeats.
+command_queue = CommandQueue(send_action, coalesce=set(adb.coalesce) | set(cec.coalesce),
+                             on_change=registry.publish, name='commands')
+
+batch_executor = ThreadPoolExecutor(max_workers=BATCH_CONCURRENCY, thread_name_prefix='batch')
+
+_started = False
+_start_lock = threading.Lock()
+
+def start():
+    """Load the devices and start the poller and timers; safe to call more than once"""
+    global _started
+    with _start_lock:
+        if _started:
+            return
+        _started = True
+    for ip in registry.load():
+        poller.add(ip)
+    poller.start()
+    timer_engine.start()
+
+# -------------------- Device operations ---------------------
+
+def add_device(ip, name, transport, **fields):
+    """Register and start polling a device; returns it, or None if the IP is taken"""
+    device = registry.add(ip, name, transport, **fields)
+    if device is not None:
+        poller.add(ip)
+        poller.start()
+    return device
+
+def remove_device(ip):
+    device = registry.remove(ip)
+    if device is None:
+        return None
+    poller.remove(ip)
+    timer_engine.cancel_device(ip)
+    command_queue.remove(ip)
+    breakers.remove(ip)
+    TRANSPORTS[device['transport']].forget(ip)
+    return device
+
+def edit_device(old_ip, name=None, new_ip=None, **fields):
+    """Raises KeyError if `new_ip` belongs to another device"""
+    old_transport = transport_of(old_ip)
+    device = registry.edit(old_ip, name, new_ip, **fields)
+    new_ip = new_ip or old_ip
+    if device is not None and (new_ip != old_ip or device['transport'] != old_transport.name):
+        poller.remove(old_ip)
+        poller.add(new_ip)
+        if new_ip != old_ip:
+            timer_engine.reassign(old_ip, new_ip)
+        command_queue.remove(old_ip)
+        breakers.remove(old_ip)
+        old_transport.forget(old_ip)
+        registry.publish(new_ip)
+    return device
+
+def validate_action(ip, action):
+    """An error message if `action` is not supported by the transport of `ip`"""
+    transport = transport_of(ip)
+    if transport is None:
+        return "Device not found"
+    if action not in transport.actions:
+        return "Invalid action"
+    return None
+
+def send(ip, action, timeout=None):
+    """Queue an action for a device and wait for it; True, False or None on timeout"""
+    return command_queue.run(ip, action, priority=action_priority(ip, action), timeout=timeout)
+
+def batch_send(ip, action, timeout=BATCH_TIMEOUT, transport=None):
+    """Send an action to one device of a batch and time it; `transport` limits the batch to one kind"""
+    started = time.monotonic()
+    if transport is not None and registry.transport(ip) != transport:
+        # The former per-transport servers only knew devices of their own transport
+        error = "Device not found"
+    else:
+        error = validate_action(ip, action)
+    if error:
+        result = {"status": "error", "message": error}
+    elif not breakers.allow(ip):
+        result = {"status": "error", "message": "Device is offline"}
+    elif send(ip, action, timeout):
+        result = {"status": "success", "message": f"{action} command sent successfully"}
+    else:
+        result = {"status": "error", "message": f"Failed to send {action} command"}
+    result['latency_ms'] = round((time.monotonic() - started) * 1000, 1)
+    return result
+
+def submit_batch(ips, action, timeout=BATCH_TIMEOUT, transport=None):
+    return {batch_executor.submit(batch_send, ip, action, timeout, transport): ip for ip in ips}
+
+def run_batch(ips, action, timeout=BATCH_TIMEOUT, job=None, transport=None):
+    """Send `action` to many devices at once; reports progress to `job` if given"""
+    started = time.monotonic()
+    futures = submit_batch(ips, action, timeout, transport)
+    if job is not None:
+        for future in futures:
+            future.add_done_callback(lambda future: job.advance())
+    # Queued sends wait for a free worker, so allow one extra deadline per wave
+    waves = -(-len(futures) // BATCH_CONCURRENCY)
+    wait(futures, timeout=timeout * waves + 1)
+
+    results = {}
+    for future, ip in futures.items():
+        if future.done():
+            results[ip] = future.result()
+        else:
+            future.cancel()
+            results[ip] = {"status": "error", "message": "Timed out"}
+
+    succeeded = sum(1 for result in results.values() if result['status'] == 'success')
+    logger.info(f"Batch {action} sent to {len(results)} devices, {succeeded} succeeded")
+    return {
+        "results": {ip: results[ip] for ip in ips},
+        "total_ms": round((time.monotonic() - started) * 1000, 1)
+    }
+
+def stream_batch(ips, action, timeout=BATCH_TIMEOUT, transport=None):
+    """NDJSON response with one line per device as soon as its command completes"""
+    started = time.monotonic()
+    futures = submit_batch(ips, action, timeout, transport)
+
+    def generate():
+        for future in as_completed(futures):
+            yield json.dumps({"ip": futures[future], **future.result()}) + "\n"
+        total_ms = round((time.monotonic() - started) * 1000, 1)
+        logger.info(f"Batch {action} sent to {len(futures)} devices in {total_ms} ms")
+        yield json.dumps({"done": True, "total_ms": total_ms}) + "\n"
+    return Response(generate(), mimetype='application/x-ndjson')
+
+def start_countdown(ip, seconds, custom_text):
+    """Show the countdown on the TV and schedule its expiry; runs as a 'tv_timer' job"""
+    command = countdown_command(seconds, custom_text)
+    logger.debug(f"Executing ADB command: {command}")
+    if adb.run(ip, command) is None:
+        logger.error(f"Failed to start timer on TV {ip}")
+        raise JobError("Failed to start timer on TV")
+    timer = timer_engine.schedule(ip, None, seconds, kind='countdown', custom_text=custom_text)
+    logger.info(f"Started timer on TV {ip} for {seconds} seconds with custom text: {custom_text}")
+    return {"message": f"Timer started on TV for {seconds} seconds with custom text", "timer": timer}
+
+def submit_countdown(ip, seconds, custom_text):
+    return jobs.submit('tv_timer', lambda job: start_countdown(ip, seconds, custom_text),
+                       params={'ip': ip, 'seconds': seconds})
+
+def restart_countdown(ip, timer_id):
+    """Show an extended timer's new remaining time on the TV; runs as a 'tv_timer' job"""
+    timer = timer_engine.get(timer_id)
+    if timer is None:
+        raise JobError("Timer no longer pending")
+    # Computed when the job runs, so time spent queued is not shown on the TV
+    remaining = int(timer['due_at'] - time.time())
+    if adb.run(ip, countdown_command(remaining, timer.get('custom_text', ''))) is None:
+        logger.error(f"Failed to update countdown on TV {ip}")
+        raise JobError("Failed to update countdown on TV")
+    return {"message": f"Countdown on TV restarted with {remaining} seconds", "timer": timer}
+
+def submit_countdown_restart(ip, timer_id):
+    return jobs.submit('tv_timer', lambda job: restart_countdown(ip, timer_id),
+                       params={'ip': ip, 'timer_id': timer_id})
+
+def stream_file(job, ip, filename, temp_filepath, filepath):
+    """Push an uploaded file to the TV and open it; runs as a 'stream' job"""
+    # Kirim file ke TV melalui protokol sync: adb server
+    try:
+        adb.push(ip, temp_filepath, filepath)
+    except (AdbError, AdbSessionError) as e:
+        logger.error(f"Failed to push {filename} to {ip}: {e}")
+        raise JobError("Failed to transfer file to TV")
+    finally:
+        # Hapus file temporary di server
+        os.remove(temp_filepath)
+    job.advance()
+
+    # Mulai pemutaran menggunakan aplikasi video default
+    stream_command = f"am start -a android.intent.action.VIEW -d {shlex.quote('file://' + filepath)} -t 'video/*'"
+    if adb.run(ip, stream_command) is None:
+        logger.error(f"Failed to start streaming {filename} to {ip}")
+        raise JobError("Failed to start streaming")
+    job.advance()
+    logger.info(f"Successfully started streaming {filename} to {ip}")
+    return {"message": f"Started streaming {filename}"}
+
+def submit_stream(ip, file):
+    """Save an uploaded file and push it to the TV as a 'stream' job"""
+    filename = file.filename
+    # Gunakan direktori yang dapat diakses oleh TV
+    filepath = os.path.join('/sdcard/Download', filename)
+    # Simpan file ke server terlebih dahulu; the upload is done within the request
+    fd, temp_filepath = tempfile.mkstemp(suffix='_' + os.path.basename(filename))
+    os.close(fd)
+    file.save(temp_filepath)
+    return jobs.submit('stream', lambda job: stream_file(job, ip, filename, temp_filepath, filepath),
+                       params={'ip': ip, 'filename': filename}, total=2)
+
+def valid_seconds(seconds):
+    return bool(seconds) and isinstance(seconds, (int, float)) and seconds > 0
+
+def offline_response(ip, message="Device is offline"):
+    return jsonify({"error": message, "breaker": breakers.describe(ip)}), 503
+
+# -------------------- API Endpoints ---------------------
+
+api = Blueprint('api', __name__)
+
+@api.route('/devices', methods=['GET'])
+def list_devices():
+    """All devices, or those of one transport, from the pre-encoded snapshot (ETag, gzip)"""
+    return snapshot_response(registry.snapshot(request.args.get('transport')))
+
+@api.route('/devices', methods=['POST'])
+def create_device():
+    data = request.json
+    name = data.get('name')
+    ip = data.get('ip')
+    transport = data.get('transport', 'adb')
+
+    if not name or not ip:
+        return jsonify({"error": "Name and IP are required"}), 400
+    if transport not in TRANSPORTS:
+        return jsonify({"error": "Invalid transport", "transports": list(TRANSPORTS)}), 400
+    if not isinstance(data.get('group', ''), str):
+        return jsonify({"error": "Invalid group"}), 400
+
+    device = add_device(ip, name, transport, group=data.get('group', ''))
+    if device is None:
+        return jsonify({"error": "Device with this IP already exists"}), 400
+    return jsonify({"message": "Device added successfully", "device": device}), 200
+
+@api.route('/devices/<ip>', methods=['PUT'])
+def update_device(ip):
+    data = request.json
+    fields = {}
+    if 'transport' in data:
+        if data['transport'] not in TRANSPORTS:
+            return jsonify({"error": "Invalid transport", "transports": list(TRANSPORTS)}), 400
+        fields['transport'] = data['transport']
+    if 'group' in data:
+        # Groups are free-form labels for batch selection; '' clears it
+        if not isinstance(data['group'], str):
+            return jsonify({"error": "Invalid group"}), 400
+        fields['group'] = data['group']
+    try:
+        device = edit_device(ip, data.get('name'), data.get('ip'), **fields)
+    except KeyError:
+        return jsonify({"error": "New IP already exists"}), 400
+    if device is None:
+        return jsonify({"error": "Device not found"}), 404
+    return jsonify({"message": "Device edited successfully", "device": device}), 200
+
+@api.route('/devices/<ip>', methods=['DELETE'])
+def delete_device(ip):
+    if remove_device(ip) is None:
+        return jsonify({"error": "Device not found"}), 404
+    return jsonify({"message": "Device removed successfully"}), 200
+
+@api.route('/devices/<ip>/command', methods=['POST'])
+def device_command(ip):
+    action = request.json.get('action')
+    error = validate_action(ip, action)
+    if error == "Device not found":
+        return jsonify({"error": error}), 404
+    if error:
+        return jsonify({"error": error, "available_actions": transport_of(ip).actions}), 400
+    if not breakers.allow(ip):
+        return offline_response(ip)
+
+    if send(ip, action):
+        logger.info(f"Successfully sent {action} command to {ip}")
+        return jsonify({"message": f"{action} command sent successfully"}), 200
+    logger.error(f"Failed to send {action} command to {ip}")
+    return jsonify({"error": f"Failed to send {action} command"}), 500
+
+@api.route('/devices/<ip>/countdown', methods=['POST'])
+def device_countdown(ip):
+    data = request.json
+    seconds = data.get('seconds')
+    if ip not in registry:
+        return jsonify({"error": "Device not found"}), 404
+    if registry.transport(ip) != adb.name:
+        return jsonify({"error": "Countdown needs an ADB device"}), 400
+    if not valid_seconds(seconds):
+        return jsonify({"error": "Invalid time value"}), 400
+    if not breakers.allow(ip):
+        return offline_response(ip)
+
+    job = submit_countdown(ip, seconds, data.get('custom_text', DEFAULT_CUSTOM_TEXT))
+    return jsonify({"message": f"Starting timer on TV for {seconds} seconds", "job_id": job.id,
+                    "job": job.to_dict()}), 202
+
+@api.route('/devices/<ip>/stream', methods=['POST'])
+def device_stream(ip):
+    if ip not in registry:
+        return jsonify({"error": "Device not found"}), 404
+    if registry.transport(ip) != adb.name:
+        return jsonify({"error": "Streaming needs an ADB device"}), 400
+    if not breakers.allow(ip):
+        return offline_response(ip)
+    file = request.files.get('file')
+    if file is None or file.filename == '':
+        return jsonify({"error": "No selected file"}), 400
+
+    job = submit_stream(ip, file)
+    return jsonify({"message": f"Streaming {file.filename} queued", "job_id": job.id,
+                    "job": job.to_dict()}), 202
+
+@api.route('/batch', methods=['POST'])
+def batch():
+    """Send one action to many devices, of any transport; sync, streamed (NDJSON) or as a job"""
+    data = request.json
+    ips = list(dict.fromkeys(data.get('ips', [])))
+    action = data.get('action')
+    timeout = data.get('timeout', BATCH_TIMEOUT)
+
+    if not ips:
+        return jsonify({"error": "No devices specified"}), 400
+    if not action:
+        return jsonify({"error": "Invalid action"}), 400
+    if not isinstance(timeout, (int, float)) or timeout <= 0:
+        return jsonify({"error": "Invalid timeout value"}), 400
+
+    if data.get('async'):
+        job = jobs.submit('batch', lambda job: run_batch(ips, action, timeout, job),
+                          params={'ips': ips, 'action': action}, total=len(ips))
+        return jsonify({"message": f"Batch {action} queued", "job_id": job.id, "job": job.to_dict()}), 202
+    if data.get('stream'):
+        return stream_batch(ips, action, timeout)
+    return jsonify(run_batch(ips, action, timeout)), 200
+
+@api.route('/set_timer', methods=['POST'])
+def set_timer():
+    """Set a timer to send an action after a delay; CEC clients may still say 'command'"""
+    data = request.json
+    ip = data.get('ip')
+    action = data.get('action') or data.get('command')
+    seconds = data.get('seconds')
+
+    error = validate_action(ip, action)
+    if error == "Device not found":
+        return jsonify({"error": error}), 404
+    if error:
+        return jsonify({"error": error, "available_actions": transport_of(ip).actions}), 400
+    if not valid_seconds(seconds):
+        return jsonify({"error": "Invalid time value"}), 400
+
+    timer = timer_engine.schedule(ip, action, seconds)
+    return jsonify({"message": f"Timer set for {seconds} seconds to {action}", "timer": timer}), 200
+
+@api.route('/timers', methods=['GET'])
+def list_timers():
+    """List pending timers, optionally for one device"""
+    return jsonify({"timers": timer_engine.list(request.args.get('ip'))}), 200
+
+@api.route('/cancel_timer', methods=['POST'])
+def cancel_timer():
+    timer = timer_engine.cancel(request.json.get('id'))
+    if timer is None:
+        return jsonify({"error": "Timer not found"}), 404
+    return jsonify({"message": "Timer cancelled", "timer": timer}), 200
+
+@api.route('/extend_timer', methods=['POST'])
+def extend_timer():
+    data = request.json
+    seconds = data.get('seconds')
+    if not valid_seconds(seconds):
+        return jsonify({"error": "Invalid time value"}), 400
+
+    # A countdown shown on an unreachable TV could not be restarted; refuse before extending it
+    timer = timer_engine.get(data.get('id'))
+    if timer is not None and timer['kind'] == 'countdown' and not breakers.allow(timer['ip']):
+        return offline_response(timer['ip'])
+
+    timer = timer_engine.extend(data.get('id'), seconds)
+    if timer is None:
+        return jsonify({"error": "Timer not found"}), 404
+
+    response = {"message": f"Timer extended by {seconds} seconds", "timer": timer}
+    if timer['kind'] == 'countdown':
+        job = submit_countdown_restart(timer['ip'], timer['id'])
+        response.update(job_id=job.id, job=job.to_dict())
+    return jsonify(response), 200
+
+def feed_filter():
+    transport = request.args.get('transport')
+    return {'transport': transport} if transport else None
+
+@api.route('/changes', methods=['GET'])
+def get_changes():
+    """Long-poll for devices changed after version `since`, waiting up to `timeout` seconds"""
+    version, changes, reset = feed.changes(request.args.get('since', type=int),
+                                           request.args.get('timeout', 0, type=float), feed_filter())
+    return jsonify({"version": version, "reset": reset, "changes": changes}), 200
+
+@api.route('/events', methods=['GET'])
+def get_events():
+    """Stream device changes as Server-Sent Events"""
+    since = request.args.get('since', type=int) or request.headers.get('Last-Event-ID', type=int)
+    return Response(feed.stream(since, match=feed_filter()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache'})
+
+@api.route('/transports', methods=['GET'])
+def list_transports():
+    return jsonify({name: {"actions": transport.actions} for name, transport in TRANSPORTS.items()}), 200
+
+@api.route('/jobs', methods=['GET'])
+def list_jobs():
+    """List background jobs, optionally filtered by kind and state"""
+    found = jobs.list(request.args.get('kind'), request.args.get('state'))
+    return jsonify({"jobs": [job.to_dict(include_results=False) for job in found]}), 200
+
+@api.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.to_dict()), 200
+
+@api.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    job = jobs.cancel(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify({"message": "Job cancelled", "job": job.to_dict(include_results=False)}), 200
+
+@api.route('/sessions', methods=['GET'])
+def list_sessions():
+    """Rental sessions, newest first, optionally for one device and time range"""
+    sessions = store.sessions(request.args.get('ip'), request.args.get('since', type=float),
+                              request.args.get('until', type=float), request.args.get('limit', 100, type=int))
+    return jsonify({"sessions": sessions}), 200
+
+@api.route('/reports/daily', methods=['GET'])
+def daily_report():
+    """Revenue and occupancy per day (YYYY-MM-DD, inclusive)"""
+    rows = reports.daily(request.args.get('since'), request.args.get('until'), request.args.get('ip'))
+    return jsonify({"days": rows}), 200
+
+@api.route('/reports/hourly', methods=['GET'])
+def hourly_report():
+    """Revenue and occupancy per hour of one day"""
+    day = request.args.get('day') or time.strftime('%Y-%m-%d')
+    return jsonify({"day": day, "hours": reports.hourly(day, request.args.get('ip'))}), 200
+
+@api.route('/reports/tvs', methods=['GET'])
+def tv_report():
+    """Revenue and usage per TV, over all time or between two days"""
+    return jsonify({"tvs": reports.tvs(request.args.get('since'), request.args.get('until'))}), 200
+
+@api.route('/reports/events', methods=['GET'])
+def ledger_events():
+    """Raw rental ledger events, newest first"""
+    events = reports.events(request.args.get('ip'), request.args.get('since', type=float),
+                            request.args.get('limit', 100, type=int))
+    return jsonify({"events": events}), 200
+
+@api.route('/export/<dataset>', methods=['GET'])
+def export(dataset):
+    """
+    Stream sessions, status history or ledger events as CSV or JSONL,
+    filtered by time range (epoch seconds or YYYY-MM-DD) and TV. Every row
+    has a cursor; pass the last one received as `after` to resume.
+    """
+    source = DATASETS.get(dataset)
+    if source is None:
+        return jsonify({"error": "Unknown dataset", "available_datasets": list(DATASETS)}), 404
+    fmt = request.args.get('format', 'jsonl')
+    if fmt not in ('csv', 'jsonl'):
+        return jsonify({"error": "Invalid format, use csv or jsonl"}), 400
+    try:
+        since = parse_time(request.args.get('since'))
+        until = parse_time(request.args.get('until'))
+        after = request.args.get('after')
+        after = decode_cursor(after) if after else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if after is not None and len(after) != len(source.key):
+        return jsonify({"error": "Invalid cursor"}), 400
+    chunk = min(max(request.args.get('chunk', EXPORT_CHUNK, type=int), 1), MAX_EXPORT_CHUNK)
+
+    batches = source.rows(store, since, until, request.args.get('ip'), after, chunk)
+    if fmt == 'csv':
+        body, mimetype = csv_chunks(batches, source.columns, header=after is None), 'text/csv'
+    else:
+        body, mimetype = jsonl_chunks(batches), 'application/x-ndjson'
+    return Response(body, mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={dataset}.{fmt}'})
+
+@api.route('/settings', methods=['GET'])
+def get_settings():
+    return jsonify(store.settings()), 200
+
+@api.route('/settings/<key>', methods=['PUT'])
+def put_setting(key):
+    """Change a setting, e.g. price_per_hour, which prices rentals from then on"""
+    value = (request.json or {}).get('value')
+    if key == 'price_per_hour' and (not isinstance(value, (int, float)) or value < 0):
+        return jsonify({"error": "Invalid price"}), 400
+    store.set_setting(key, value)
+    return jsonify({"message": "Setting saved", key: value}), 200
+
+@api.route('/stats', methods=['GET'])
+def get_stats():
+    """Get runtime statistics of the server"""
+    return jsonify({
+        "registry": registry.stats(),
+        "store": store.stats(),
+        "poller": poller.stats(),
+        "timers": timer_engine.stats(),
+        "commands": command_queue.stats(),
+        "breakers": breakers.stats(),
+        "jobs": jobs.stats(),
+        "feed": feed.stats(),
+        "adb_pool": adb.stats(),
+        "cec_client": cec.stats(),
+    }), 200
+
+def create_app(*blueprints):
+    """A Flask app serving the unified API plus the given compatibility routes"""
+    app = Flask(__name__)
+    app.config['JSON_SORT_KEYS'] = False
+    app.register_blueprint(api)
+    for blueprint in blueprints:
+        app.register_blueprint(blueprint)
+    return app
@@ -0,0 +1,49 @@
+import gzip
+import json
+
+from flask import Response, request
+
+# Bodies smaller than this are sent uncompressed even if the client accepts gzip
+GZIP_MIN_SIZE = 1024
+
+
+class Snapshot:
+    """
+    An immutable view of all devices at one feed version.
+
+    The JSON body is encoded once when the snapshot is built and gzipped at
+    most once, on first request, so serving the same version again costs
+    no serialization at all.
+    """
+
+    def __init__(self, version, devices):
+        self.version = version
+        self.etag = str(version)
+        self.devices = devices
+        self.body = json.dumps(devices, separators=(',', ':')).encode()
+        self.gzipped = None
+
+    def gzip_body(self):
+        if self.gzipped is None:
+            self.gzipped = gzip.compress(self.body, compresslevel=6)
+        return self.gzipped
+
+
+def snapshot_response(snapshot):
+    """
+    Serve a snapshot with ETag revalidation (304) and optional gzip. The
+    gzip and identity bodies differ, so each has its own strong ETag.
+    """
+    gzipped = len(snapshot.body) >= GZIP_MIN_SIZE and 'gzip' in request.accept_encodings
+    etag = f'{snapshot.etag}-gzip' if gzipped else snapshot.etag
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    elif gzipped:
+        response = Response(snapshot.gzip_body(), mimetype='application/json')
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = Response(snapshot.body, mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
@@ -0,0 +1,343 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import ledger
+from persistence import VOLATILE_FIELDS
+
+logger = logging.getLogger(__name__)
+
+DB_FILE = 'mosys.db'
+SCHEMA_VERSION = 4
+
+# JSON files imported into a new database, in order of precedence
+DEVICE_FILES = (('devices.json', None), ('tv_data.json', 'adb'), ('hdmi_cec_devices.json', 'cec'))
+TIMER_FILES = ('timers.json', 'adb_timers.json', 'hdmi_cec_timers.json')
+SETTINGS_FILE = 'mosys_settings.json'
+CUSTOM_TEXT_FILE = 'custom_text.json'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS devices (
+    ip TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    transport TEXT NOT NULL,
+    status TEXT,
+    status_changed_at REAL,
+    fields TEXT NOT NULL DEFAULT '{}'
+);
+CREATE INDEX IF NOT EXISTS devices_status ON devices (status);
+CREATE INDEX IF NOT EXISTS devices_transport ON devices (transport);
+
+CREATE TABLE IF NOT EXISTS settings (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS timers (
+    id TEXT PRIMARY KEY,
+    ip TEXT NOT NULL,
+    due_at REAL NOT NULL,
+    timer TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS timers_ip ON timers (ip);
+CREATE INDEX IF NOT EXISTS timers_due_at ON timers (due_at);
+
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    ip TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    action TEXT,
+    seconds REAL NOT NULL,
+    started_at REAL NOT NULL,
+    due_at REAL NOT NULL,
+    ended_at REAL,
+    end_reason TEXT
+);
+CREATE INDEX IF NOT EXISTS sessions_ip_started_at ON sessions (ip, started_at);
+CREATE INDEX IF NOT EXISTS sessions_started_at ON sessions (started_at);
+CREATE INDEX IF NOT EXISTS sessions_open ON sessions (ended_at) WHERE ended_at IS NULL;
+"""
+
+STATUS_HISTORY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS status_history (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    at REAL NOT NULL,
+    ip TEXT NOT NULL,
+    status TEXT NOT NULL,
+    previous TEXT
+);
+CREATE INDEX IF NOT EXISTS status_history_at ON status_history (at);
+CREATE INDEX IF NOT EXISTS status_history_ip_at ON status_history (ip, at);
+"""
+
+# Schema changes by the version they bring the database to
+# Version 4 has no schema change: it rebuilds the rollups without non-rental timers
+MIGRATIONS = {1: SCHEMA, 2: ledger.SCHEMA, 3: STATUS_HISTORY_SCHEMA, 4: ''}
+
+
+class Store:
+    """
+    Embedded SQLite database for devices, settings, timers and rental sessions.
+
+    The database runs in WAL mode, so readers (the GUI, reports) never wait
+    for the writer, and every change is a single-row statement instead of a
+    rewrite of a whole JSON file. Each thread gets its own connection. A
+    new database imports the JSON files of earlier versions once. Timer
+    changes are also appended to the rental ledger, in the same transaction.
+    """
+
+    def __init__(self, path=DB_FILE):
+        self.path = path
+        self.local = threading.local()
+        self.init_lock = threading.Lock()
+        self.initialized = False
+        self.stats_lock = threading.Lock()
+        self.writes = 0
+        self.errors = 0
+        self.last_write_ms = 0.0
+        self.max_write_ms = 0.0
+        self.total_write_ms = 0.0
+
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=10)
+        db.row_factory = sqlite3.Row
+        db.execute('PRAGMA journal_mode=WAL')
+        # With WAL a commit survives application crashes without an fsync per write
+        db.execute('PRAGMA synchronous=NORMAL')
+        return db
+
+    @property
+    def db(self):
+        db = getattr(self.local, 'db', None)
+        if db is None:
+            self._initialize()
+            db = self.local.db = self._connect()
+        return db
+
+    def _initialize(self):
+        with self.init_lock:
+            if self.initialized:
+                return
+            db = self._connect()
+            try:
+                version = db.execute('PRAGMA user_version').fetchone()[0]
+                for version in range(version + 1, SCHEMA_VERSION + 1):
+                    db.executescript(MIGRATIONS[version])
+                    with db:
+                        if version == 1:
+                            self._migrate_json(db)
+                        elif version == 2:
+                            ledger.backfill(db)
+                        elif version == 4:
+                            ledger.rebuild(db)
+                        db.execute(f'PRAGMA user_version={version}')
+                    logger.info(f"Upgraded {self.path} to schema version {version}")
+            finally:
+                db.close()
+            self.initialized = True
+
+    @contextmanager
+    def transaction(self):
+        """A write transaction, timed for stats()"""
+        started = time.perf_counter()
+        try:
+            with self.db as db:
+                yield db
+        except sqlite3.Error as e:
+            with self.stats_lock:
+                self.errors += 1
+            logger.error(f"Error writing {self.path}: {str(e)}")
+            raise
+        elapsed = (time.perf_counter() - started) * 1000
+        with self.stats_lock:
+            self.writes += 1
+            self.last_write_ms = elapsed
+            self.max_write_ms = max(self.max_write_ms, elapsed)
+            self.total_write_ms += elapsed
+
+    # -------------------- JSON migration ---------------------
+
+    def _migrate_json(self, db):
+        devices = {}
+        for path, transport in DEVICE_FILES:
+            for ip, info in (read_json(path) or {}).items():
+                if ip in devices:
+                    logger.warning(f"{ip} is in more than one device file, keeping the first entry")
+                    continue
+                devices[ip] = dict(info, transport=info.get('transport') or transport or 'adb')
+        for ip, device in devices.items():
+            db.execute(*device_row(ip, device))
+
+        timers = {}
+        for path in TIMER_FILES:
+            for timer in read_json(path) or []:
+                timers.setdefault(timer['id'], timer)
+        for timer in timers.values():
+            db.execute(*timer_row(timer))
+            db.execute(*session_row(timer))
+
+        settings = read_json(SETTINGS_FILE) or {}
+        custom_text = (read_json(CUSTOM_TEXT_FILE) or {}).get('custom_text')
+        if custom_text:
+            settings['custom_text'] = custom_text
+        for key, value in settings.items():
+            db.execute('INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)', (key, json.dumps(value)))
+
+        logger.info(f"Imported {len(devices)} devices, {len(timers)} timers and {len(settings)} settings "
+                    f"from JSON files")
+
+    # -------------------- Devices ---------------------
+
+    def devices(self):
+        """All devices with their persistent fields, keyed by IP"""
+        rows = self.db.execute('SELECT ip, name, transport, fields FROM devices').fetchall()
+        return {row['ip']: dict(json.loads(row['fields']), name=row['name'], transport=row['transport'])
+                for row in rows}
+
+    def devices_by_status(self, status):
+        return [row['ip'] for row in self.db.execute('SELECT ip FROM devices WHERE status = ?', (status,))]
+
+    def save_device(self, ip, device):
+        with self.transaction() as db:
+            db.execute(*device_row(ip, device))
+
+    def move_device(self, old_ip, new_ip, device):
+        """Save a device under a new IP; its row, and so its last status, moves along"""
+        with self.transaction() as db:
+            if new_ip != old_ip:
+                db.execute('UPDATE devices SET ip = ? WHERE ip = ?', (new_ip, old_ip))
+            db.execute(*device_row(new_ip, device))
+
+    def delete_device(self, ip):
+        with self.transaction() as db:
+            db.execute('DELETE FROM devices WHERE ip = ?', (ip,))
+
+    def update_status(self, ip, status):
+        """Record the last known status of a device, and the change in its history"""
+        now = time.time()
+        with self.transaction() as db:
+            # The registry starts every device at 'Checking', so compare with the stored status
+            db.execute('INSERT INTO status_history (at, ip, status, previous) '
+                       'SELECT ?, ip, ?, status FROM devices WHERE ip = ? AND status IS NOT ?',
+                       (now, status, ip, status))
+            db.execute('UPDATE devices SET status = ?, status_changed_at = ? WHERE ip = ? AND status IS NOT ?',
+                       (status, now, ip, status))
+
+    # -------------------- Settings ---------------------
+
+    def get_setting(self, key, default=None):
+        row = self.db.execute('SELECT value FROM settings WHERE key = ?', (key,)).fetchone()
+        return json.loads(row['value']) if row else default
+
+    def set_setting(self, key, value):
+        with self.transaction() as db:
+            db.execute('INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)', (key, json.dumps(value)))
+
+    def settings(self):
+        return {row['key']: json.loads(row['value']) for row in self.db.execute('SELECT key, value FROM settings')}
+
+    # -------------------- Timers and sessions ---------------------
+
+    def timers(self):
+        """Pending timers ordered by due time"""
+        return [json.loads(row['timer']) for row in self.db.execute('SELECT timer FROM timers ORDER BY due_at')]
+
+    def add_timer(self, timer):
+        """Store a new timer and open its rental session"""
+        with self.transaction() as db:
+            db.execute(*timer_row(timer))
+            db.execute(*session_row(timer))
+            ledger.record(db, ledger.START, timer, timer['seconds'], at=timer['created_at'])
+
+    def _save_timer(self, db, timer):
+        db.execute(*timer_row(timer))
+        db.execute('UPDATE sessions SET ip = ?, seconds = ?, due_at = ? WHERE id = ?',
+                   (timer['ip'], timer['seconds'], timer['due_at'], timer['id']))
+
+    def extend_timer(self, timer, seconds):
+        """Store a timer that was extended by `seconds`"""
+        with self.transaction() as db:
+            self._save_timer(db, timer)
+            ledger.record(db, ledger.EXTEND, timer, seconds)
+
+    def save_timers(self, timers):
+        """Store timers that moved to another IP, and their sessions"""
+        with self.transaction() as db:
+            for timer in timers:
+                self._save_timer(db, timer)
+
+    def end_timer(self, timer, reason, ended_at=None):
+        """Drop a fired or cancelled timer and close its session"""
+        ended_at = ended_at or time.time()
+        with self.transaction() as db:
+            db.execute('DELETE FROM timers WHERE id = ?', (timer['id'],))
+            db.execute('UPDATE sessions SET ended_at = ?, end_reason = ? WHERE id = ? AND ended_at IS NULL',
+                       (ended_at, reason, timer['id']))
+            ledger.record(db, ledger.EXPIRE if reason == 'expired' else ledger.CANCEL, timer, at=ended_at)
+
+    def sessions(self, ip=None, since=None, until=None, limit=100):
+        """Rental sessions, newest first"""
+        query, params = 'SELECT * FROM sessions WHERE 1 = 1', []
+        if ip is not None:
+            query += ' AND ip = ?'
+            params.append(ip)
+        if since is not None:
+            query += ' AND started_at >= ?'
+            params.append(since)
+        if until is not None:
+            query += ' AND started_at < ?'
+            params.append(until)
+        query += ' ORDER BY started_at DESC LIMIT ?'
+        params.append(limit)
+        return [dict(row) for row in self.db.execute(query, params)]
+
+    def stats(self):
+        counts = {table: self.db.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+                  for table in ('devices', 'settings', 'timers', 'sessions', 'rental_events', 'status_history')}
+        with self.stats_lock:
+            return {
+                'path': self.path,
+                'size': os.path.getsize(self.path) if os.path.exists(self.path) else 0,
+                'rows': counts,
+                'writes': self.writes,
+                'errors': self.errors,
+                'last_write_ms': round(self.last_write_ms, 2),
+                'max_write_ms': round(self.max_write_ms, 2),
+                'avg_write_ms': round(self.total_write_ms / self.writes, 2) if self.writes else 0.0,
+            }
+
+
+def read_json(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except json.JSONDecodeError:
+        logger.error(f"Error decoding JSON from {path}, not importing it")
+        return None
+
+def device_row(ip, device):
+    fields = {field: value for field, value in device.items()
+              if field not in ('name', 'transport') and field not in VOLATILE_FIELDS}
+    return ('INSERT INTO devices (ip, name, transport, fields) VALUES (?, ?, ?, ?) '
+            'ON CONFLICT (ip) DO UPDATE SET name = excluded.name, transport = excluded.transport, '
+            'fields = excluded.fields',
+            (ip, device['name'], device['transport'], json.dumps(fields)))
+
+def timer_row(timer):
+    return ('INSERT OR REPLACE INTO timers (id, ip, due_at, timer) VALUES (?, ?, ?, ?)',
+            (timer['id'], timer['ip'], timer['due_at'], json.dumps(timer)))
+
+def session_row(timer):
+    return ('INSERT OR IGNORE INTO sessions (id, ip, kind, action, seconds, started_at, due_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (timer['id'], timer['ip'], timer.get('kind', 'action'), timer.get('action'), timer['seconds'],
+             timer['created_at'], timer['due_at']))
+
+
+store = Store()
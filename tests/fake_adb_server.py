@@ -0,0 +1,126 @@
+"""
+A local stand-in for the adb server, for testing AdbClient without adb.
+
+It speaks the smart-socket protocol: host:connect, host-serial:<serial>:
+get-state, host:transport:<serial>, then shell: or sync: (SEND, DATA, DONE,
+QUIT). Every service request is recorded in `requests` as (serial, service)
+and every pushed file is kept in `files`.
+"""
+import socketserver
+import struct
+import threading
+
+
+class FakeAdbServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, devices=('192.168.1.10:5555',), shell=None, push_error=None):
+        super().__init__(('127.0.0.1', 0), FakeAdbHandler)
+        self.devices = set(devices)
+        # shell(serial, command) -> output
+        self.shell = shell or (lambda serial, command: f"{command}\n")
+        self.push_error = push_error
+        self.lock = threading.Lock()
+        self.requests = []
+        # (serial, path) -> {'data', 'mode', 'mtime'}
+        self.files = {}
+        self.thread = None
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def record(self, serial, service):
+        with self.lock:
+            self.requests.append((serial, service))
+
+
+class FakeAdbHandler(socketserver.BaseRequestHandler):
+    def recv_exactly(self, size):
+        data = b''
+        while len(data) < size:
+            chunk = self.request.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("client closed the connection")
+            data += chunk
+        return data
+
+    def read_service(self):
+        length = int(self.recv_exactly(4), 16)
+        return self.recv_exactly(length).decode()
+
+    def okay(self, reply=None):
+        self.request.sendall(b'OKAY')
+        if reply is not None:
+            self.request.sendall(b'%04x' % len(reply.encode()) + reply.encode())
+
+    def fail(self, message):
+        self.request.sendall(b'FAIL' + b'%04x' % len(message.encode()) + message.encode())
+
+    def handle(self):
+        server = self.server
+        serial = None
+        try:
+            while True:
+                service = self.read_service()
+                server.record(serial, service)
+                if service.startswith('host:connect:'):
+                    target = service.split(':', 2)[2]
+                    server.devices.add(target)
+                    return self.okay(f"connected to {target}")
+                if service.startswith('host-serial:') and service.endswith(':get-state'):
+                    target = service[len('host-serial:'):-len(':get-state')]
+                    if target not in server.devices:
+                        return self.fail(f"device '{target}' not found")
+                    return self.okay('device')
+                if service.startswith('host:transport:'):
+                    serial = service.split(':', 2)[2]
+                    if serial not in server.devices:
+                        return self.fail(f"device '{serial}' not found")
+                    self.okay()
+                    continue
+                if serial is not None and service.startswith('shell:'):
+                    self.okay()
+                    return self.request.sendall(server.shell(serial, service[len('shell:'):]).encode())
+                if serial is not None and service == 'sync:':
+                    self.okay()
+                    return self.sync(serial)
+                return self.fail(f"unknown service {service}")
+        except ConnectionError:
+            pass
+
+    def sync(self, serial):
+        server = self.server
+        path, mode, data = None, None, b''
+        while True:
+            request_id = self.recv_exactly(4)
+            length = struct.unpack('<I', self.recv_exactly(4))[0]
+            if request_id == b'SEND':
+                path, _, mode = self.recv_exactly(length).decode().rpartition(',')
+                server.record(serial, f"SEND {path},{mode}")
+            elif request_id == b'DATA':
+                data += self.recv_exactly(length)
+            elif request_id == b'DONE':
+                server.record(serial, f"DONE {len(data)}")
+                if server.push_error:
+                    message = server.push_error.encode()
+                    self.request.sendall(b'FAIL' + struct.pack('<I', len(message)) + message)
+                    continue
+                with server.lock:
+                    server.files[(serial, path)] = {'data': data, 'mode': int(mode), 'mtime': length}
+                self.request.sendall(b'OKAY' + struct.pack('<I', 0))
+            elif request_id == b'QUIT':
+                server.record(serial, 'QUIT')
+                return
+            else:
+                raise ConnectionError(f"unexpected sync request {request_id!r}")
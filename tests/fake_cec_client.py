@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+A stand-in for cec-client for testing CecClient without a CEC adapter.
+
+Reads 'tx <frame>' lines from stdin and echoes each frame as cec-client
+does with traffic logging, '<< frame', in order. Like cec-client, it only
+transmits well-formed frames, a header byte and an opcode, '10:36'; anything
+else is dropped without an echo. Behaviour is set through environment
+variables:
+
+  FAKE_CEC_SLOW_FRAME, FAKE_CEC_SLOW_SECONDS  echo this frame only after a delay
+  FAKE_CEC_FAIL_FRAME                         answer this frame with an ERROR line
+  FAKE_CEC_EXIT_FRAME                         exit, without echoing, on this frame
+  FAKE_CEC_ANNOUNCE                           a frame echoed at startup, unasked
+  FAKE_CEC_SILENT                             never echo, as with no TV on the bus
+"""
+import os
+import re
+import sys
+import time
+
+FRAME = re.compile(r'^[0-9a-f]{2}(:[0-9a-f]{2})+$', re.IGNORECASE)
+
+
+def main():
+    slow_frame = os.environ.get('FAKE_CEC_SLOW_FRAME')
+    slow_seconds = float(os.environ.get('FAKE_CEC_SLOW_SECONDS', '1'))
+    fail_frame = os.environ.get('FAKE_CEC_FAIL_FRAME')
+    exit_frame = os.environ.get('FAKE_CEC_EXIT_FRAME')
+    silent = bool(os.environ.get('FAKE_CEC_SILENT'))
+    print("opening a connection to the CEC adapter...", flush=True)
+    if os.environ.get('FAKE_CEC_ANNOUNCE'):
+        print(f"TRAFFIC: [     1]\t<< {os.environ['FAKE_CEC_ANNOUNCE']}", flush=True)
+    for line in sys.stdin:
+        line = line.strip()
+        if line == 'q':
+            break
+        if not line.startswith('tx '):
+            continue
+        frame = line[3:]
+        if frame == exit_frame:
+            sys.exit(3)
+        if frame == fail_frame:
+            print(f"ERROR:   [     2]\tcould not transmit {frame}", flush=True)
+            continue
+        if silent or not FRAME.match(frame):
+            continue
+        if frame == slow_frame:
+            time.sleep(slow_seconds)
+        print(f"TRAFFIC: [     2]\t<< {frame.upper()}", flush=True)
+
+
+if __name__ == '__main__':
+    main()
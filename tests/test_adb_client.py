@@ -0,0 +1,87 @@
+import os
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from adb_client import AdbClient, AdbError, SYNC_DATA_MAX
+from fake_adb_server import FakeAdbServer
+
+SERIAL = '192.168.1.10:5555'
+
+
+class AdbClientTest(unittest.TestCase):
+    """AdbClient against tests/fake_adb_server.py"""
+
+    def server(self, **kwargs):
+        server = FakeAdbServer(**kwargs).start()
+        self.addCleanup(server.stop)
+        return server
+
+    def test_shell(self):
+        server = self.server(shell=lambda serial, command: f"{serial} ran {command}\n")
+        output = AdbClient(port=server.port).shell(SERIAL, 'input keyevent 26')
+        self.assertEqual(output, f"{SERIAL} ran input keyevent 26\n")
+        self.assertEqual(server.requests, [(None, f'host:transport:{SERIAL}'),
+                                           (SERIAL, 'shell:input keyevent 26')])
+
+    def test_unknown_device(self):
+        server = self.server()
+        with self.assertRaisesRegex(AdbError, "not found"):
+            AdbClient(port=server.port).shell('10.0.0.99:5555', 'echo')
+        self.assertEqual(server.requests, [(None, 'host:transport:10.0.0.99:5555')])
+
+    def test_connect_and_state(self):
+        server = self.server(devices=())
+        client = AdbClient(port=server.port)
+        self.assertIn('connected to', client.connect_device(SERIAL))
+        self.assertEqual(client.get_state(SERIAL), 'device')
+        self.assertEqual(server.requests, [(None, f'host:connect:{SERIAL}'),
+                                           (None, f'host-serial:{SERIAL}:get-state')])
+
+    def test_push(self):
+        server = self.server()
+        data = os.urandom(SYNC_DATA_MAX * 2 + 123)
+        with tempfile.NamedTemporaryFile(delete=False) as f:
+            f.write(data)
+        self.addCleanup(os.unlink, f.name)
+        os.utime(f.name, (1700000000, 1700000000))
+
+        AdbClient(port=server.port).push(SERIAL, f.name, '/sdcard/Movies/clip.mp4')
+        # The client does not wait for the server to read its QUIT
+        for _ in range(100):
+            if server.requests[-1] == (SERIAL, 'QUIT'):
+                break
+            time.sleep(0.01)
+        pushed = server.files[(SERIAL, '/sdcard/Movies/clip.mp4')]
+        self.assertEqual(pushed['data'], data)
+        self.assertEqual(pushed['mode'], 0o100644)
+        self.assertEqual(pushed['mtime'], 1700000000)
+        self.assertEqual(server.requests, [
+            (None, f'host:transport:{SERIAL}'),
+            (SERIAL, 'sync:'),
+            (SERIAL, f'SEND /sdcard/Movies/clip.mp4,{0o100644}'),
+            (SERIAL, f'DONE {len(data)}'),
+            (SERIAL, 'QUIT'),
+        ])
+
+    def test_push_failure(self):
+        server = self.server(push_error="read-only file system")
+        with tempfile.NamedTemporaryFile() as f:
+            f.write(b'x')
+            f.flush()
+            with self.assertRaisesRegex(AdbError, "read-only file system"):
+                AdbClient(port=server.port).push(SERIAL, f.name, '/system/x')
+
+    def test_server_down(self):
+        server = self.server()
+        port = server.port
+        server.stop()
+        with self.assertRaisesRegex(AdbError, "Cannot reach adb server"):
+            AdbClient(port=port, timeout=1).shell(SERIAL, 'echo')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import os
+import sys
+import time
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cec_client import ABANDON_GRACE, CecClient
+from transports import cec_commands
+
+FAKE_CEC_CLIENT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fake_cec_client.py')
+
+
+class CecClientTest(unittest.TestCase):
+    """CecClient against tests/fake_cec_client.py"""
+
+    def client(self, abandon_grace=ABANDON_GRACE, **env):
+        patcher = mock.patch.dict(os.environ, env)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        client = CecClient(path=sys.executable, args=(FAKE_CEC_CLIENT,), abandon_grace=abandon_grace)
+        self.addCleanup(client.stop)
+        return client
+
+    def test_ack(self):
+        client = self.client(FAKE_CEC_ANNOUNCE='0f:87:00:00:00')
+        self.assertTrue(client.send('10:04', timeout=5))
+        self.assertTrue(client.send('10:44:41', timeout=5, repeat=2))
+        stats = client.stats()
+        self.assertEqual(stats['acked'], 3)
+        self.assertEqual(stats['pending'], 0)
+        self.assertEqual(stats['unmatched'], 1)
+
+    def test_late_ack_is_not_given_to_the_next_command(self):
+        client = self.client(FAKE_CEC_SLOW_FRAME='10:36', FAKE_CEC_SLOW_SECONDS='1')
+        self.assertFalse(client.send('10:36', timeout=0.2))
+        # The late echo of the first frame arrives after ~1 s and must not acknowledge this one
+        self.assertFalse(client.send('10:36', timeout=1.5))
+        time.sleep(1)
+        stats = client.stats()
+        self.assertEqual(stats['timeouts'], 2)
+        self.assertEqual(stats['late'], 2)
+        self.assertEqual(stats['acked'], 0)
+
+    def test_late_ack_then_other_frame(self):
+        client = self.client(FAKE_CEC_SLOW_FRAME='10:36', FAKE_CEC_SLOW_SECONDS='0.5')
+        self.assertFalse(client.send('10:36', timeout=0.1))
+        self.assertTrue(client.send('10:04', timeout=5))
+        stats = client.stats()
+        self.assertEqual((stats['acked'], stats['late'], stats['pending']), (1, 1, 0))
+
+    def test_error_fails_the_command(self):
+        client = self.client(FAKE_CEC_FAIL_FRAME='10:36')
+        started = time.monotonic()
+        self.assertFalse(client.send('10:36', timeout=5))
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertTrue(client.send('10:04', timeout=5))
+        self.assertEqual(client.stats()['failed'], 1)
+
+    def test_restart_after_exit(self):
+        client = self.client(FAKE_CEC_EXIT_FRAME='10:36')
+        self.assertFalse(client.send('10:36', timeout=5))
+        for _ in range(100):
+            if not client.alive():
+                break
+            time.sleep(0.01)
+        self.assertTrue(client.send('10:04', timeout=5))
+        stats = client.stats()
+        self.assertEqual(stats['restarts'], 1)
+        self.assertEqual(stats['acked'], 1)
+
+    def test_transport_frames_are_acknowledged(self):
+        client = self.client()
+        for action, frames in cec_commands.items():
+            with self.subTest(action=action):
+                self.assertTrue(all(frame.startswith('1') for frame in frames))
+                self.assertTrue(client.send_frames(frames, timeout=5))
+
+    def test_opcode_only_frame_is_never_acknowledged(self):
+        client = self.client(abandon_grace=0.2)
+        self.assertFalse(client.send('0x36', timeout=0.2))
+        time.sleep(0.3)
+        self.assertEqual(client.stats()['pending'], 0)
+
+    def test_pending_stays_bounded_without_echoes(self):
+        client = self.client(abandon_grace=0.3, FAKE_CEC_SILENT='1')
+        for _ in range(20):
+            self.assertFalse(client.send_frames(cec_commands['volume_up'], timeout=0.05))
+            self.assertLessEqual(client.stats()['pending'], 20)
+        time.sleep(0.4)
+        stats = client.stats()
+        self.assertEqual(stats['pending'], 0)
+        self.assertEqual(stats['timeouts'], 40)
+        self.assertEqual(stats['acked'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import json
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from change_feed import ChangeFeed
+
+
+class ChangeFeedTest(unittest.TestCase):
+
+    def setUp(self):
+        self.feed = ChangeFeed(unversioned=('response_time',))
+        self.feed.publish('10.0.0.2', {'status': 'online', 'transport': 'adb', 'response_time': 12})
+        self.since = self.feed.version
+
+    def test_unversioned_update_is_stored_without_a_new_version(self):
+        before = self.feed.snapshot()
+        self.assertFalse(self.feed.publish('10.0.0.2', {'status': 'online', 'transport': 'adb', 'response_time': 40}))
+        self.assertEqual(self.feed.version, self.since)
+        self.assertEqual(self.feed.changes(self.since), (self.since, {}, False))
+
+        after = self.feed.snapshot()
+        self.assertEqual(after.etag, before.etag)
+        self.assertEqual(json.loads(after.body)['10.0.0.2']['response_time'], 40)
+        self.assertEqual(self.feed.snapshot({'transport': 'adb'}).devices['10.0.0.2']['response_time'], 40)
+
+    def test_unversioned_update_goes_out_with_the_next_change(self):
+        self.feed.publish('10.0.0.2', {'status': 'online', 'transport': 'adb', 'response_time': 40})
+        self.assertTrue(self.feed.publish('10.0.0.2', {'status': 'offline', 'transport': 'adb', 'response_time': 40}))
+        version, changes, reset = self.feed.changes(self.since)
+        self.assertEqual(version, self.since + 1)
+        self.assertFalse(reset)
+        self.assertEqual(changes['10.0.0.2'], {'status': 'offline', 'transport': 'adb', 'response_time': 40})
+
+    def test_identical_publish_does_not_rebuild_the_snapshot(self):
+        self.feed.snapshot()
+        built = self.feed.snapshots
+        self.feed.publish('10.0.0.2', {'status': 'online', 'transport': 'adb', 'response_time': 12})
+        self.feed.snapshot()
+        self.assertEqual(self.feed.snapshots, built)
+
+
+if __name__ == '__main__':
+    unittest.main()
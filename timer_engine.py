@@ -0,0 +1,197 @@
+import heapq
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+class TimerEngine:
+    """
+    Runs all rental timers from a single thread.
+
+    Pending timers are kept in a heap ordered by due time and written to the
+    store on every change, one row per timer, so they survive a restart.
+    Each timer is also a rental session in the store, closed when the timer
+    fires or is cancelled, and every start, extension and end is appended to
+    the rental ledger. Timers that became due while the server was down
+    fire as soon as it starts again. Expired timers are handed to `handler`
+    on a small worker pool so a slow TV does not delay the others.
+    `on_change(ip)` is called whenever the timers of a device change.
+    """
+
+    def __init__(self, handler, store, max_workers=4, name='timers', on_change=None):
+        self.handler = handler
+        self.store = store
+        self.on_change = on_change
+        self.max_workers = max_workers
+        self.name = name
+        self.timers = {}
+        self.heap = []
+        self.cond = threading.Condition()
+        self.executor = None
+        self.thread = None
+        self.running = False
+        self.fired = 0
+        self.cancelled = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.total_lag = 0.0
+
+    def start(self):
+        with self.cond:
+            if self.running:
+                return
+            self._load()
+            self.running = True
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=self.name)
+        self.thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self.thread.start()
+        logger.info(f"Started {self.name} with {len(self.timers)} pending timers")
+
+    def stop(self):
+        with self.cond:
+            if not self.running:
+                return
+            self.running = False
+            self.cond.notify_all()
+        self.thread.join()
+        self.executor.shutdown(wait=True)
+
+    def _load(self):
+        for timer in self.store.timers():
+            self.timers[timer['id']] = timer
+            heapq.heappush(self.heap, (timer['due_at'], timer['id']))
+
+    def _persist(self, write, *args):
+        # The in-memory timers stay authoritative if the store cannot be written
+        try:
+            write(*args)
+        except Exception as e:
+            logger.error(f"{self.name}: error saving timers: {str(e)}")
+
+    def schedule(self, ip, action, seconds, kind='action', **extra):
+        """Schedule `action` on `ip` in `seconds` and return the timer"""
+        now = time.time()
+        timer = dict(extra, id=uuid.uuid4().hex[:12], ip=ip, action=action, kind=kind,
+                     seconds=seconds, created_at=now, due_at=now + seconds)
+        with self.cond:
+            self.timers[timer['id']] = timer
+            heapq.heappush(self.heap, (timer['due_at'], timer['id']))
+            self._persist(self.store.add_timer, timer)
+            self.cond.notify()
+        self._changed(ip)
+        logger.info(f"Timer {timer['id']} set for {ip}: {action or kind} in {seconds} seconds")
+        return dict(timer)
+
+    def cancel(self, timer_id):
+        """Cancel a pending timer; returns it, or None if it is unknown"""
+        with self.cond:
+            timer = self.timers.pop(timer_id, None)
+            if timer is None:
+                return None
+            self.cancelled += 1
+            self._persist(self.store.end_timer, timer, 'cancelled')
+            self.cond.notify()
+        self._changed(timer['ip'])
+        logger.info(f"Timer {timer_id} for {timer['ip']} cancelled")
+        return timer
+
+    def cancel_device(self, ip):
+        """Cancel every pending timer of a device that was removed"""
+        with self.cond:
+            ids = [timer_id for timer_id, timer in self.timers.items() if timer['ip'] == ip]
+        return [self.cancel(timer_id) for timer_id in ids]
+
+    def extend(self, timer_id, seconds):
+        """Move a pending timer `seconds` later; returns it, or None if it is unknown"""
+        with self.cond:
+            timer = self.timers.get(timer_id)
+            if timer is None:
+                return None
+            timer['due_at'] += seconds
+            timer['seconds'] += seconds
+            heapq.heappush(self.heap, (timer['due_at'], timer_id))
+            self._persist(self.store.extend_timer, timer, seconds)
+            self.cond.notify()
+        self._changed(timer['ip'])
+        logger.info(f"Timer {timer_id} for {timer['ip']} extended by {seconds} seconds")
+        return dict(timer)
+
+    def reassign(self, old_ip, new_ip):
+        """Point the timers of a device at its new IP"""
+        with self.cond:
+            moved = [timer for timer in self.timers.values() if timer['ip'] == old_ip]
+            for timer in moved:
+                timer['ip'] = new_ip
+            if moved:
+                self._persist(self.store.save_timers, moved)
+        if moved:
+            self._changed(new_ip)
+
+    def _changed(self, ip):
+        # Called outside the lock: listeners read the timers back through due()
+        if self.on_change is not None:
+            self.on_change(ip)
+
+    def due(self, ip):
+        """Due time of the earliest pending timer of a device, or None"""
+        with self.cond:
+            return min((timer['due_at'] for timer in self.timers.values() if timer['ip'] == ip), default=None)
+
+    def get(self, timer_id):
+        with self.cond:
+            timer = self.timers.get(timer_id)
+            return dict(timer) if timer else None
+
+    def list(self, ip=None):
+        """Pending timers ordered by due time, with the seconds remaining"""
+        now = time.time()
+        with self.cond:
+            timers = [dict(timer, remaining=max(0.0, timer['due_at'] - now))
+                      for timer in self.timers.values() if ip is None or timer['ip'] == ip]
+        return sorted(timers, key=lambda timer: timer['due_at'])
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while self.running:
+                    # Entries whose due time no longer matches were cancelled or extended
+                    while self.heap and self.timers.get(self.heap[0][1], {}).get('due_at') != self.heap[0][0]:
+                        heapq.heappop(self.heap)
+                    if self.heap and self.heap[0][0] <= time.time():
+                        break
+                    self.cond.wait(self.heap[0][0] - time.time() if self.heap else None)
+                if not self.running:
+                    return
+                _, timer_id = heapq.heappop(self.heap)
+                timer = self.timers.pop(timer_id)
+                lag = time.time() - timer['due_at']
+                self.fired += 1
+                self.last_lag = lag
+                self.max_lag = max(self.max_lag, lag)
+                self.total_lag += lag
+                self._persist(self.store.end_timer, timer, 'expired')
+            self._changed(timer['ip'])
+            self.executor.submit(self._fire, timer, lag)
+
+    def _fire(self, timer, lag):
+        logger.info(f"Timer {timer['id']} fired for {timer['ip']} ({lag * 1000:.0f} ms late)")
+        try:
+            self.handler(timer)
+        except Exception as e:
+            logger.error(f"{self.name}: error firing timer {timer['id']}: {str(e)}")
+
+    def stats(self):
+        with self.cond:
+            return {
+                'running': self.running,
+                'pending': len(self.timers),
+                'fired': self.fired,
+                'cancelled': self.cancelled,
+                'last_lag_ms': round(self.last_lag * 1000, 1),
+                'max_lag_ms': round(self.max_lag * 1000, 1),
+                'avg_lag_ms': round(self.total_lag / self.fired * 1000, 1) if self.fired else 0.0,
+            }
@@ -0,0 +1,251 @@
+import base64
+import logging
+import shlex
+import socket
+import time
+
+import ping3
+
+from adb_pool import pool as adb_pool, adb_serial, AdbCommandError, AdbSessionError
+from cec_client import client as cec_client
+
+logger = logging.getLogger(__name__)
+
+# ADB actions and the shell commands that perform them
+command_map = {
+    'off': "input keyevent KEYCODE_POWER",
+    'sleep': "input keyevent KEYCODE_SLEEP",
+    'volume_up': "input keyevent KEYCODE_VOLUME_UP",
+    'volume_down': "input keyevent KEYCODE_VOLUME_DOWN",
+    'home': "input keyevent KEYCODE_HOME"  # Added home command
+}
+
+# CEC frames as cec-client's 'tx' command takes them: a header byte with the
+# source and destination logical addresses, then the opcode and its operands
+CEC_SOURCE = 0x1       # Recording 1, the logical address cec-client takes by default
+CEC_TV = 0x0
+CEC_BROADCAST = 0xF
+USER_CONTROL_PRESSED = 0x44
+USER_CONTROL_RELEASED = 0x45
+
+def cec_frame(destination, opcode, *operands):
+    """'10:36' for Standby to the TV"""
+    return ':'.join([f'{CEC_SOURCE:x}{destination:x}'] + [f'{byte:02x}' for byte in (opcode, *operands)])
+
+def cec_key(code):
+    """A remote-control key: pressed, then released"""
+    return (cec_frame(CEC_TV, USER_CONTROL_PRESSED, code), cec_frame(CEC_TV, USER_CONTROL_RELEASED))
+
+# CEC actions and the frames that perform them (based on the CEC specification)
+cec_commands = {
+    'power_on': (cec_frame(CEC_TV, 0x04),),                     # Image View On
+    'power_off': (cec_frame(CEC_TV, 0x36),),                    # Standby
+    'volume_up': cec_key(0x41),                                 # Volume Up
+    'volume_down': cec_key(0x42),                               # Volume Down
+    'mute': cec_key(0x43),                                      # Mute
+    'input_hdmi1': (cec_frame(CEC_BROADCAST, 0x82, 0x10, 0x00),),  # Active Source at 1.0.0.0 (HDMI 1)
+    'input_hdmi2': (cec_frame(CEC_BROADCAST, 0x82, 0x20, 0x00),),  # Active Source at 2.0.0.0 (HDMI 2)
+    'input_hdmi3': (cec_frame(CEC_BROADCAST, 0x82, 0x30, 0x00),),  # Active Source at 3.0.0.0 (HDMI 3)
+    'menu': cec_key(0x09),                                      # Root Menu
+    'up': cec_key(0x01),                                        # Up
+    'down': cec_key(0x02),                                      # Down
+    'left': cec_key(0x03),                                      # Left
+    'right': cec_key(0x04),                                     # Right
+    'select': cec_key(0x00),                                    # Select
+    'back': cec_key(0x0D),                                      # Exit
+    'home': cec_key(0x09),                                      # Root Menu; CEC has no Home key
+    'play': cec_key(0x44),                                      # Play
+    'pause': cec_key(0x46),                                     # Pause
+    'stop': cec_key(0x45),                                      # Stop
+    'forward': cec_key(0x49),                                   # Fast forward
+    'rewind': cec_key(0x48),                                    # Rewind
+}
+
+
+def countdown_command(seconds, custom_text):
+    encoded_text = base64.b64encode(custom_text.encode()).decode()
+    return f'am start -n com.mosys.billing/.MainActivity --ei seconds {seconds} --es customText {shlex.quote(encoded_text)}'
+
+
+class AdbTransport:
+    """
+    Android TVs controlled over ADB.
+
+    `on_result(ip, ok)` is told whether the TV answered each command, which
+    feeds the circuit breakers; a command that fails on a TV that answered
+    still counts as the TV being reachable.
+    """
+
+    name = 'adb'
+    # 'on' cannot be sent over ADB but is accepted for symmetry with CEC
+    actions = list(command_map) + ['on']
+    # Repeated presses of these keys are merged into one 'input keyevent K K K'
+    coalesce = ('volume_up', 'volume_down', 'home')
+    priority = ('off', 'sleep')
+
+    def __init__(self, on_result=None):
+        self.on_result = on_result
+
+    def _report(self, ip, ok):
+        if self.on_result is not None:
+            self.on_result(ip, ok)
+
+    def probe(self, ip):
+        try:
+            response_time = ping3.ping(ip, unit='ms')
+        except Exception as e:
+            logger.error(f"Error checking status for {ip}: {str(e)}")
+            return {'status': 'Error', 'response_time': 'N/A'}
+        if response_time is None or response_time is False:
+            return {'status': 'Offline', 'response_time': 'N/A'}
+        return {'status': 'Online', 'response_time': f"{response_time:.2f} ms"}
+
+    def run(self, ip, command, timeout=30):
+        """Run a shell command on the TV; returns its output, or None on failure"""
+        serial = adb_serial(ip)
+        logger.debug(f"ADB command on {serial}: {command}")
+        try:
+            output = adb_pool.run(serial, command, timeout=timeout)
+            logger.debug(f"ADB command output: {output}")
+            self._report(ip, True)
+            return output
+        except AdbCommandError as e:
+            # The TV answered, only the command failed
+            logger.error(f"ADB command failed: {e}")
+            logger.error(f"Error output: {e.output}")
+            self._report(ip, True)
+            return None
+        except AdbSessionError as e:
+            logger.error(f"ADB session error: {e}")
+            self._report(ip, False)
+            return None
+        except Exception as e:
+            logger.error(f"Unexpected error in run_adb_command: {str(e)}")
+            self._report(ip, False)
+            return None
+
+    def key_command(self, action, count=1):
+        """The shell command for `action`, with the key repeated `count` times"""
+        command = command_map[action]
+        prefix = 'input keyevent '
+        if count > 1 and command.startswith(prefix):
+            command = prefix + ' '.join([command[len(prefix):]] * count)
+        return command
+
+    def send(self, ip, action, count=1):
+        if action == 'on':
+            logger.warning("'On' action may not work via ADB")
+            return True
+        return self.run(ip, self.key_command(action, count)) is not None
+
+    def push(self, ip, local_path, remote_path):
+        adb_pool.push(adb_serial(ip), local_path, remote_path)
+
+    def forget(self, ip):
+        """Drop the pooled connection of a TV that was removed or moved"""
+        adb_pool.discard(adb_serial(ip))
+
+    def stats(self):
+        return adb_pool.stats()
+
+
+class CecTransport:
+    """TVs controlled over HDMI-CEC through the local cec-client"""
+
+    name = 'cec'
+    actions = list(cec_commands)
+    # Queued runs of these are sent as one burst of frames
+    coalesce = ('volume_up', 'volume_down', 'up', 'down', 'left', 'right')
+    priority = ('power_on', 'power_off')
+
+    def probe(self, ip):
+        """
+        Check if a device is online and get its status
+        """
+        try:
+            # Check if device is reachable
+            response_time = self.ping(ip)
+            if response_time is None:
+                return {'status': 'Offline', 'response_time': 'N/A'}
+
+            status = {'status': 'Online', 'response_time': f"{response_time:.2f} ms"}
+            # Try to get additional info via HDMI-CEC
+            try:
+                power_status = self.get_power_status(ip)
+                if power_status:
+                    status['power_status'] = power_status
+            except Exception as e:
+                logger.error(f"Error getting power status for {ip}: {str(e)}")
+            return status
+        except Exception as e:
+            logger.error(f"Error checking status for {ip}: {str(e)}")
+            return {'status': 'Error', 'response_time': 'N/A'}
+
+    def ping(self, ip):
+        """
+        Ping a device to check if it's online and get response time
+        """
+        try:
+            # Create socket connection to check if device is reachable
+            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            s.settimeout(1)
+
+            # Try standard HDMI-CEC port or fallback to HTTP port for web interface
+            start_time = time.time()
+            result = s.connect_ex((ip, 9740))  # 9740 is often used for HDMI-CEC over IP
+            if result != 0:
+                # Try HTTP port as fallback
+                result = s.connect_ex((ip, 80))
+            end_time = time.time()
+
+            s.close()
+
+            if result == 0:
+                return (end_time - start_time) * 1000  # Return in milliseconds
+            return None
+        except Exception as e:
+            logger.error(f"Error pinging {ip}: {str(e)}")
+            return None
+
+    def get_power_status(self, ip):
+        """
+        Get the power status of a device via HDMI-CEC
+        """
+        # This would typically involve sending a CEC query to the device;
+        # in a real implementation, return "On" or "Off"
+        return "Unknown"
+
+    def send(self, ip, command, count=1):
+        """
+        Send a CEC command to a device, `count` times in a row
+        """
+        if command not in cec_commands:
+            logger.error(f"Unknown CEC command: {command}")
+            return False
+
+        frames = cec_commands[command]
+
+        try:
+            logger.info(f"Sending CEC command {command} ({' '.join(frames)}) to {ip}")
+
+            # Commands go to a long-lived cec-client through its stdin queue
+            if cec_client.available():
+                result = cec_client.send_frames(frames * count, timeout=5)
+                if not result:
+                    logger.error(f"CEC command {command} was not transmitted")
+                return result
+            else:
+                # We would connect to the CEC bridge on the TV's IP
+                # This is a placeholder for actual implementation
+                logger.warning("No CEC client found, this is a simulation")
+                return True  # Simulate success
+
+        except Exception as e:
+            logger.error(f"Error sending CEC command to {ip}: {str(e)}")
+            return False
+
+    def forget(self, ip):
+        pass
+
+    def stats(self):
+        return cec_client.stats()